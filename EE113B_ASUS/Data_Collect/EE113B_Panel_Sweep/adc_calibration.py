@@ -0,0 +1,232 @@
+# ADC sensor calibration.
+#
+# The C2000 firmware converts the raw 12-bit ADC codes with hard-coded
+# constants (see PV_Buck_Code/MPPT/sensing_v1_4_16.c):
+#
+#   adc_vout = raw / 4095 * 3.0 * 11
+#   adc_iout = raw * 0.0059 - 10.0928
+#
+# Any error in these biases the P&O power comparisons. This tool steps the
+# bench through a grid of input voltages (PSU) and output currents (eload
+# in CC mode, 4-wire sense), reads the EL34243A as the reference alongside
+# the raw codes streamed by the board, fits gain/offset (optionally with a
+# quadratic term) by least squares, and prints the C lines to paste into
+# the firmware.
+#
+# The raw codes come from the board's telemetry frames (adc_raw_vout,
+# adc_raw_iout), received with telemetry.telemetry_receiver.
+#
+# Usage:
+#   python adc_calibration.py --port COM5
+#   python adc_calibration.py --port /dev/ttyUSB0 --degree 2 --save cal.csv
+#   python adc_calibration.py --load cal.csv      (refit saved bench data)
+
+import sys
+import signal
+import argparse
+from time import sleep, time
+import numpy as np
+import pandas as pd
+##################################################
+from usb_pyvisa_wrapper import usb_pyvisa
+from keysight_n5769a import keysight_n5769a_usb as usb_n5769a
+from keysight_el34243a import keysight_el34243a_usb as usb_el34243a
+from watchdog import safe_state_watchdog
+import telemetry
+##################################################
+
+ELOAD_CH = 2  # Eload channel to connect to
+
+# Calibration grid: the converter's output voltage follows the input
+# voltage at a fixed duty, and the eload sets the output current
+CAL_INPUT_VOLTS = [16, 18, 20, 22, 24]
+CAL_OUTPUT_CURRENTS = np.linspace(0.5, 8.5, 9)
+PSU_CURRENT_LIMIT = 12
+
+SETTLE_TIME = 1     # wait time after changing equipment settings
+RAW_SAMPLES = 64    # telemetry frames averaged per grid point
+RAW_TIMEOUT = 5     # [s] to receive them
+RAW_POLL_TIME = 0.01
+
+# The PSU and eload are turned off if a grid point takes longer than this,
+# e.g. the board stops streaming (see watchdog.py)
+WATCHDOG_TIMEOUT = 30
+
+ADC_MAX = 4095
+
+# Constants currently in the firmware, as (gain, offset)
+FIRMWARE_CONSTANTS = {"vout": (telemetry.VOUT_GAIN, telemetry.VOUT_OFFSET),
+                      "iout": (telemetry.IOUT_GAIN, telemetry.IOUT_OFFSET)}
+
+CAL_COLUMNS = ["raw_vout", "raw_iout", "ref_vout", "ref_iout"]
+
+# Objects for USB-connected PSU and Eload:
+usb_psu = None
+usb_eload = None
+
+
+##################################################
+# Signal handler and exit routine:
+def timeToExit(sig, frame):
+    if usb_psu is not None and usb_eload is not None:
+        usb_eload.deactivate(chan=ELOAD_CH)
+        usb_psu.setVoltage(0)
+        usb_psu.setCurrent(0.1)
+        usb_psu.deactivate()
+    if sig is not None or frame is not None:
+        # Caught a signal, so exit now
+        print(sig, frame)
+        sys.exit()
+
+
+##################################################
+# Raw codes from the board:
+class adc_stream():
+    def __init__(self, port, baud=telemetry.SERIAL_BAUD):
+        self.receiver = telemetry.telemetry_receiver(port, baud)
+        self.receiver.start()
+
+    def readRaw(self, samples=RAW_SAMPLES, timeout=RAW_TIMEOUT):
+        # Mean (vout, iout) codes of the next `samples` telemetry frames
+        ring = self.receiver.ring
+        start = ring.count
+        t0 = time()
+        while ring.count - start < samples:
+            if time() - t0 > timeout:
+                raise RuntimeError(f"Received {ring.count - start} of "
+                                   f"{samples} telemetry frames in "
+                                   f"{timeout} s, is the board streaming?")
+            sleep(RAW_POLL_TIME)
+        frames = self.receiver.snapshot(samples)
+        return (frames["adc_raw_vout"].mean(), frames["adc_raw_iout"].mean())
+
+    def close(self):
+        self.receiver.stop()
+
+
+##################################################
+# Fitting:
+def fit_channel(raw, ref, degree=1):
+    # Least-squares polynomial from raw codes to reference values.
+    # Returns coefficients highest power first (np.polyval order).
+    A = np.vander(np.asarray(raw, dtype=float), degree + 1)
+    coef, *_ = np.linalg.lstsq(A, np.asarray(ref, dtype=float), rcond=None)
+    return coef
+
+
+def fit_all(data, degree=1):
+    # Returns {"vout": coef, "iout": coef}
+    return {ch: fit_channel(data[f"raw_{ch}"], data[f"ref_{ch}"], degree)
+            for ch in ["vout", "iout"]}
+
+
+def residuals(coef, raw, ref):
+    err = np.polyval(coef, np.asarray(raw, dtype=float)) - np.asarray(ref)
+    return np.sqrt(np.mean(err ** 2)), np.max(np.abs(err))
+
+
+def c_expression(name, coef):
+    # Firmware line in the same form as sensing_v1_4_16.c
+    raw = f"(float)adc_raw_{name}"
+
+    def term(c):
+        return f"- {-c:.7g}" if c < 0 else f"+ {c:.7g}"
+
+    if len(coef) == 2:
+        gain, offset = coef
+        return f"adc_{name} = ({raw} * {gain:.7g} {term(offset)});"
+    # Horner form for higher degrees
+    expr = f"{coef[0]:.7g}"
+    for c in coef[1:]:
+        expr = f"({expr} * {raw} {term(c)})"
+    return f"adc_{name} = {expr};"
+
+
+def report(data, coefs):
+    for ch, coef in coefs.items():
+        raw = data[f"raw_{ch}"]
+        ref = data[f"ref_{ch}"]
+        old = np.array(FIRMWARE_CONSTANTS[ch])
+        rms_old, max_old = residuals(old, raw, ref)
+        rms_new, max_new = residuals(coef, raw, ref)
+        unit = "V" if ch == "vout" else "A"
+        print(f"{ch}: firmware error {rms_old:.4f} {unit} rms "
+              f"({max_old:.4f} max), calibrated {rms_new:.4f} {unit} rms "
+              f"({max_new:.4f} max)")
+    print("Firmware constants:")
+    for ch, coef in coefs.items():
+        print(f"    {c_expression(ch, coef)}")
+
+
+##################################################
+# Bench procedure:
+def collect(stream, psu, eload, watchdog=None):
+    rows = []
+    psu.deactivate()
+    eload.deactivate(chan=ELOAD_CH)
+    psu.setCurrent(PSU_CURRENT_LIMIT)
+    eload.setMode("CURR", remote_sense=True, chan=ELOAD_CH)
+
+    for vin in CAL_INPUT_VOLTS:
+        psu.setVoltage(vin)
+        psu.activate()
+        sleep(SETTLE_TIME)
+        for iout in CAL_OUTPUT_CURRENTS:
+            if watchdog is not None:
+                watchdog.beat()
+            eload.setValue(iout, chan=ELOAD_CH)
+            eload.activate(chan=ELOAD_CH)
+            sleep(SETTLE_TIME)
+
+            raw_vout, raw_iout = stream.readRaw()
+            ref_vout = eload.readVoltage(chan=ELOAD_CH)
+            ref_iout = eload.readCurrent(chan=ELOAD_CH)
+            print(f"  {vin} V, {iout:.2f} A: raw ({raw_vout:.1f}, "
+                  f"{raw_iout:.1f}) -> ref ({ref_vout:.3f} V, "
+                  f"{ref_iout:.3f} A)")
+            rows.append({"raw_vout": raw_vout, "raw_iout": raw_iout,
+                         "ref_vout": ref_vout, "ref_iout": ref_iout})
+        eload.deactivate(chan=ELOAD_CH)
+
+    return pd.DataFrame(rows, columns=CAL_COLUMNS)
+
+
+def main():
+    global usb_psu, usb_eload
+
+    parser = argparse.ArgumentParser(description="Calibrate the board ADC")
+    parser.add_argument("--port", help="serial port of the board")
+    parser.add_argument("--load", help="refit bench data saved with --save")
+    parser.add_argument("--save", help="save the bench data to this csv")
+    parser.add_argument("--degree", type=int, default=1,
+                        help="1 = gain/offset, 2 = add a quadratic term")
+    args = parser.parse_args()
+
+    if args.load:
+        data = pd.read_csv(args.load)
+    else:
+        if args.port is None:
+            parser.error("--port is required unless --load is given")
+        stream = adc_stream(args.port)
+
+        # If Ctrl-C is pressed while the program is running,
+        # the PSU and eload are turned off before exiting.
+        signal.signal(signal.SIGINT, timeToExit)
+        usb_psu = usb_n5769a(usb_pyvisa(usb_pyvisa.getAddrFromIdn("N5769A")))
+        usb_eload = usb_el34243a(
+            usb_pyvisa(usb_pyvisa.getAddrFromIdn("EL34243A")))
+
+        with safe_state_watchdog(usb_psu.usb.addr, usb_eload.usb.addr,
+                                 WATCHDOG_TIMEOUT) as watchdog:
+            data = collect(stream, usb_psu, usb_eload, watchdog)
+        timeToExit(None, None)
+        stream.close()
+
+    if args.save:
+        data.to_csv(args.save, index=False)
+
+    report(data, fit_all(data, args.degree))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+# Synchronous buck converter simulator with two levels of fidelity.
+#
+#   averaged   state-space averaged model, for long profile runs (transient
+#              response, the 0.5-0.75 duty clamp, MPPT steps)
+#   switching  switch-level model with deadtime and the MOSFET parameters of
+#              MOS_Selection.txt, for short windows (ripple)
+#
+# Both modes clamp the duty to the firmware's DUTY_MIN-DUTY_MAX (mppt_sim.py)
+# unless called with clamp=False, so operating points the firmware cannot
+# reach (e.g. 16 V in, D ~ 0.82) run at the clamp, with a lower output.
+#
+# States are x = [vin (input cap), iL, vc (output cap)] with the output cap
+# ESR folded into the output equation. Each topology is linear, so both
+# modes use the same fixed-step integrator: the exact discretization
+#
+#   z[k+1] = M z[k],  z = [x, 1],  M = expm([[A, b], [0, 0]] * step)
+#
+# and every run of steps with a constant topology is evaluated at once from
+# the stacked powers of M (vectorized over time). Nonlinear parts - a PV
+# panel source and the switching losses - are relinearized between runs.
+#
+# Switching losses (overlap, Coss, Qrr) are drawn from the input as a
+# constant current P_sw / vin in both modes. Gate drive losses come from
+# the driver supply and are not included.
+#
+# Usage:
+#   python buck_sim.py                     (corner ripple + benchmark)
+#   python buck_sim.py --mosfet IPAN60R125PFD7S
+
+import os
+import re
+import argparse
+from time import perf_counter
+import numpy as np
+import pandas as pd
+##################################################
+from pv_model import pv_panel
+from converter_spec import OPERATING_POINTS, DEADTIME
+from mppt_sim import DUTY_MIN, DUTY_MAX
+##################################################
+
+MOS_SELECTION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "..", "..", "MOS_Selection.txt")
+DEFAULT_MOSFET = "IRFI1310NPbF"
+
+# README specs
+FSW = 100e3
+VOUT_NOMINAL = 12
+
+# Passives, estimated from the ripple in PV_Buck_Measurement.xlsx
+# (0.57 A p-p inductor ripple at 19 V in, 62 mV p-p output ripple)
+INDUCTANCE = 80e-6
+INDUCTOR_DCR = 0.02
+C_IN = 100e-6
+C_OUT = 330e-6
+ESR_OUT = 0.1
+
+BODY_DIODE_VF = 1.0
+
+SOURCE_RESISTANCE = 0.05  # PSU and cabling
+
+STEPS_PER_PERIOD = 500    # switching mode step: 20 ns at 100 kHz
+AVERAGED_STEP = 10e-6
+AVERAGED_SEGMENT = 1e-3   # relinearization interval in averaged mode
+RELINEARIZE_PERIODS = 20  # same, in switching periods
+
+# Ripple measured on the board, PV_Buck_Measurement.xlsx (p-p)
+MEASURED_RIPPLE = pd.DataFrame(
+    [[20, 100, 0.2425, 0.57, 0.0625],
+     [16, 100, 0.131, 0.355, 0.056],
+     [24, 100, 0.25, 0.72, 0.0925],
+     [16, 50, 0.1425, 0.341, 0.05],
+     [24, 50, 0.675, 0.69, 0.0675]],
+    columns=["Vin", "Pout", "Vin_pp", "IL_pp", "Vout_pp"])
+
+UNITS = {"p": 1e-12, "n": 1e-9, "u": 1e-6, "m": 1e-3, "": 1.0}
+
+
+##################################################
+# Parts:
+def _value(text):
+    # "450pF" -> 4.5e-10, "0.036," -> 0.036
+    m = re.match(r"\s*([0-9.]+)\s*([pnum]?)", text)
+    return float(m.group(1)) * UNITS[m.group(2)]
+
+
+def load_mosfets(filename=MOS_SELECTION_FILE):
+    # Parse MOS_Selection.txt into {name: {rds_on, coss, qrr, tr, tf}}
+    fields = {"Rds,on": "rds_on", "Coss": "coss", "Qrr": "qrr",
+              "tr": "tr", "tf": "tf"}
+    parts = {}
+    part = None
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if "=" not in line:
+                name = line.split("(")[0].strip()
+                part = parts.setdefault(name, {})
+                continue
+            key, value = (s.strip() for s in line.split("=", 1))
+            if part is not None and key in fields:
+                part[fields[key]] = _value(value)
+    return parts
+
+
+##################################################
+# Sources:
+class thevenin_source():
+    def __init__(self, volts, resistance=SOURCE_RESISTANCE):
+        self.volts = volts
+        self.resistance = resistance
+
+    def linearize(self, vin, t):
+        return self.volts, self.resistance
+
+
+class panel_source():
+    # PV panel (pv_model.pv_panel) under an irradiance profile (t, g)
+    def __init__(self, panel=None, profile_t=(0.0,), profile_g=(1.0,)):
+        self.panel = pv_panel() if panel is None else panel
+        self.profile_t = np.asarray(profile_t, dtype=float)
+        self.profile_g = np.asarray(profile_g, dtype=float)
+
+    def linearize(self, vin, t):
+        # Thevenin equivalent of the tangent of the IV curve at vin
+        g = np.interp(t, self.profile_t, self.profile_g)
+        dv = 1e-3
+        i0 = float(self.panel.current(vin, g))
+        di = float(self.panel.current(vin + dv, g)) - i0
+        r = min(-dv / di, 1e6) if di < 0 else 1e6
+        return vin + i0 * r, r
+
+
+##################################################
+# Helpers:
+def _expm(a):
+    # Matrix exponential by scaling and squaring of a Taylor series
+    norm = np.abs(a).sum(axis=1).max()
+    s = max(0, int(np.ceil(np.log2(norm / 0.5))) if norm > 0.5 else 0)
+    a = a / 2 ** s
+    out = np.eye(len(a))
+    term = np.eye(len(a))
+    for k in range(1, 13):
+        term = term @ a / k
+        out = out + term
+    for _ in range(s):
+        out = out @ out
+    return out
+
+
+def _powers(m, n):
+    # Stack of m^0 ... m^n, by doubling
+    p = np.empty((n + 1,) + m.shape)
+    p[0] = np.eye(len(m))
+    filled = 1
+    block = m
+    while filled <= n:
+        count = min(filled, n + 1 - filled)
+        p[filled:filled + count] = p[:count] @ block
+        filled += count
+        block = block @ block
+    return p
+
+
+def clamp_duty(duty):
+    # Duty the firmware can command
+    return np.clip(duty, DUTY_MIN, DUTY_MAX)
+
+
+##################################################
+# Converter:
+class buck_converter():
+    def __init__(self, mosfet=DEFAULT_MOSFET, low_side=None, fsw=FSW,
+                 inductance=INDUCTANCE, dcr=INDUCTOR_DCR, c_in=C_IN,
+                 c_out=C_OUT, esr_out=ESR_OUT, deadtime=DEADTIME,
+                 vf=BODY_DIODE_VF):
+        parts = load_mosfets()
+        self.hs = parts[mosfet]
+        self.ls = parts[low_side if low_side is not None else mosfet]
+        self.fsw = fsw
+        self.inductance = inductance
+        self.dcr = dcr
+        self.c_in = c_in
+        self.c_out = c_out
+        self.esr_out = esr_out
+        self.deadtime = deadtime
+        self.vf = vf
+
+    def switchingLoss(self, vin, il):
+        # Overlap (high side), Coss of both switches, low side Qrr [W]
+        vin = np.maximum(vin, 0)
+        il = np.abs(il)
+        overlap = 0.5 * vin * il * (self.hs["tr"] + self.hs["tf"])
+        coss = (self.hs["coss"] + self.ls["coss"]) * vin ** 2 / 2
+        qrr = self.ls["qrr"] * vin
+        return (overlap + coss + qrr) * self.fsw
+
+    def _matrix(self, sw, source, r_load, z, t):
+        # Augmented continuous-time matrix of one topology.
+        # sw = (s_vin, r_sw, v_sw0, s_iin): the switch node voltage is
+        # s_vin * vin - r_sw * iL + v_sw0 and the high side draws s_iin * iL.
+        s_vin, r_sw, v_sw0, s_iin = sw
+        vin, il = z[0], z[1]
+        vth, rth = source.linearize(vin, t)
+        isw = self.switchingLoss(vin, il) / max(vin, 1.0)
+        re_, c = self.esr_out, self.c_out
+        k = r_load / (r_load + re_)
+        L = self.inductance
+        return np.array([
+            [-1 / (rth * self.c_in), -s_iin / self.c_in, 0,
+             (vth / rth - isw) / self.c_in],
+            [s_vin / L, -(r_sw + self.dcr + k * re_) / L, -k / L, v_sw0 / L],
+            [0, (1 - k * re_ / r_load) / c, -k / (r_load * c), 0],
+            [0, 0, 0, 0]])
+
+    def _averaged(self, duty):
+        T = 1 / self.fsw
+        d_hs = max(duty - self.deadtime / T, 0)
+        d_ls = max(1 - duty - self.deadtime / T, 0)
+        d_dead = 1 - d_hs - d_ls
+        r_sw = d_hs * self.hs["rds_on"] + d_ls * self.ls["rds_on"]
+        return (d_hs, r_sw, -d_dead * self.vf, d_hs)
+
+    def _topologies(self, il):
+        hs = (1, self.hs["rds_on"], 0, 1)
+        ls = (0, self.ls["rds_on"], 0, 0)
+        # Deadtime: the low side body diode carries a positive iL, the high
+        # side body diode a negative one
+        dead = (0, 0, -self.vf, 0) if il >= 0 else (1, 0, self.vf, 1)
+        return hs, ls, dead
+
+    def _outputs(self, t, z, r_load):
+        k = r_load / (r_load + self.esr_out)
+        vout = k * (z[:, 2] + self.esr_out * z[:, 1])
+        return pd.DataFrame({"t": t, "vin": z[:, 0], "il": z[:, 1],
+                             "vout": vout})
+
+    def steadyState(self, duty, source, r_load, t=0.0, iterations=8):
+        # Averaged equilibrium, iterating on the nonlinear parts
+        z = np.array([VOUT_NOMINAL / duty, VOUT_NOMINAL / r_load,
+                      VOUT_NOMINAL, 1.0])
+        for _ in range(iterations):
+            a = self._matrix(self._averaged(duty), source, r_load, z, t)
+            z[:3] = np.linalg.solve(a[:3, :3], -a[:3, 3])
+        return z
+
+    def averaged(self, duty_t, duty, source, r_load, t_end,
+                 step=AVERAGED_STEP, z0=None, clamp=True):
+        # Duty is piecewise constant: duty[k] from duty_t[k] on
+        duty_t = np.asarray(duty_t, dtype=float)
+        duty = np.asarray(duty, dtype=float)
+        if clamp:
+            duty = clamp_duty(duty)
+        z = self.steadyState(duty[0], source, r_load) if z0 is None else z0
+        n_seg = max(1, int(round(AVERAGED_SEGMENT / step)))
+        times = [np.zeros(1)]
+        states = [z[None, :]]
+        k = 0
+        while k * step < t_end - step / 2:
+            t = k * step
+            d = duty[np.searchsorted(duty_t, t, side="right") - 1]
+            # Run until the next duty change or relinearization
+            nxt = duty_t[duty_t > t + step / 2]
+            n = n_seg
+            if len(nxt):
+                n = min(n, max(1, int(round((nxt[0] - t) / step))))
+            n = min(n, int(round(t_end / step)) - k)
+            m = _expm(self._matrix(self._averaged(d), source, r_load, z, t)
+                      * step)
+            run = _powers(m, n)[1:] @ z
+            times.append(t + step * np.arange(1, n + 1))
+            states.append(run)
+            z = run[-1]
+            k += n
+        return self._outputs(np.concatenate(times), np.concatenate(states),
+                             r_load)
+
+    def switching(self, duty, source, r_load, periods, z0=None,
+                  steps=STEPS_PER_PERIOD, clamp=True):
+        # Switch-level run at a constant duty
+        if clamp:
+            duty = float(clamp_duty(duty))
+        h = 1 / self.fsw / steps
+        n_dead = max(1, int(round(self.deadtime / h)))
+        n_on = int(round(duty * steps))
+        runs = [("dead", n_dead), ("hs", n_on - n_dead),
+                ("dead", n_dead), ("ls", steps - n_on - n_dead)]
+        runs = [(name, n) for name, n in runs if n > 0]
+        z = self.steadyState(duty, source, r_load) if z0 is None else z0
+
+        times = [np.zeros(1)]
+        states = [z[None, :]]
+        cache = {}
+        k = 0
+        for period in range(periods):
+            if period % RELINEARIZE_PERIODS == 0:
+                cache = {}
+            for name, n in runs:
+                hs, ls, dead = self._topologies(z[1])
+                sw = {"hs": hs, "ls": ls, "dead": dead}[name]
+                if sw not in cache:
+                    a = self._matrix(sw, source, r_load, z, k * h)
+                    cache[sw] = _powers(_expm(a * h), steps)
+                run = cache[sw][1:n + 1] @ z
+                times.append((k + np.arange(1, n + 1)) * h)
+                states.append(run)
+                z = run[-1]
+                k += n
+        return self._outputs(np.concatenate(times), np.concatenate(states),
+                             r_load)
+
+    def dutyFor(self, vout, source, r_load, iterations=6):
+        # Open-loop duty giving vout at the averaged equilibrium (secant)
+        def err(d):
+            z = self.steadyState(d, source, r_load)
+            k = r_load / (r_load + self.esr_out)
+            return k * (z[2] + self.esr_out * z[1]) - vout
+        d0, d1 = 0.5, 0.6
+        e0, e1 = err(d0), err(d1)
+        for _ in range(iterations):
+            if e1 == e0:
+                break
+            d0, d1 = d1, d1 - e1 * (d1 - d0) / (e1 - e0)
+            e0, e1 = e1, err(d1)
+        return d1
+
+
+##################################################
+def ripple_table(conv, periods=200):
+    # Switching-mode ripple at the operating points, after settling.
+    # Points that need a duty outside the firmware clamp run at the clamp
+    # and are marked in column "Clamped".
+    rows = []
+    for vin, pout in OPERATING_POINTS:
+        source = thevenin_source(vin)
+        r_load = VOUT_NOMINAL ** 2 / pout
+        needed = conv.dutyFor(VOUT_NOMINAL, source, r_load)
+        duty = float(clamp_duty(needed))
+        w = conv.switching(duty, source, r_load, periods)
+        last = w[w.t >= w.t.iloc[-1] - 10 / conv.fsw]
+        # Power into the board terminals (the input cap averages out)
+        pin = np.mean((vin - last.vin) / source.resistance * last.vin)
+        pout_sim = np.mean(last.vout ** 2 / r_load)
+        rows.append({"Vin": vin, "Pout": pout, "Duty": duty,
+                     "Clamped": duty != needed, "Vout": last.vout.mean(),
+                     "Vin_pp": np.ptp(last.vin), "IL_pp": np.ptp(last.il),
+                     "Vout_pp": np.ptp(last.vout), "Eff": pout_sim / pin})
+    return pd.DataFrame(rows)
+
+
+def benchmark(conv, averaged_time=10.0, switching_periods=500):
+    # Simulated seconds per wall second in each mode
+    source = thevenin_source(20)
+    r_load = VOUT_NOMINAL ** 2 / 100
+    # P&O-like duty steps every 10 ms, inside the firmware clamp
+    duty_t = np.arange(0, averaged_time, 0.01)
+    duty = 0.6 + 0.005 * ((np.arange(len(duty_t)) % 3) - 1)
+
+    t0 = perf_counter()
+    conv.averaged(duty_t, duty, source, r_load, averaged_time)
+    avg_rate = averaged_time / (perf_counter() - t0)
+
+    t0 = perf_counter()
+    conv.switching(0.6, source, r_load, switching_periods)
+    sw_rate = switching_periods / conv.fsw / (perf_counter() - t0)
+    return avg_rate, sw_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buck converter simulator")
+    parser.add_argument("--mosfet", default=DEFAULT_MOSFET,
+                        choices=list(load_mosfets()))
+    parser.add_argument("--periods", type=int, default=200,
+                        help="switching periods per operating point")
+    args = parser.parse_args()
+
+    conv = buck_converter(args.mosfet)
+    table = ripple_table(conv, args.periods)
+    table = table.merge(MEASURED_RIPPLE, on=["Vin", "Pout"],
+                        suffixes=("", "_meas"))
+    print(f"Switching mode, {args.mosfet}, ripple p-p (simulated vs board):")
+    print(table.to_string(index=False, float_format="%.4f"))
+
+    avg_rate, sw_rate = benchmark(conv)
+    print(f"Averaged mode:  {avg_rate:10.2f} simulated s per wall s")
+    print(f"Switching mode: {sw_rate:10.5f} simulated s per wall s")
+
+
+if __name__ == "__main__":
+    main()
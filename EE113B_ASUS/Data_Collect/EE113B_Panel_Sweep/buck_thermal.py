@@ -0,0 +1,328 @@
+# Electro-thermal efficiency model of the buck stage.
+#
+# Thermal_Problem.txt attributes the gap between the hand calculation and
+# the board to Rds_on, Coss and Qrr rising with temperature. Here the loss
+# model is coupled to a thermal resistance network
+#
+#   T = T_amb + R @ P        nodes: high side MOSFET, low side MOSFET,
+#                            inductor
+#
+# and the temperature-dependent parameters are solved to a fixed point for
+# every operating point at once (arrays over the Vin x Pout grid of
+# eff_sweep.py). Points that heat past TJ_MAX or do not converge are
+# reported as thermal runaway (nan).
+#
+# Usage:
+#   python buck_thermal.py
+#   python buck_thermal.py --data 4_wire_effsweep.csv --t-amb 30
+
+import argparse
+import numpy as np
+import pandas as pd
+##################################################
+from buck_sim import buck_converter, load_mosfets, DEFAULT_MOSFET, \
+    VOUT_NOMINAL
+##################################################
+
+T_AMB = 25
+T_REF = 25          # temperature of the datasheet values
+
+# Parameter drift per degree C above T_REF (typical datasheet curves:
+# Rds_on roughly doubles by 175 C, Qrr roughly doubles by 125 C)
+RDS_TEMPCO = 0.007
+COSS_TEMPCO = 0.001
+QRR_TEMPCO = 0.01
+DCR_TEMPCO = 0.00393  # copper
+
+# Thermal network [C/W]. Each MOSFET: junction-case (TO-220 FullPak),
+# thermal pad, heat sink (507302B00000G) and board copper to ambient. The
+# parts share the board, which couples them. RTH_JC and RTH_PAD are
+# datasheet values; RTH_SA, RTH_COUPLING and RTH_INDUCTOR are rough
+# estimates. fit_model refits RTH_SA and RTH_COUPLING to the measured
+# heat sink temperatures of MEASURED_CORNERS (done by default in main).
+RTH_JC = 3.0
+RTH_PAD = 0.5
+RTH_SA = 8.0
+RTH_COUPLING = 4.0
+RTH_INDUCTOR = 15.0
+NODES = ["hs", "ls", "inductor"]
+
+# The datasheet Qrr is specified at a harder recovery than the board's
+# deadtime allows and is the largest single loss at the corners. fit_model
+# scales it (QRR_SCALE) to the measured corner efficiencies.
+QRR_SCALE = 1.0
+
+# Search grids of fit_model: thermal network [C/W] and Qrr scale
+FIT_RTH_SA = np.linspace(1, 15, 29)
+FIT_RTH_COUPLING = np.linspace(0, 12, 25)
+FIT_QRR_SCALE = np.linspace(0, 1.5, 31)
+FIT_ROUNDS = 3      # alternations between the loss and thermal fits
+
+ESR_IN = 0.02
+
+TJ_MAX = 175
+MAX_ITERATIONS = 100
+TOLERANCE = 0.01    # C
+RELAXATION = 0.7
+
+
+def thermal_network(rth_sa=RTH_SA, rth_coupling=RTH_COUPLING,
+                    rth_inductor=RTH_INDUCTOR):
+    rth_fet = RTH_JC + RTH_PAD + rth_sa
+    return np.array(
+        [[rth_fet, rth_coupling, rth_coupling / 2],
+         [rth_coupling, rth_fet, rth_coupling / 2],
+         [rth_coupling / 2, rth_coupling / 2, rth_inductor]])
+
+
+THERMAL_R = thermal_network()
+
+# Grid of eff_sweep.py
+SWEEP_INPUT_VOLTS = [16, 18, 20, 22, 24]
+SWEEP_OUTPUT_POWERS = [50, 62.5, 75, 87.5, 100]
+
+# Board measurements at the 4 corners and nominal point
+# (PV_Buck_Measurement.xlsx): efficiency [%] and heat sink temperature [C].
+# fit_model fits the thermal network to the temperatures and QRR_SCALE to
+# the efficiencies. With the datasheet Qrr the hot model is 2-5 points
+# below the 100 W corners. The fit (about half the datasheet Qrr) removes
+# the mean bias but leaves ~2 points rms, low at 100 W and high at 50 W,
+# which no single loss term can fix. main prints the remaining bias.
+MEASURED_CORNERS = pd.DataFrame(
+    [[20, 100.0, 92.92, 85], [16, 100.0, 94.52, 83],
+     [24, 100.0, 93.52, 110], [16, 50.0, 91.87, np.nan],
+     [24, 50.0, 90.80, np.nan]],
+    columns=["Vin", "Pout", "Eff_meas", "Temp_meas"])
+
+
+##################################################
+# Losses:
+def loss_breakdown(conv, vin, pout, temps, esr_in=ESR_IN,
+                   qrr_scale=QRR_SCALE):
+    # Losses [W] at temperatures temps (..., 3) for arrays vin and pout.
+    # conv is a buck_sim.buck_converter holding the parts and passives.
+    vin = np.asarray(vin, dtype=float)
+    iout = np.asarray(pout, dtype=float) / VOUT_NOMINAL
+    dt_hs = temps[..., 0] - T_REF
+    dt_ls = temps[..., 1] - T_REF
+    dt_ind = temps[..., 2] - T_REF
+
+    rds_hs = conv.hs["rds_on"] * (1 + RDS_TEMPCO * dt_hs)
+    rds_ls = conv.ls["rds_on"] * (1 + RDS_TEMPCO * dt_ls)
+    dcr = conv.dcr * (1 + DCR_TEMPCO * dt_ind)
+    coss = (conv.hs["coss"] * (1 + COSS_TEMPCO * dt_hs)
+            + conv.ls["coss"] * (1 + COSS_TEMPCO * dt_ls))
+    qrr = conv.ls["qrr"] * qrr_scale * (1 + QRR_TEMPCO * dt_ls)
+
+    # Duty with the conduction drops, inductor ripple and rms currents
+    duty = np.clip((VOUT_NOMINAL + iout * (rds_hs + dcr)) / vin, 0, 1)
+    ripple = (vin - VOUT_NOMINAL) * duty / (conv.inductance * conv.fsw)
+    i_rms2 = iout ** 2 + ripple ** 2 / 12
+    t_dead = 2 * conv.deadtime * conv.fsw
+
+    return {
+        "cond_hs": (duty - conv.deadtime * conv.fsw).clip(0) * i_rms2
+        * rds_hs,
+        "cond_ls": (1 - duty - conv.deadtime * conv.fsw).clip(0) * i_rms2
+        * rds_ls,
+        # Hard turn-on/off of the high side, at the valley/peak current
+        "overlap": 0.5 * vin * conv.fsw
+        * ((iout - ripple / 2).clip(0) * conv.hs["tr"]
+           + (iout + ripple / 2) * conv.hs["tf"]),
+        "coss": coss * vin ** 2 / 2 * conv.fsw,
+        "qrr": qrr * vin * conv.fsw,
+        "deadtime": t_dead * conv.vf * iout,
+        "dcr": i_rms2 * dcr,
+        "esr_in": esr_in * iout ** 2 * duty * (1 - duty),
+        "esr_out": conv.esr_out * ripple ** 2 / 12,
+    }
+
+
+def node_losses(losses):
+    # Heat into each thermal node (..., 3). The Coss and Qrr charge is
+    # dissipated in the high side channel at turn-on.
+    hs = losses["cond_hs"] + losses["overlap"] + losses["coss"] \
+        + losses["qrr"]
+    ls = losses["cond_ls"] + losses["deadtime"]
+    return np.stack([hs, ls, losses["dcr"]], axis=-1)
+
+
+##################################################
+# Fixed point:
+def solve(conv, vin, pout, t_amb=T_AMB, thermal_r=THERMAL_R,
+          qrr_scale=QRR_SCALE):
+    # Steady-state temperatures, losses and efficiency, vectorized over
+    # the broadcast shape of vin and pout
+    vin, pout = np.broadcast_arrays(np.asarray(vin, dtype=float),
+                                    np.asarray(pout, dtype=float))
+    temps = np.full(vin.shape + (3,), float(t_amb))
+    converged = np.zeros(vin.shape, dtype=bool)
+    iterations = 0
+    for iterations in range(1, MAX_ITERATIONS + 1):
+        p = node_losses(loss_breakdown(conv, vin, pout, temps,
+                                       qrr_scale=qrr_scale))
+        target = t_amb + p @ thermal_r.T
+        new = temps + RELAXATION * (target - temps)
+        change = np.abs(new - temps).max(axis=-1)
+        # Converged points keep their temperatures
+        temps = np.where(converged[..., None], temps, new)
+        converged |= change < TOLERANCE
+        if converged.all() or (temps > TJ_MAX).any(axis=-1).all():
+            break
+
+    runaway = ~converged | (temps > TJ_MAX).any(axis=-1)
+    losses = loss_breakdown(conv, vin, pout, temps, qrr_scale=qrr_scale)
+    total = sum(losses.values())
+    eff = np.where(runaway, np.nan, pout / (pout + total))
+    temps = np.where(runaway[..., None], np.nan, temps)
+    return {"eff": eff, "temps": temps, "losses": losses,
+            "runaway": runaway, "iterations": iterations}
+
+
+def sink_temperature(result):
+    # Heat sink temperature of the hotter MOSFET: junction temperature
+    # minus the drop across junction-case and pad
+    p = node_losses(result["losses"])
+    sink = result["temps"][..., :2] - p[..., :2] * (RTH_JC + RTH_PAD)
+    return sink.max(axis=-1)
+
+
+def fit_thermal(conv, t_amb=T_AMB, corners=MEASURED_CORNERS,
+                qrr_scale=QRR_SCALE):
+    # Grid search of RTH_SA and RTH_COUPLING minimizing the rms error of
+    # the heat sink temperature at the measured corners.
+    # Returns (rth_sa, rth_coupling, rms error [C]).
+    measured = corners.dropna(subset=["Temp_meas"])
+    vin = measured.Vin.to_numpy()
+    pout = measured.Pout.to_numpy()
+    best = (RTH_SA, RTH_COUPLING, np.inf)
+    for rth_sa in FIT_RTH_SA:
+        for rth_coupling in FIT_RTH_COUPLING:
+            result = solve(conv, vin, pout, t_amb,
+                           thermal_network(rth_sa, rth_coupling), qrr_scale)
+            err = sink_temperature(result) - measured.Temp_meas.to_numpy()
+            rms = np.sqrt(np.mean(err ** 2))
+            if rms < best[2]:
+                best = (rth_sa, rth_coupling, rms)
+    return best
+
+
+def fit_qrr(conv, t_amb=T_AMB, thermal_r=THERMAL_R,
+            corners=MEASURED_CORNERS):
+    # Grid search of the Qrr scale minimizing the rms error of the hot
+    # efficiency at the measured corners.
+    # Returns (qrr_scale, rms error [points]).
+    vin = corners.Vin.to_numpy()
+    pout = corners.Pout.to_numpy()
+    best = (QRR_SCALE, np.inf)
+    for qrr_scale in FIT_QRR_SCALE:
+        result = solve(conv, vin, pout, t_amb, thermal_r, qrr_scale)
+        err = result["eff"] * 100 - corners.Eff_meas.to_numpy()
+        rms = np.sqrt(np.mean(err ** 2))
+        if rms < best[1]:
+            best = (qrr_scale, rms)
+    return best
+
+
+def fit_model(conv, t_amb=T_AMB, corners=MEASURED_CORNERS,
+              rounds=FIT_ROUNDS):
+    # Alternate the efficiency (Qrr scale) and temperature (thermal
+    # network) fits, each with the other's latest result.
+    # Returns {rth_sa, rth_coupling, qrr_scale, temp_rms, eff_rms}.
+    qrr_scale = QRR_SCALE
+    for _ in range(rounds):
+        rth_sa, rth_coupling, temp_rms = fit_thermal(conv, t_amb, corners,
+                                                     qrr_scale)
+        qrr_scale, eff_rms = fit_qrr(conv, t_amb,
+                                     thermal_network(rth_sa, rth_coupling),
+                                     corners)
+    return {"rth_sa": rth_sa, "rth_coupling": rth_coupling,
+            "qrr_scale": qrr_scale, "temp_rms": temp_rms,
+            "eff_rms": eff_rms}
+
+
+def efficiency_grid(conv, t_amb=T_AMB, hot=True, thermal_r=THERMAL_R,
+                    qrr_scale=QRR_SCALE):
+    # DataFrame over the eff_sweep.py grid, cold (all parts at t_amb) or
+    # hot (thermal fixed point)
+    vin, pout = np.meshgrid(SWEEP_INPUT_VOLTS, SWEEP_OUTPUT_POWERS,
+                            indexing="ij")
+    if hot:
+        result = solve(conv, vin, pout, t_amb, thermal_r, qrr_scale)
+        eff, temps = result["eff"], result["temps"]
+        sink = sink_temperature(result)
+    else:
+        temps = np.full(vin.shape + (3,), float(t_amb))
+        losses = loss_breakdown(conv, vin, pout, temps,
+                                qrr_scale=qrr_scale)
+        eff = pout / (pout + sum(losses.values()))
+        sink = np.full(vin.shape, float(t_amb))
+    df = pd.DataFrame({"Vin": vin.ravel(), "Pout": pout.ravel(),
+                       "Eff": eff.ravel() * 100})
+    for k, node in enumerate(NODES):
+        df[f"T_{node}"] = temps[..., k].ravel()
+    df["T_sink"] = sink.ravel()
+    return df
+
+
+def measured_grid(filename):
+    # effsweep csv -> Vin, nominal Pout, Eff [%]
+    data = pd.read_csv(filename)
+    nominal = np.asarray(SWEEP_OUTPUT_POWERS)
+    k = np.abs(data.Iout.to_numpy()[:, None] * VOUT_NOMINAL
+               - nominal[None, :]).argmin(axis=1)
+    return pd.DataFrame({"Vin": data.Vin, "Pout": nominal[k],
+                         "Eff_meas": data.Eff})
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(
+        description="Electro-thermal efficiency model")
+    parser.add_argument("--mosfet", default=DEFAULT_MOSFET,
+                        choices=list(load_mosfets()))
+    parser.add_argument("--t-amb", type=float, default=T_AMB)
+    parser.add_argument("--data", default="effsweep.csv",
+                        help="measured effsweep csv to compare against")
+    parser.add_argument("--no-fit", action="store_true",
+                        help="use the estimated RTH_SA / RTH_COUPLING "
+                             "and the datasheet Qrr instead of fitting "
+                             "them to the corners")
+    args = parser.parse_args()
+
+    conv = buck_converter(args.mosfet)
+    thermal_r = THERMAL_R
+    qrr_scale = QRR_SCALE
+    if not args.no_fit:
+        fit = fit_model(conv, args.t_amb)
+        thermal_r = thermal_network(fit["rth_sa"], fit["rth_coupling"])
+        qrr_scale = fit["qrr_scale"]
+        print(f"Fitted RTH_SA = {fit['rth_sa']:.2f} C/W, RTH_COUPLING = "
+              f"{fit['rth_coupling']:.2f} C/W (heat sink rms error "
+              f"{fit['temp_rms']:.1f} C)")
+        print(f"Fitted Qrr = {qrr_scale:.2f} x datasheet (efficiency rms "
+              f"error {fit['eff_rms']:.2f} points)")
+    cold = efficiency_grid(conv, args.t_amb, hot=False, qrr_scale=qrr_scale)
+    hot = efficiency_grid(conv, args.t_amb, hot=True, thermal_r=thermal_r,
+                          qrr_scale=qrr_scale)
+    table = cold[["Vin", "Pout", "Eff"]].rename(columns={"Eff": "Eff_cold"})
+    table = table.merge(hot.rename(columns={"Eff": "Eff_hot"}),
+                        on=["Vin", "Pout"])
+    table = table.merge(measured_grid(args.data), on=["Vin", "Pout"],
+                        how="left")
+
+    print(f"{args.mosfet}, ambient {args.t_amb:.0f} C "
+          f"(efficiency in %, temperatures in C):")
+    print(table.to_string(index=False, float_format="%.2f"))
+    print("Corners vs PV_Buck_Measurement.xlsx:")
+    corners = MEASURED_CORNERS.merge(table[["Vin", "Pout", "Eff_hot",
+                                            "T_sink", "T_hs", "T_ls"]],
+                                     on=["Vin", "Pout"])
+    corners["Eff_err"] = corners.Eff_hot - corners.Eff_meas
+    print(corners.to_string(index=False, float_format="%.2f"))
+    print(f"Model bias at the corners: {corners.Eff_err.mean():+.2f} "
+          f"points efficiency (hot model - measured)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# Runs a characterization campaign: many sweep plans back-to-back.
+#
+# Usage:
+#   python campaign.py campaigns/characterization.toml
+#   python campaign.py campaigns/characterization.toml --dry-run
+#
+# A campaign file lists jobs, each a sweep plan (see sweep_plan.py). A job
+# either names a plan file and overrides some of its keys, or is written
+# out in full like a plan file. [defaults] apply to every job, below the
+# plan file and the job's own keys. [psu] and [eload] are merged key by
+# key, so a job can change only the current limit of a plan:
+#
+#   store = "characterization.sqlite"
+#
+#   [defaults]
+#   watchdog_timeout = 30
+#
+#   [[job]]
+#   plan = "../plans/ivsweep.toml"
+#   name = "iv_77pct"
+#   psu = {current_limit = 4}
+#
+# The jobs are queued and run in order with one set of instrument sessions
+# and one watchdog, opened once for the whole campaign. Every job's results
+# go to a table named after the job in one SQLite store, and the `jobs`
+# table records each job's plan, status and timing:
+#
+#   store = campaign_store("characterization.sqlite")
+#   store.jobs()                 # DataFrame, one row per job
+#   store.results("iv_77pct")    # DataFrame, same columns as the csv
+#
+# Rerunning a campaign skips the jobs already done with the same plan, and
+# an interrupted job resumes from its journal like run_sweep.py.
+
+import sys
+import os
+import json
+import signal
+import sqlite3
+import argparse
+from collections import deque
+from time import time
+import pandas as pd
+##################################################
+from watchdog import safe_state_watchdog, drive_safe
+from sweep_journal import sweep_journal
+from sweep_plan import read_plan_file, make_plan, compile_plan, plan_params
+from sweep_scheduler import transition_cost_model, read_traces, estimate_time
+from sweeps import open_instruments, run_plan
+from run_sweep import TRACES_FILENAME
+##################################################
+
+CAMPAIGN_KEYS = ["store", "defaults", "job"]
+JOBS_TABLE = "jobs"
+
+# Job states in the jobs table
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+##################################################
+# Campaign file:
+def merge_plan(base, override):
+    # Like {**base, **override}, but [psu] and [eload] merge key by key
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_campaign(filename):
+    # Returns the list of job plans and the store filename
+    campaign = read_plan_file(filename)
+    unknown = set(campaign) - set(CAMPAIGN_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown campaign keys {sorted(unknown)}")
+    folder = os.path.dirname(os.path.abspath(filename))
+    defaults = campaign.get("defaults", {})
+
+    jobs = []
+    for count, spec in enumerate(campaign.get("job", []), start=1):
+        spec = dict(spec)
+        plan = dict(defaults)
+        name = f"job{count}"
+        if "plan" in spec:
+            # Plan files are relative to the campaign file
+            planfile = os.path.join(folder, spec.pop("plan"))
+            plan = merge_plan(plan, read_plan_file(planfile))
+            name = os.path.splitext(os.path.basename(planfile))[0]
+        jobs.append(make_plan(merge_plan(plan, spec), name))
+
+    if not jobs:
+        raise ValueError(f"No [[job]] in {filename}")
+    names = [job["name"] for job in jobs]
+    for name in names:
+        if names.count(name) > 1:
+            raise ValueError(f"Job name {name!r} is used more than once")
+        if name == JOBS_TABLE:
+            raise ValueError(f"Job name {name!r} is reserved")
+
+    store = campaign.get(
+        "store", os.path.splitext(os.path.basename(filename))[0] + ".sqlite")
+    return jobs, os.path.join(folder, store)
+
+
+##################################################
+# Results store:
+class campaign_store():
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.con = sqlite3.connect(filename)
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {JOBS_TABLE} ("
+                         "name TEXT PRIMARY KEY, kind TEXT, params TEXT, "
+                         "status TEXT, started REAL, finished REAL, "
+                         "points INTEGER, error TEXT)")
+        self.con.commit()
+
+    @staticmethod
+    def _params(plan):
+        return json.dumps(plan_params(plan), sort_keys=True)
+
+    def isDone(self, plan):
+        # Done before with the same points
+        row = self.con.execute(
+            f"SELECT status, params FROM {JOBS_TABLE} WHERE name = ?",
+            (plan["name"],)).fetchone()
+        return row == (JOB_DONE, self._params(plan))
+
+    def start(self, plan):
+        self.con.execute(
+            f"INSERT OR REPLACE INTO {JOBS_TABLE} "
+            "(name, kind, params, status, started) VALUES (?, ?, ?, ?, ?)",
+            (plan["name"], plan["kind"], self._params(plan), JOB_RUNNING,
+             time()))
+        self.con.commit()
+
+    def finish(self, plan, data_log):
+        data_log.to_sql(plan["name"], self.con, if_exists="replace",
+                        index=False)
+        self.con.execute(
+            f"UPDATE {JOBS_TABLE} SET status = ?, finished = ?, points = ?, "
+            "error = NULL WHERE name = ?",
+            (JOB_DONE, time(), len(data_log), plan["name"]))
+        self.con.commit()
+
+    def fail(self, plan, error):
+        self.con.execute(
+            f"UPDATE {JOBS_TABLE} SET status = ?, finished = ?, error = ? "
+            "WHERE name = ?",
+            (JOB_FAILED, time(), f"{type(error).__name__}: {error}",
+             plan["name"]))
+        self.con.commit()
+
+    def jobs(self):
+        return pd.read_sql(f"SELECT * FROM {JOBS_TABLE}", self.con)
+
+    def results(self, name):
+        return pd.read_sql(f'SELECT * FROM "{name}"', self.con)
+
+    def close(self):
+        self.con.close()
+
+
+##################################################
+# Campaign execution:
+def queue_jobs(jobs, store, tracefile, resume=True):
+    # Queue of (plan, points, estimated seconds), skipping finished jobs
+    queue = deque()
+    for plan in jobs:
+        if resume and store.isDone(plan):
+            print(f"Job {plan['name']}: already done, skipping")
+            continue
+        # Learn the transition cost model from past sweeps, if any
+        model = transition_cost_model(plan["settle_time"])
+        model.fit(read_traces(tracefile))
+        points = compile_plan(plan, model)
+        runtime = plan["runtime"] if plan["settle_tolerance"] is None else 0
+        estimate = estimate_time(points, model, runtime,
+                                 plan["eload_off_between_points"])
+        queue.append((plan, points, estimate))
+    return queue
+
+
+def run_campaign(queue, store, psu, eload, save_dir, resume=True,
+                 watchdog=None):
+    tracefile = os.path.join(save_dir, TRACES_FILENAME)
+    total = len(queue)
+    count = 0
+    while queue:
+        plan, points, estimate = queue.popleft()
+        count += 1
+        print("==========================")
+        print(f"  Job {count}/{total}: {plan['name']}, {len(points)} points, "
+              f"estimated {estimate / 60:.1f} min")
+        print("==========================")
+        journal = sweep_journal(
+            os.path.join(save_dir, f"{plan['name']}.journal"),
+            plan_params(plan), resume=resume)
+        if watchdog is not None:
+            watchdog.timeout = plan["watchdog_timeout"]
+        store.start(plan)
+        try:
+            data_log = run_plan(plan, points, psu, eload, journal,
+                                tracefile, watchdog)
+        except Exception as e:
+            store.fail(plan, e)
+            journal.close()
+            raise
+        store.finish(plan, data_log)
+        # All points are in the store, so a rerun starts a fresh job
+        journal.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sweep campaign")
+    parser.add_argument("campaign", help="campaign file (.toml/.yaml)")
+    parser.add_argument("--store", default=None,
+                        help="SQLite results store (default: campaign's)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="rerun finished jobs and ignore journals")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the job queue and exit")
+    args = parser.parse_args()
+
+    jobs, storefile = load_campaign(args.campaign)
+    storefile = args.store or storefile
+    save_dir = os.path.dirname(os.path.abspath(storefile))
+    tracefile = os.path.join(save_dir, TRACES_FILENAME)
+    resume = not args.no_resume
+
+    store = campaign_store(storefile)
+    queue = queue_jobs(jobs, store, tracefile, resume)
+    estimate = sum(job[2] for job in queue)
+    print(f"Campaign {args.campaign}: {len(queue)} of {len(jobs)} jobs "
+          f"queued, estimated {estimate / 60:.1f} min, results in "
+          f"{storefile}")
+    if args.dry_run:
+        for plan, points, job_estimate in queue:
+            print(f"  {plan['name']}: {plan['kind']}, {len(points)} points, "
+                  f"{job_estimate / 60:.1f} min")
+        store.close()
+        return
+
+    # Opened once, every job reuses these sessions
+    psu, eload = open_instruments()
+
+    # If Ctrl-C is pressed while the program is running, the PSU and
+    # eload are turned off before exiting
+    def timeToExit(sig, frame):
+        drive_safe(psu, eload)
+        store.close()
+        print(sig, frame)
+        sys.exit()
+    signal.signal(signal.SIGINT, timeToExit)
+
+    with safe_state_watchdog(psu.usb.addr, eload.usb.addr) as watchdog:
+        run_campaign(queue, store, psu, eload, save_dir, resume, watchdog)
+    drive_safe(psu, eload)
+
+    print(store.jobs()[["name", "kind", "status", "points"]])
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# Append-only binary capture files for long acquisitions.
+#
+# A multi-hour mppt_step.py replay reads the eload power (and receives
+# controller telemetry, see telemetry.py) millions of times, too many rows
+# to keep in lists and DataFrames. Rows are instead written straight into a
+# memory-mapped file, one fixed-size chunk at a time, and read back lazily
+# by slices, so a capture of any length takes constant memory on both
+# sides.
+#
+# File layout (little-endian):
+#
+#   magic           8 bytes  b"PVCAP001"
+#   rows            uint64   rows committed to the file
+#   header_len      uint32   length of the JSON header
+#   header          JSON     {"channels": [{"name", "unit", "dtype"}, ...],
+#                             "chunk_rows", "created", "meta"}
+#   (padding up to the next multiple of HEADER_ALIGN)
+#   data            rows of the channels as one packed record each
+#
+# The header has no size limit (meta can hold e.g. a whole replay profile),
+# the data starts at the first HEADER_ALIGN boundary after it.
+#
+# The writer grows the file by chunk_rows rows at a time and maps only the
+# current chunk. The rows count is updated when a chunk fills up and on
+# flush(), so after a crash the file holds everything up to the last
+# flush. close() trims the unused end of the last chunk. Example:
+#
+#   with capture_writer("replay.cap", [("t", "s"), ("Pout", "W")]) as cap:
+#       cap.append(time(), eload.readPower(chan=2))
+#   cap = capture_reader("replay.cap")
+#   cap["Pout"][1000000:2000000].mean()
+#   for block in cap.chunks():
+#       ... block["t"], block["Pout"] ...
+#
+# Usage:
+#   python capture_log.py info mppt_step_power.cap
+#   python capture_log.py export mppt_step_power.cap power.csv --stop 100000
+
+import os
+import json
+import argparse
+from time import time
+import numpy as np
+import pandas as pd
+
+MAGIC = b"PVCAP001"
+PREFIX_DTYPE = np.dtype([("magic", "S8"), ("rows", "<u8"),
+                         ("header_len", "<u4")])
+HEADER_ALIGN = 4096         # data starts on a page boundary
+CHUNK_ROWS = 1 << 16        # rows the file grows by at a time
+DEFAULT_DTYPE = "<f8"
+EXPORT_ROWS = 1 << 20       # rows per block when exporting to csv
+
+
+def _channel_dtype(channels):
+    return np.dtype([(c["name"], c["dtype"]) for c in channels])
+
+
+def _data_offset(header_len):
+    size = PREFIX_DTYPE.itemsize + header_len
+    return -(-size // HEADER_ALIGN) * HEADER_ALIGN
+
+
+##################################################
+class capture_writer():
+
+    def __init__(self, filename, channels, chunk_rows=CHUNK_ROWS, meta=None):
+        # channels: list of (name, unit) or (name, unit, dtype), the dtype
+        # defaults to float64
+        self.filename = filename
+        self.channels = [{"name": c[0], "unit": c[1],
+                          "dtype": np.dtype(c[2] if len(c) > 2
+                                            else DEFAULT_DTYPE).str}
+                         for c in channels]
+        self.dtype = _channel_dtype(self.channels)
+        self.chunk_rows = chunk_rows
+        header = json.dumps({"channels": self.channels,
+                             "chunk_rows": chunk_rows,
+                             "created": time(),
+                             "meta": meta or {}}).encode()
+        self.data_offset = _data_offset(len(header))
+
+        self.file = open(filename, "w+b")
+        prefix = np.array([(MAGIC, 0, len(header))], dtype=PREFIX_DTYPE)
+        self.file.write(prefix.tobytes() + header)
+        self.file.truncate(self.data_offset)
+        self.rows = 0       # rows written
+        self.committed = 0  # rows counted in the file
+        self.chunk = None   # memory map of the current chunk
+        self.pos = 0        # next row in the chunk
+
+    def _offset(self, row):
+        return self.data_offset + row * self.dtype.itemsize
+
+    def _next_chunk(self):
+        self._release()
+        # Start of the new chunk = first unwritten row
+        self.file.truncate(self._offset(self.rows + self.chunk_rows))
+        self.chunk = np.memmap(self.file, dtype=self.dtype, mode="r+",
+                               offset=self._offset(self.rows),
+                               shape=(self.chunk_rows,))
+        self.pos = 0
+
+    def _release(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self._commit()
+            # Drop the map so the file can be resized (needed on Windows)
+            self.chunk = None
+
+    def _commit(self):
+        if self.rows != self.committed:
+            self.file.seek(len(MAGIC))
+            self.file.write(np.uint64(self.rows).tobytes())
+            self.file.flush()
+            self.committed = self.rows
+
+    def append(self, *values):
+        # One row, values in channel order
+        if self.chunk is None or self.pos == self.chunk_rows:
+            self._next_chunk()
+        self.chunk[self.pos] = values
+        self.pos += 1
+        self.rows += 1
+
+    def extend(self, rows):
+        # Many rows: a structured array with the channel names, or a dict
+        # of name -> array
+        if isinstance(rows, dict):
+            n = len(next(iter(rows.values())))
+            block = np.empty(n, dtype=self.dtype)
+            for name in self.dtype.names:
+                block[name] = rows[name]
+            rows = block
+        start = 0
+        while start < len(rows):
+            if self.chunk is None or self.pos == self.chunk_rows:
+                self._next_chunk()
+            n = min(len(rows) - start, self.chunk_rows - self.pos)
+            for name in self.dtype.names:
+                self.chunk[name][self.pos:self.pos + n] = \
+                    rows[name][start:start + n]
+            self.pos += n
+            self.rows += n
+            start += n
+
+    def flush(self):
+        # Make the rows written so far part of the file
+        if self.chunk is not None:
+            self.chunk.flush()
+        self._commit()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._release()
+        self._commit()
+        self.file.truncate(self._offset(self.rows))
+        self.file.close()
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+##################################################
+class capture_reader():
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            head = f.read(PREFIX_DTYPE.itemsize)
+            if len(head) < PREFIX_DTYPE.itemsize:
+                raise ValueError(f"{filename} is not a capture file")
+            prefix = np.frombuffer(head, dtype=PREFIX_DTYPE, count=1)[0]
+            if prefix["magic"] != MAGIC:
+                raise ValueError(f"{filename} is not a capture file")
+            header = json.loads(f.read(int(prefix["header_len"])))
+        self.data_offset = _data_offset(int(prefix["header_len"]))
+        self.channels = header["channels"]
+        self.units = {c["name"]: c["unit"] for c in self.channels}
+        self.meta = header["meta"]
+        self.created = header["created"]
+        self.dtype = _channel_dtype(self.channels)
+        # A file still being written (or cut short) may be longer than the
+        # committed rows
+        size = os.path.getsize(filename) - self.data_offset
+        self.rows = min(int(prefix["rows"]), size // self.dtype.itemsize)
+        if self.rows:
+            self.data = np.memmap(filename, dtype=self.dtype, mode="r",
+                                  offset=self.data_offset,
+                                  shape=(self.rows,))
+        else:
+            self.data = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, key):
+        # capture["Pout"] -> lazy column, capture[a:b] -> lazy rows.
+        # Nothing is read from disk until the values are used.
+        return self.data[key]
+
+    def chunks(self, rows=CHUNK_ROWS, start=0, stop=None, columns=None):
+        # Consecutive blocks of rows, each copied into memory
+        stop = self.rows if stop is None else min(stop, self.rows)
+        for k in range(start, stop, rows):
+            block = self.data[k:min(k + rows, stop)]
+            if columns is not None:
+                yield {name: np.array(block[name]) for name in columns}
+            else:
+                yield np.array(block)
+
+    def to_dataframe(self, start=0, stop=None):
+        # Rows [start, stop) as a DataFrame, for slices that fit in memory
+        return pd.DataFrame(np.array(self.data[start:stop]))
+
+    def close(self):
+        self.data = None
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(description="Capture file tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="print the channels and size")
+    info.add_argument("capture")
+    export = sub.add_parser("export", help="save rows to a csv")
+    export.add_argument("capture")
+    export.add_argument("csv")
+    export.add_argument("--start", type=int, default=0)
+    export.add_argument("--stop", type=int, default=None)
+    args = parser.parse_args()
+
+    cap = capture_reader(args.capture)
+    if args.command == "info":
+        print(f"{args.capture}: {len(cap)} rows, "
+              f"{cap.dtype.itemsize} bytes per row")
+        for c in cap.channels:
+            print(f"  {c['name']:>16} [{c['unit']}] {c['dtype']}")
+        if cap.meta:
+            print("  meta:", cap.meta)
+    else:
+        # Block by block, so the csv can be bigger than memory
+        header = True
+        with open(args.csv, "w", newline="") as f:
+            for block in cap.chunks(EXPORT_ROWS, args.start, args.stop):
+                pd.DataFrame(block).to_csv(f, index=False, header=header)
+                header = False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# Component selection optimizer for the buck stage.
+#
+# Every combination of
+#
+#   high side MOSFET x low side MOSFET     (MOS_Selection.txt, N-channel)
+#   inductor: RM core x magnet wire         (Parts Library.xlsx)
+#   input and output capacitor banks        (Parts Library.xlsx)
+#
+# is evaluated through the loss model of buck_thermal.py at the 4 corners
+# and the nominal point, and scored like the README / Optimization_PV_Buck
+# (40% nominal + 15% per corner). The search is split into one task per
+# (switching frequency, inductance), run across cores. Inside a task the
+# losses of each subsystem only depend on its own parts and the inductor
+# ripple, so choices that cost more and lose more at every operating point
+# than another choice of the same subsystem are pruned before the product
+# is formed. The result is the Pareto front of score vs. cost.
+#
+# Usage:
+#   python component_opt.py
+#   python component_opt.py --processes 4 --temp 60 --out front.csv
+
+import os
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+##################################################
+from buck_sim import load_mosfets, BODY_DIODE_VF, VOUT_NOMINAL
+from buck_thermal import loss_breakdown
+from converter_spec import OPERATING_POINTS, SCORE_WEIGHTS, DEADTIME
+##################################################
+
+PARTS_LIBRARY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "..", "..", "Parts Library.xlsx")
+
+# Design space
+FSW_OPTIONS = [50e3, 62.5e3, 76.9e3, 100e3]
+INDUCTANCE_OPTIONS = [33e-6, 47e-6, 68e-6, 82e-6, 100e-6, 150e-6]
+
+DESIGN_TEMP = 75    # MOSFET and winding temperature for the losses [C]
+
+# Constraints
+VOUT_RIPPLE_MAX = 0.12      # 1% of 12 V, p-p
+VIN_RIPPLE_MAX = 0.4        # 2% of 20 V, p-p
+IL_RIPPLE_MAX = 0.6         # fraction of the 50 W output current
+B_MAX = 0.25                # peak flux density [T]
+WINDOW_FILL = 0.5
+
+# MOSFET unit prices. The parts library has no prices for the parts in
+# MOS_Selection.txt, so these are approximate single-unit prices; library
+# prices are used instead when a part number matches.
+MOSFET_COSTS = {"IRFI1310NPbF": 1.90, "IPAN60R125PFD7S": 3.10,
+                "STB28N65M2": 2.60, "STB13N80K5": 2.40,
+                "FQPF47P06": 2.10, "STF8NK100Z": 2.90,
+                "XP6NA2R4IT": 1.60, "MCPF90N12A": 1.70,
+                "FDP4D5N10C": 2.30, "FDPF035N06B": 2.20,
+                "MCPF80P06Y": 1.50, "IPA037N08N3 G": 2.60}
+# Channel and package of the parts in MOS_Selection.txt (datasheets). The
+# board's LM5109 half-bridge driver drives two N-channel switches, so the
+# P-channel parts are left out of the search.
+MOSFET_TYPES = {"IRFI1310NPbF": ("N", "TO-220"),
+                "IPAN60R125PFD7S": ("N", "TO-220"),
+                "STB28N65M2": ("N", "D2PAK"), "STB13N80K5": ("N", "D2PAK"),
+                "FQPF47P06": ("P", "TO-220"), "STF8NK100Z": ("N", "TO-220"),
+                "XP6NA2R4IT": ("N", "TO-220"),
+                "MCPF90N12A": ("N", "TO-220"),
+                "FDP4D5N10C": ("N", "TO-220"),
+                "FDPF035N06B": ("N", "TO-220"),
+                "MCPF80P06Y": ("P", "TO-220"),
+                "IPA037N08N3 G": ("N", "TO-220")}
+# Mounting parts per switch, library prices: a TO-220 gets the heat sink
+# and a thermal pad, a D2PAK is cooled through the board copper
+SWITCH_MOUNTING = {"TO-220": ["507302B00000G", "QII-0.006-00-54"],
+                   "D2PAK": []}
+
+# Ferroxcube RM/I cores (approximate datasheet values) and the library
+# part numbers of core set, bobbin and clamp
+CORES = {
+    "RM8": {"ae": 64e-6, "ve": 2.43e-6, "mlt": 42e-3, "aw": 30e-6,
+            "parts": ["RM8/I-3C95", "B65812C1512T001", "CLI/P-RM8/I"]},
+    "RM10": {"ae": 96.6e-6, "ve": 4.31e-6, "mlt": 52e-3, "aw": 44e-6,
+             "parts": ["RM10/I-3C95", "B65814C1512T001", "CLI/P-RM10/I"]},
+    "RM12": {"ae": 146e-6, "ve": 8.34e-6, "mlt": 61e-3, "aw": 72e-6,
+             "parts": ["RM12/I-3C95", "B65816C1512T001", "CLI/P-RM12/I"]},
+}
+# Magnet wire: copper area [m^2], outer diameter [m]
+WIRES = {"18 AWG": (0.823e-6, 1.07e-3), "16 AWG": (1.31e-6, 1.34e-3),
+         "14 AWG": (2.08e-6, 1.68e-3)}
+WIRE_COST_PER_M = 0.30      # not priced in the library
+RHO_CU = 1.72e-8            # at 20 C
+
+# 3C95 Steinmetz fit, Pv = k f^a B^b [W/m^3] (~60 kW/m^3 at 100 kHz, 100 mT)
+STEINMETZ = (0.951, 1.5, 2.7)
+
+# Capacitor banks. Library part numbers, capacitance with DC bias derating,
+# and estimated ESR.
+CAPACITORS = {
+    "EL1V331MP51016U": (330e-6, 0.12),
+    "50ZLJ470M10X20": (470e-6, 0.03),
+    "C3216X5R1V226M160AC": (22e-6 * 0.5, 0.005),
+    "C1206X7R500-106KNE-CT": (10e-6 * 0.6, 0.005),
+}
+OUTPUT_BULK = [None, "EL1V331MP51016U", "50ZLJ470M10X20"]
+OUTPUT_MLCC = ("C3216X5R1V226M160AC", range(0, 7))
+INPUT_BULK = [None, "EL1V331MP51016U"]
+INPUT_MLCC = ("C1206X7R500-106KNE-CT", range(1, 9))
+
+
+##################################################
+# Parts library:
+def load_library(filename=PARTS_LIBRARY_FILE):
+    # {part number: cost} for every priced part in the library
+    sheet = pd.read_excel(filename, header=0)
+    sheet.columns = ["name", "part_no", "link", "cost"]
+    sheet = sheet.dropna(subset=["part_no", "cost"])
+    return dict(zip(sheet.part_no.astype(str).str.strip(), sheet.cost))
+
+
+def mosfet_costs(mosfets, library):
+    costs = {}
+    for name in mosfets:
+        package = MOSFET_TYPES.get(name, (None, "TO-220"))[1]
+        mount = sum(library.get(p, 0) for p in SWITCH_MOUNTING[package])
+        costs[name] = library.get(name, MOSFET_COSTS.get(name, np.nan)) \
+            + mount
+    return costs
+
+
+def n_channel(mosfets):
+    # The parts the LM5109 can drive, on either side
+    return {name: part for name, part in mosfets.items()
+            if MOSFET_TYPES.get(name, (None,))[0] == "N"}
+
+
+##################################################
+# Helpers:
+def pareto_mask(costs, losses):
+    # True for choices that no other choice beats on cost and on the loss
+    # at every operating point. costs (n,), losses (n, points)
+    c = costs[:, None] <= costs[None, :]
+    l_ = (losses[:, None, :] <= losses[None, :, :]).all(axis=-1)
+    strict = (costs[:, None] < costs[None, :]) | \
+        (losses[:, None, :] < losses[None, :, :]).any(axis=-1)
+    dominated = (c & l_ & strict).any(axis=0)
+    return ~dominated
+
+
+def front_2d(cost, score):
+    # Indices of the (min cost, max score) Pareto front, cheapest first
+    order = np.lexsort((-score, cost))
+    best = -np.inf
+    keep = []
+    for k in order:
+        if score[k] > best:
+            keep.append(k)
+            best = score[k]
+    return np.array(keep, dtype=int)
+
+
+def operating_arrays():
+    vin = np.array([p[0] for p in OPERATING_POINTS], dtype=float)
+    pout = np.array([p[1] for p in OPERATING_POINTS], dtype=float)
+    return vin, pout
+
+
+def ripple(vin, fsw, inductance):
+    duty = VOUT_NOMINAL / vin
+    return (vin - VOUT_NOMINAL) * duty / (inductance * fsw)
+
+
+class design():
+    # The attributes buck_thermal.loss_breakdown reads from a converter;
+    # part parameters may be arrays to evaluate many choices at once
+    def __init__(self, hs, ls, fsw, inductance, dcr=0.0, esr_out=0.0):
+        self.hs = hs
+        self.ls = ls
+        self.fsw = fsw
+        self.inductance = inductance
+        self.dcr = dcr
+        self.esr_out = esr_out
+        self.deadtime = DEADTIME
+        self.vf = BODY_DIODE_VF
+
+
+##################################################
+# Subsystems, each returns names, costs (n,) and losses (n, points):
+def switch_choices(mosfets, costs, fsw, inductance, temp):
+    names = [(hs, ls) for hs in mosfets for ls in mosfets]
+    keys = ["rds_on", "coss", "qrr", "tr", "tf"]
+    hs = {k: np.array([mosfets[a][k] for a, _ in names])[:, None]
+          for k in keys}
+    ls = {k: np.array([mosfets[b][k] for _, b in names])[:, None]
+          for k in keys}
+    vin, pout = operating_arrays()
+    temps = np.full((len(names), len(vin), 3), float(temp))
+    losses = loss_breakdown(design(hs, ls, fsw, inductance), vin[None, :],
+                            pout[None, :], temps, esr_in=0.0)
+    total = sum(losses[k] for k in ["cond_hs", "cond_ls", "overlap",
+                                    "coss", "qrr", "deadtime"])
+    cost = np.array([costs[a] + costs[b] for a, b in names])
+    return names, cost, total
+
+
+def inductor_choices(library, fsw, inductance, temp):
+    vin, pout = operating_arrays()
+    iout = pout / VOUT_NOMINAL
+    di = ripple(vin, fsw, inductance)
+    i_peak = (iout + di / 2).max()
+    k, a, b = STEINMETZ
+    rho = RHO_CU * (1 + 0.00393 * (temp - 20))
+    names, costs, losses = [], [], []
+    for core_name, core in CORES.items():
+        core_cost = sum(library.get(p, 0) for p in core["parts"])
+        for wire_name, (area, diameter) in WIRES.items():
+            turns = int(np.ceil(inductance * i_peak / (B_MAX * core["ae"])))
+            if turns * np.pi / 4 * diameter ** 2 > WINDOW_FILL * core["aw"]:
+                continue  # does not fit the bobbin
+            length = turns * core["mlt"]
+            dcr = rho * length / area
+            b_ac = inductance * di / (2 * turns * core["ae"])
+            core_loss = core["ve"] * k * fsw ** a * b_ac ** b
+            names.append((core_name, wire_name, turns, dcr))
+            costs.append(core_cost + WIRE_COST_PER_M * length)
+            losses.append((iout ** 2 + di ** 2 / 12) * dcr + core_loss)
+    return names, np.array(costs), np.array(losses).reshape(-1, len(vin))
+
+
+def _bank(bulk, mlcc, count):
+    c = CAPACITORS[mlcc][0] * count
+    g = count / CAPACITORS[mlcc][1]
+    if bulk is not None:
+        c += CAPACITORS[bulk][0]
+        g += 1 / CAPACITORS[bulk][1]
+    return c, (1 / g if g > 0 else np.inf)
+
+
+def capacitor_choices(library, fsw, inductance):
+    vin, pout = operating_arrays()
+    iout = pout / VOUT_NOMINAL
+    duty = VOUT_NOMINAL / vin
+    di = ripple(vin, fsw, inductance)
+    mlcc_out, counts_out = OUTPUT_MLCC
+    mlcc_in, counts_in = INPUT_MLCC
+    names, costs, losses = [], [], []
+    for bulk_out in OUTPUT_BULK:
+        for n_out in counts_out:
+            c_out, esr_out = _bank(bulk_out, mlcc_out, n_out)
+            if c_out == 0:
+                continue
+            v_out_pp = di / (8 * fsw * c_out) + di * esr_out
+            if (v_out_pp > VOUT_RIPPLE_MAX).any():
+                continue
+            for bulk_in in INPUT_BULK:
+                for n_in in counts_in:
+                    c_in, esr_in = _bank(bulk_in, mlcc_in, n_in)
+                    v_in_pp = iout * duty * (1 - duty) / (fsw * c_in) \
+                        + iout * esr_in
+                    if (v_in_pp > VIN_RIPPLE_MAX).any():
+                        continue
+                    parts = [bulk_out, bulk_in] + [mlcc_out] * n_out \
+                        + [mlcc_in] * n_in
+                    names.append((bulk_out, n_out, bulk_in, n_in))
+                    costs.append(sum(library.get(p, 0) for p in parts
+                                     if p is not None))
+                    losses.append(esr_in * iout ** 2 * duty * (1 - duty)
+                                  + esr_out * di ** 2 / 12)
+    return names, np.array(costs), np.array(losses).reshape(-1, len(vin))
+
+
+##################################################
+# Search:
+def _run_task(task):
+    fsw, inductance, temp, mosfets, mosfet_cost, library = task
+    vin, pout = operating_arrays()
+    iout = pout / VOUT_NOMINAL
+    if ripple(vin, fsw, inductance).max() > IL_RIPPLE_MAX * iout.min():
+        return pd.DataFrame()
+
+    subsystems = [switch_choices(mosfets, mosfet_cost, fsw, inductance,
+                                 temp),
+                  inductor_choices(library, fsw, inductance, temp),
+                  capacitor_choices(library, fsw, inductance)]
+    pruned = []
+    for names, cost, loss in subsystems:
+        if len(names) == 0:
+            return pd.DataFrame()
+        keep = np.flatnonzero(pareto_mask(cost, loss))
+        pruned.append(([names[k] for k in keep], cost[keep], loss[keep]))
+    (sw, sw_cost, sw_loss), (ind, ind_cost, ind_loss), \
+        (cap, cap_cost, cap_loss) = pruned
+
+    # Every surviving combination at once: (switches, inductors, caps, points)
+    loss = sw_loss[:, None, None, :] + ind_loss[None, :, None, :] \
+        + cap_loss[None, None, :, :]
+    cost = sw_cost[:, None, None] + ind_cost[None, :, None] \
+        + cap_cost[None, None, :]
+    eff = pout / (pout + loss) * 100
+    score = eff @ SCORE_WEIGHTS
+
+    idx = front_2d(cost.ravel(), score.ravel())
+    a, b, c = np.unravel_index(idx, cost.shape)
+    rows = []
+    for k, (i, j, m) in enumerate(zip(a, b, c)):
+        core, wire, turns, dcr = ind[j]
+        bulk_out, n_out, bulk_in, n_in = cap[m]
+        row = {"fsw": fsw, "L": inductance, "hs": sw[i][0], "ls": sw[i][1],
+               "core": core, "wire": wire, "turns": turns, "dcr": dcr,
+               "c_out_bulk": bulk_out, "c_out_mlcc": n_out,
+               "c_in_bulk": bulk_in, "c_in_mlcc": n_in,
+               "cost": cost[i, j, m], "score": score[i, j, m]}
+        for (v, p), e in zip(OPERATING_POINTS, eff[i, j, m]):
+            row[f"eff_{v}V_{p}W"] = e
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def optimize(processes=None, temp=DESIGN_TEMP):
+    mosfets = n_channel(load_mosfets())
+    library = load_library()
+    costs = mosfet_costs(mosfets, library)
+    mosfets = {k: v for k, v in mosfets.items() if not np.isnan(costs[k])}
+    tasks = [(fsw, inductance, temp, mosfets, costs, library)
+             for fsw in FSW_OPTIONS for inductance in INDUCTANCE_OPTIONS]
+    with multiprocessing.Pool(processes) as pool:
+        fronts = pool.map(_run_task, tasks)
+    results = pd.concat([f for f in fronts if len(f)], ignore_index=True)
+    keep = front_2d(results.cost.to_numpy(), results.score.to_numpy())
+    return results.iloc[keep].reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buck component optimizer")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--temp", type=float, default=DESIGN_TEMP,
+                        help="MOSFET temperature for the losses [C]")
+    parser.add_argument("--out", default="component_front.csv")
+    args = parser.parse_args()
+
+    front = optimize(args.processes, args.temp)
+    front.to_csv(os.path.abspath(args.out), index=False)
+    print("Pareto front (power stage cost vs. weighted efficiency score):")
+    print(front[["cost", "score", "fsw", "L", "hs", "ls", "core", "wire",
+                 "turns", "c_out_bulk", "c_out_mlcc", "c_in_bulk",
+                 "c_in_mlcc"]].to_string(index=False, float_format="%.6g"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# Design targets of the buck stage shared by the models and reports.
+#
+# The converter is scored like the README / Optimization_PV_Buck: the
+# efficiency at the nominal point (40%) and at the 4 corners (15% each).
+
+import numpy as np
+
+# Operating points (vin, pout): nominal point first, then the corners
+OPERATING_POINTS = [(20, 100), (16, 100), (24, 100), (16, 50), (24, 50)]
+SCORE_WEIGHTS = np.array([0.40, 0.15, 0.15, 0.15, 0.15])
+
+# Deadband (EPwm1Regs.DBRED / DBFED) in TBCLK cycles of 10 ns (200 MHz
+# EPWMCLK with the default /2 HSPCLKDIV), the unit of the dt settings in
+# the Efficiency_Data_* file names (dt17 = 170 ns). The firmware loads both
+# from EPWM_DEADTIME = 20 (the deadtime sweeps of Efficiency_Data_425 vary
+# DBRED around a DBFED of 20).
+DEADTIME_UNIT = 10e-9
+DEADTIME_COUNTS = 20
+DEADTIME = DEADTIME_COUNTS * DEADTIME_UNIT
@@ -0,0 +1,259 @@
+# Live view of a running sweep.
+#
+# The sweep loop hands every measured row to post(), which only appends it
+# to a deque: no lock, no pickling, no I/O, so the view never delays the
+# measurement. A forwarder thread drains the deque once per frame and sends
+# the rows in one batch over a pipe to a separate process, which owns the
+# matplotlib window and redraws at most `fps` times per second. If the
+# window is closed (or the view falls far behind), rows are dropped, never
+# the sweep. Example:
+#
+#   with live_dashboard("iv", "ivsweep") as dashboard:
+#       for point in points:
+#           ... measure ...
+#           dashboard.post({"Vout": vout, "Iout": iout, "Pout": pout})
+#
+# Views, by the columns they plot:
+#   "iv"          I-V and P-V curves (Vout, Iout, Pout)
+#   "efficiency"  Vout vs Iout and Eff vs Pout per Sweep (Sweep, Vin, ...)
+#   "replay"      Pout vs time, last REPLAY_POINTS readings (t, Pout)
+#
+# sweeps.run_plan and sweeps.profile_replay post to a dashboard passed as
+# `dashboard=`, see LIVE_VIEW in eff_sweep.py, panel_ivsweep.py and
+# mppt_step.py.
+
+import threading
+import multiprocessing
+from collections import deque
+from time import monotonic
+
+VIEW_KINDS = ["iv", "efficiency", "replay"]
+
+MAX_FPS = 5             # redraws (and batches sent) per second
+QUEUE_LEN = 100000      # rows held for the view before the oldest drop
+REPLAY_POINTS = 5000    # readings shown by the replay view
+STOP_TIMEOUT = 2        # seconds to wait for the view process to exit
+
+
+##################################################
+# Acquisition side:
+class live_dashboard():
+    def __init__(self, kind, title="", fps=MAX_FPS, maxlen=QUEUE_LEN):
+        if kind not in VIEW_KINDS:
+            raise ValueError(f"View kind must be one of {VIEW_KINDS}")
+        self.kind = kind
+        self.title = title
+        self.fps = fps
+        self.pending = deque(maxlen=maxlen)
+        self.dropped = 0
+        self.closed = False     # view process gone, rows are discarded
+
+        self.send = None
+        self.process = None
+        self.forwarder = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        # Spawn (as on Windows) so the view gets a fresh matplotlib and no
+        # copy of the instrument sessions
+        ctx = multiprocessing.get_context("spawn")
+        recv, self.send = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=_render,
+                                   args=(recv, self.kind, self.title,
+                                         self.fps),
+                                   daemon=True)
+        self.process.start()
+        recv.close()
+        self.stopped.clear()
+        self.forwarder = threading.Thread(target=self._forward, daemon=True)
+        self.forwarder.start()
+
+    def post(self, row):
+        # Called from the sweep loop
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(row)
+
+    def stop(self):
+        self.stopped.set()
+        if self.forwarder is not None:
+            self.forwarder.join()
+        self._send(None)        # end of data, the view exits
+        if self.send is not None:
+            self.send.close()
+        if self.process is not None:
+            self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.dropped:
+            print(f"Live view dropped {self.dropped} rows")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _forward(self):
+        while not self.stopped.wait(1 / self.fps):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.pending.popleft())
+            except IndexError:
+                break
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        if self.closed or self.send is None:
+            return
+        try:
+            self.send.send(batch)
+        except (BrokenPipeError, EOFError, OSError):
+            # Window closed, keep the sweep going without it
+            self.closed = True
+
+
+##################################################
+# View process:
+def _render(conn, kind, title, fps):
+    from matplotlib import pyplot as plt
+
+    plt.ion()
+    fig, update = VIEWS[kind]()
+    fig.suptitle(title, fontweight="bold")
+    plt.tight_layout()
+    plt.show(block=False)
+
+    last_draw = 0
+    dirty = False
+    done = False
+    while not done and plt.fignum_exists(fig.number):
+        # Take everything that arrives until the next frame is due
+        wait = 1 / fps
+        if dirty:
+            wait = max(0, last_draw + 1 / fps - monotonic())
+        while conn.poll(wait):
+            wait = 0
+            try:
+                batch = conn.recv()
+            except EOFError:
+                batch = None
+            if batch is None:
+                done = True
+                break
+            update(batch)
+            dirty = True
+        if dirty and (done or monotonic() >= last_draw + 1 / fps):
+            fig.canvas.draw_idle()
+            last_draw = monotonic()
+            dirty = False
+        fig.canvas.flush_events()
+    conn.close()
+
+
+def _rescale(*axes):
+    for ax in axes:
+        ax.relim()
+        ax.autoscale_view()
+
+
+def _iv_view():
+    from matplotlib import pyplot as plt
+
+    fig, axV = plt.subplots(figsize=(10, 6))
+    axP = axV.twinx()
+    axV.set_xlabel('Voltage [V]')
+    axV.set_ylabel('Current [A]', color='tab:blue')
+    axP.set_ylabel('Power [W]', color='tab:red')
+    axV.tick_params(axis='y', labelcolor='tab:blue')
+    axP.tick_params(axis='y', labelcolor='tab:red')
+    lineI, = axV.plot([], [], 'o-', color='tab:blue')
+    lineP, = axP.plot([], [], 'o-', color='tab:red')
+    points = []
+
+    def update(rows):
+        points.extend((r["Vout"], r["Iout"], r["Pout"]) for r in rows)
+        points.sort()
+        v, i, p = zip(*points)
+        lineI.set_data(v, i)
+        lineP.set_data(v, p)
+        _rescale(axV, axP)
+        k = max(range(len(p)), key=p.__getitem__)
+        axV.set_title(f"{len(points)} points, max power {p[k]:.1f} W "
+                      f"at {v[k]:.1f} V")
+
+    return fig, update
+
+
+def _efficiency_view():
+    from matplotlib import pyplot as plt
+
+    fig, ax = plt.subplots(1, 2, figsize=(10, 6))
+    vax = ax[0]     # Vout vs Iout axis
+    effax = ax[1]   # Eff vs Pout axis
+    vax.set_xlabel("Output Current [A]")
+    vax.set_ylabel("Output Voltage [V]")
+    vax.set_title("Voltage across load sweep")
+    effax.set_xlabel("Output power [W]")
+    effax.set_ylabel("Efficiency [%]")
+    effax.set_title("Efficiency across load sweep")
+    sweeps = {}     # Sweep -> (Vout line, Eff line, rows)
+
+    def update(rows):
+        for r in rows:
+            if r["Sweep"] not in sweeps:
+                label = f"Vin = {r['Vin'] :.1f} V"
+                lineV, = vax.plot([], [], 'o-', linewidth=2, label=label)
+                lineE, = effax.plot([], [], 'o-', linewidth=2, label=label)
+                sweeps[r["Sweep"]] = (lineV, lineE, [])
+                vax.legend()
+                effax.legend()
+            sweeps[r["Sweep"]][2].append(r)
+        for lineV, lineE, res in sweeps.values():
+            # In increasing load, like plot_efficiency
+            res.sort(key=lambda r: r["Iout"])
+            lineV.set_data([r["Iout"] for r in res],
+                           [r["Vout"] for r in res])
+            lineE.set_data([r["Pout"] for r in res],
+                           [r["Eff"] for r in res])
+        _rescale(vax, effax)
+
+    return fig, update
+
+
+def _replay_view():
+    from matplotlib import pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.set_xlabel("Time [s]")
+    ax.set_ylabel("Output power [W]")
+    line, = ax.plot([], [], color='tab:red')
+    points = deque(maxlen=REPLAY_POINTS)
+    total = {"sum": 0.0, "count": 0, "t0": None}
+
+    def update(rows):
+        if total["t0"] is None:
+            total["t0"] = rows[0]["t"]
+        for r in rows:
+            points.append((r["t"] - total["t0"], r["Pout"]))
+            total["sum"] += r["Pout"]
+            total["count"] += 1
+        t, p = zip(*points)
+        line.set_data(t, p)
+        _rescale(ax)
+        ax.set_title(f"Avg power = {total['sum'] / total['count']:.2f} W")
+
+    return fig, update
+
+
+VIEWS = {"iv": _iv_view,
+         "efficiency": _efficiency_view,
+         "replay": _replay_view}
@@ -0,0 +1,194 @@
+# Efficiency maps from the measured effsweep grids.
+#
+# Each effsweep*.csv is a Vin x Pout grid (5 x 5 with eff_sweep.py). This
+# builds a smooth bicubic Hermite interpolant per file (C1 across cells,
+# derivatives from finite differences on the grid) and serves vectorized
+# lookups: a query is a cell search plus one 4x4 polynomial evaluation, so
+# millions of (Vin, Pout) points take well under a second.
+#
+# Pout is the nominal output power of the point (eload current x 12 V, the
+# eff_sweep.py setpoint). Queries outside the measured grid return nan
+# unless clip=True.
+#
+# The patch coefficients are cached on disk, keyed by the SHA-256 of the
+# csv, so a map is only rebuilt when its file changes:
+#
+#   emap = load_map("Efficiency_Data_425/effsweep100khz.csv")
+#   eff = emap(vin_array, pout_array)      # [%]
+#
+# Usage:
+#   python eff_map.py effsweep.csv --vin 19 --pout 80
+#   python eff_map.py Efficiency_Data_425/*.csv --bench
+
+import os
+import hashlib
+import argparse
+from time import perf_counter
+import numpy as np
+import pandas as pd
+##################################################
+
+VOUT_NOMINAL = 12
+POWER_RESOLUTION = 0.5      # nominal powers are rounded to this [W]
+# Measured Vin is snapped to the setpoint before the grid is formed, so
+# readings of one setpoint land in one row and datasets share one grid
+VIN_RESOLUTION = 0.5
+
+CACHE_DIRNAME = ".effmap_cache"
+CACHE_VERSION = 2
+
+# Hermite basis: [p0, p1, m0, m1] -> cubic coefficients [1, t, t^2, t^3]
+HERMITE = np.array([[1, 0, 0, 0],
+                    [0, 0, 1, 0],
+                    [-3, 3, -2, -1],
+                    [2, -2, 1, 1]], dtype=float)
+
+
+##################################################
+# Grid from a csv:
+def grid_from_csv(filename):
+    # Returns vin (nx,), pout (ny,), eff (nx, ny) [%]. Repeated sweeps of
+    # the same point are averaged.
+    data = pd.read_csv(filename)
+    pout = np.round(data.Iout * VOUT_NOMINAL / POWER_RESOLUTION) \
+        * POWER_RESOLUTION
+    vin = np.round(data.Vin / VIN_RESOLUTION) * VIN_RESOLUTION
+    grid = data.assign(Vnom=vin, Pnom=pout).pivot_table(
+        index="Vnom", columns="Pnom", values="Eff", aggfunc="mean")
+    if grid.isna().any().any():
+        raise ValueError(f"{filename}: the sweep is not a full Vin x Pout "
+                         f"grid")
+    return (grid.index.to_numpy(float), grid.columns.to_numpy(float),
+            grid.to_numpy(float))
+
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+##################################################
+# Interpolant:
+class efficiency_map():
+    def __init__(self, x, y, coef):
+        self.x = x          # Vin nodes (nx,)
+        self.y = y          # Pout nodes (ny,)
+        self.coef = coef    # (nx - 1, ny - 1, 4, 4) patch coefficients
+
+    @classmethod
+    def fromGrid(cls, x, y, f):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        f = np.asarray(f, dtype=float)
+        # Second-order differences, also at the edges
+        fx, fy = np.gradient(f, x, y, edge_order=2)
+        fxy = np.gradient(fx, y, axis=1, edge_order=2)
+        hx = np.diff(x)[:, None]
+        hy = np.diff(y)[None, :]
+
+        # Node data of each cell, scaled to the unit square
+        def corners(a):
+            return a[:-1, :-1], a[:-1, 1:], a[1:, :-1], a[1:, 1:]
+        f00, f01, f10, f11 = corners(f)
+        x00, x01, x10, x11 = (c * hx for c in corners(fx))
+        y00, y01, y10, y11 = (c * hy for c in corners(fy))
+        c00, c01, c10, c11 = (c * hx * hy for c in corners(fxy))
+        g = np.stack([np.stack([f00, f01, y00, y01], -1),
+                      np.stack([f10, f11, y10, y11], -1),
+                      np.stack([x00, x01, c00, c01], -1),
+                      np.stack([x10, x11, c10, c11], -1)], -2)
+        coef = HERMITE @ g @ HERMITE.T
+        return cls(x, y, coef)
+
+    def __call__(self, vin, pout, clip=False):
+        vin = np.asarray(vin, dtype=float)
+        pout = np.asarray(pout, dtype=float)
+        vin, pout = np.broadcast_arrays(vin, pout)
+        x, y = self.x, self.y
+        u = np.clip(vin, x[0], x[-1]) if clip else vin
+        v = np.clip(pout, y[0], y[-1]) if clip else pout
+        i = np.clip(np.searchsorted(x, u, side="right") - 1, 0, len(x) - 2)
+        j = np.clip(np.searchsorted(y, v, side="right") - 1, 0, len(y) - 2)
+        s = (u - x[i]) / (x[i + 1] - x[i])
+        t = (v - y[j]) / (y[j + 1] - y[j])
+
+        # Horner in t for each power of s, then in s
+        a = self.coef[i, j]
+        rows = ((a[..., 3] * t[..., None] + a[..., 2]) * t[..., None]
+                + a[..., 1]) * t[..., None] + a[..., 0]
+        out = ((rows[..., 3] * s + rows[..., 2]) * s + rows[..., 1]) * s \
+            + rows[..., 0]
+        if not clip:
+            outside = (vin < x[0]) | (vin > x[-1]) | (pout < y[0]) \
+                | (pout > y[-1])
+            out = np.where(outside, np.nan, out)
+        return out
+
+    def save(self, filename):
+        np.savez(filename, version=CACHE_VERSION, x=self.x, y=self.y,
+                 coef=self.coef)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        if int(data["version"]) != CACHE_VERSION:
+            raise ValueError("stale cache version")
+        return cls(data["x"], data["y"], data["coef"])
+
+
+##################################################
+# Cache:
+def load_map(filename, cache_dir=None):
+    # Interpolant for one effsweep csv, from the disk cache when the file
+    # is unchanged
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)),
+                                 CACHE_DIRNAME)
+    cached = os.path.join(cache_dir, f"{file_hash(filename)}.npz")
+    if os.path.exists(cached):
+        try:
+            return efficiency_map.load(cached)
+        except (ValueError, KeyError, OSError):
+            pass  # rebuild below
+    emap = efficiency_map.fromGrid(*grid_from_csv(filename))
+    os.makedirs(cache_dir, exist_ok=True)
+    emap.save(cached)
+    return emap
+
+
+def load_maps(filenames, cache_dir=None):
+    # {dataset name: efficiency_map}, named after the csv file
+    return {os.path.splitext(os.path.basename(f))[0]: load_map(f, cache_dir)
+            for f in filenames}
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(description="Efficiency map lookups")
+    parser.add_argument("files", nargs="+", help="effsweep csv files")
+    parser.add_argument("--vin", type=float, nargs="+", default=[20])
+    parser.add_argument("--pout", type=float, nargs="+", default=[100])
+    parser.add_argument("--bench", action="store_true",
+                        help="time 1e6 random lookups per map")
+    args = parser.parse_args()
+
+    maps = load_maps(args.files)
+    vin, pout = np.meshgrid(args.vin, args.pout, indexing="ij")
+    for name, emap in maps.items():
+        print(f"{name}:")
+        for v, p, e in zip(vin.ravel(), pout.ravel(), emap(vin, pout).ravel()):
+            print(f"  Vin {v:5.1f} V, Pout {p:6.1f} W: {e:6.2f} %")
+        if args.bench:
+            rng = np.random.default_rng(0)
+            qv = rng.uniform(emap.x[0], emap.x[-1], 1_000_000)
+            qp = rng.uniform(emap.y[0], emap.y[-1], 1_000_000)
+            t0 = perf_counter()
+            emap(qv, qp)
+            rate = len(qv) / (perf_counter() - t0)
+            print(f"  {rate / 1e6:.1f} M lookups/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# Comparison report across efficiency datasets.
+#
+# Loads every effsweep csv (in parallel), parses the configuration from the
+# file name (switching frequency, deadtime rise/fall, gate resistance,
+# 2/4-wire sense, reruns) or from a <name>.json sidecar next to the csv,
+# and writes to the report directory:
+#
+#   datasets/<name>.png     efficiency map of each dataset
+#   summary.csv             every point of every dataset, with the delta to
+#                           the baseline and the best dataset per point
+#   scores.csv              weighted score per dataset (README weighting)
+#   report.png              multi-panel comparison
+#
+# Per-dataset work is only redone for files whose content changed since
+# the last run (manifest.json keeps the file hashes).
+#
+# Usage:
+#   python eff_report.py                               (all datasets)
+#   python eff_report.py Efficiency_Data_425/*.csv --baseline 425/effsweep100khz
+
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib import pyplot as plt
+##################################################
+from eff_map import grid_from_csv, file_hash
+from converter_spec import OPERATING_POINTS, SCORE_WEIGHTS, DEADTIME_UNIT
+##################################################
+
+script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+DEFAULT_PATTERNS = ["*effsweep*.csv", "Efficiency_Data_*/*.csv"]
+REPORT_DIRNAME = "efficiency_report"
+MANIFEST = "manifest.json"
+
+
+##################################################
+# Configuration from file names:
+def dataset_name(path):
+    # "Efficiency_Data_425/effsweep100khz.csv" -> "425/effsweep100khz"
+    folder = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    m = re.match(r"Efficiency_Data_(\w+)", folder)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{m.group(1)}/{stem}" if m else stem
+
+
+def parse_config(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    config = {"session": dataset_name(path).split("/")[0]
+              if "/" in dataset_name(path) else None,
+              "fsw_khz": None, "dt_rise_ns": None, "dt_fall_ns": None,
+              "gate_ohm": None, "sense": None, "rerun": False}
+    rest = stem.replace("effsweep", "", 1)
+
+    m = re.match(r"([24])_wire_", stem)
+    if m:
+        config["sense"] = f"{m.group(1)}-wire"
+    m = re.search(r"(\d+(?:\.\d+)?)khz", rest)
+    if m:
+        config["fsw_khz"] = float(m.group(1))
+        rest = rest.replace(m.group(0), "")
+    if rest.endswith("_re"):
+        config["rerun"] = True
+        rest = rest[:-3]
+    m = re.search(r"GR(\d+)|(\d+)R(?=dt)", rest)
+    if m:
+        config["gate_ohm"] = float(m.group(1) or m.group(2))
+        rest = rest.replace(m.group(0), "")
+    # dt1420 / 1720: rise and fall; dt17 / 17dt: both
+    m = re.search(r"dt(\d{2})(\d{2})|^(\d{2})(\d{2})$", rest)
+    if m:
+        rise, fall = (m.group(1), m.group(2)) if m.group(1) else \
+            (m.group(3), m.group(4))
+        config["dt_rise_ns"] = int(rise) * DEADTIME_UNIT * 1e9
+        config["dt_fall_ns"] = int(fall) * DEADTIME_UNIT * 1e9
+    else:
+        m = re.search(r"dt(\d{2})|(\d{2})dt", rest)
+        if m:
+            dt = int(m.group(1) or m.group(2)) * DEADTIME_UNIT * 1e9
+            config["dt_rise_ns"] = config["dt_fall_ns"] = dt
+
+    sidecar = os.path.splitext(path)[0] + ".json"
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            config.update(json.load(f))
+    return config
+
+
+##################################################
+# Per-dataset stage (runs in the worker processes):
+def _process(task):
+    path, out_dir = task
+    name = dataset_name(path)
+    try:
+        vin, pout, eff = grid_from_csv(path)
+    except (ValueError, KeyError) as e:
+        return {"name": name, "error": str(e)}
+    config = parse_config(path)
+
+    # Efficiency map of this dataset
+    fig, ax = plt.subplots(figsize=(5, 4))
+    im = ax.imshow(eff.T, origin="lower", aspect="auto", cmap="viridis",
+                   extent=[vin[0], vin[-1], pout[0], pout[-1]])
+    for i, v in enumerate(vin):
+        for j, p in enumerate(pout):
+            ax.text(v, p, f"{eff[i, j]:.2f}", ha="center", va="center",
+                    fontsize=7, color="w")
+    fig.colorbar(im, ax=ax, label="Efficiency [%]")
+    ax.set_xlabel("Vin [V]")
+    ax.set_ylabel("Pout [W]")
+    ax.set_title(name)
+    fig.tight_layout()
+    filename = os.path.join(out_dir, "datasets", name.replace("/", "_"))
+    fig.savefig(filename + ".png")
+    plt.close(fig)
+
+    np.savez(filename + ".npz", vin=vin, pout=pout, eff=eff)
+    with open(filename + ".json", "w") as f:
+        json.dump(config, f)
+    return {"name": name}
+
+
+def load_datasets(paths, out_dir, processes=None, force=False):
+    # {name: {"path", "config", "vin", "pout", "eff"}}, redoing the
+    # per-dataset stage only for new or changed files
+    os.makedirs(os.path.join(out_dir, "datasets"), exist_ok=True)
+    manifest_file = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    hashes = {path: file_hash(path) for path in paths}
+    changed = [p for p in paths if manifest.get(dataset_name(p)) != hashes[p]]
+    if changed:
+        print(f"Processing {len(changed)} of {len(paths)} datasets")
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_process, [(p, out_dir) for p in changed])
+        for path, result in zip(changed, results):
+            if "error" in result:
+                print(f"  skipped {result['name']}: {result['error']}")
+                manifest.pop(result["name"], None)
+            else:
+                manifest[result["name"]] = hashes[path]
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+    datasets = {}
+    for path in paths:
+        name = dataset_name(path)
+        if manifest.get(name) != hashes[path]:
+            continue
+        filename = os.path.join(out_dir, "datasets", name.replace("/", "_"))
+        data = np.load(filename + ".npz")
+        with open(filename + ".json") as f:
+            config = json.load(f)
+        datasets[name] = {"path": path, "config": config, "vin": data["vin"],
+                          "pout": data["pout"], "eff": data["eff"]}
+    return datasets
+
+
+##################################################
+# Comparison:
+def summarize(datasets, baseline):
+    rows = []
+    for name, d in datasets.items():
+        vin, pout = np.meshgrid(d["vin"], d["pout"], indexing="ij")
+        rows.append(pd.DataFrame({"dataset": name, "Vin": vin.ravel(),
+                                  "Pout": pout.ravel(),
+                                  "Eff": d["eff"].ravel()}))
+    summary = pd.concat(rows, ignore_index=True)
+
+    base = summary[summary.dataset == baseline][["Vin", "Pout", "Eff"]]
+    summary = summary.merge(base.rename(columns={"Eff": "Eff_baseline"}),
+                            on=["Vin", "Pout"], how="left")
+    summary["Delta"] = summary.Eff - summary.Eff_baseline
+    best = summary.loc[summary.groupby(["Vin", "Pout"]).Eff.idxmax(),
+                       ["Vin", "Pout", "dataset"]]
+    summary = summary.merge(best.rename(columns={"dataset": "Best"}),
+                            on=["Vin", "Pout"])
+    summary["IsBest"] = summary.dataset == summary.Best
+    return summary
+
+
+def scores(datasets, summary):
+    # README weighting over the 4 corners and the nominal point
+    rows = []
+    for name, d in datasets.items():
+        s = summary[summary.dataset == name].set_index(["Vin", "Pout"]).Eff
+        points = [s.get((float(v), float(p)), np.nan)
+                  for v, p in OPERATING_POINTS]
+        row = {"dataset": name, "score": float(np.dot(points, SCORE_WEIGHTS)),
+               "mean_eff": s.mean(),
+               "best_points": int(summary[summary.dataset == name]
+                                  .IsBest.sum())}
+        row.update(d["config"])
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values("score", ascending=False)
+
+
+def render(datasets, summary, score_table, baseline, filename):
+    fig, axs = plt.subplots(2, 2, figsize=(16, 11))
+
+    # Score per dataset
+    ax = axs[0, 0]
+    st = score_table.iloc[::-1]
+    ax.barh(st.dataset, st.score)
+    ax.set_xlim(np.nanmin(st.score) - 0.5, np.nanmax(st.score) + 0.2)
+    ax.set_xlabel("Score [%] (40% nominal, 15% per corner)")
+    ax.tick_params(axis="y", labelsize=7)
+
+    # Efficiency vs. Pout at the nominal input
+    ax = axs[0, 1]
+    nominal_vin = OPERATING_POINTS[0][0]
+    for name, group in summary[summary.Vin == nominal_vin].groupby("dataset"):
+        ax.plot(group.Pout, group.Eff, ".-", label=name,
+                lw=2.5 if name == baseline else 1)
+    ax.set_xlabel("Pout [W]")
+    ax.set_ylabel("Efficiency [%]")
+    ax.set_title(f"Vin = {nominal_vin} V")
+    ax.legend(fontsize=6, ncol=2)
+
+    # Best dataset per operating point
+    ax = axs[1, 0]
+    best = summary[summary.IsBest]
+    pivot = best.pivot_table(index="Pout", columns="Vin", values="Eff")
+    labels = best.pivot(index="Pout", columns="Vin", values="Best")
+    ax.imshow(pivot.to_numpy(), origin="lower", aspect="auto", cmap="viridis")
+    for i in range(pivot.shape[0]):
+        for j in range(pivot.shape[1]):
+            ax.text(j, i, f"{labels.iat[i, j]}\n{pivot.iat[i, j]:.2f}",
+                    ha="center", va="center", fontsize=6, color="w")
+    ax.set_xticks(range(pivot.shape[1]), pivot.columns)
+    ax.set_yticks(range(pivot.shape[0]), pivot.index)
+    ax.set_xlabel("Vin [V]")
+    ax.set_ylabel("Pout [W]")
+    ax.set_title("Best dataset per point")
+
+    # Delta to the baseline, range over the grid per dataset
+    ax = axs[1, 1]
+    delta = summary.groupby("dataset").Delta.agg(["min", "mean", "max"])
+    delta = delta.loc[score_table.dataset[::-1]]
+    y = np.arange(len(delta))
+    ax.hlines(y, delta["min"], delta["max"], color="0.6")
+    ax.plot(delta["mean"], y, "o")
+    ax.axvline(0, color="k", lw=0.8)
+    ax.set_yticks(y, delta.index, fontsize=7)
+    ax.set_xlabel(f"Efficiency delta to {baseline} [%-points] (min/mean/max)")
+
+    fig.tight_layout()
+    fig.savefig(filename, dpi=120)
+    plt.close(fig)
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare efficiency datasets")
+    parser.add_argument("files", nargs="*",
+                        help="effsweep csv files (default: all in this "
+                             "directory and Efficiency_Data_*)")
+    parser.add_argument("--baseline", default=None,
+                        help="dataset name to compute deltas against "
+                             "(default: the best scoring one)")
+    parser.add_argument("--out-dir", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--force", action="store_true",
+                        help="redo every dataset")
+    args = parser.parse_args()
+
+    paths = args.files
+    if not paths:
+        paths = sorted(p for pattern in DEFAULT_PATTERNS
+                       for p in glob.glob(os.path.join(script_directory,
+                                                       pattern)))
+    out_dir = args.out_dir or os.path.join(script_directory, REPORT_DIRNAME)
+
+    datasets = load_datasets(paths, out_dir, args.processes, args.force)
+    if not datasets:
+        sys.exit("No complete efficiency grids found")
+
+    baseline = args.baseline
+    if baseline is None:
+        summary = summarize(datasets, next(iter(datasets)))
+        baseline = scores(datasets, summary).dataset.iloc[0]
+    summary = summarize(datasets, baseline)
+    score_table = scores(datasets, summary)
+
+    summary.to_csv(os.path.join(out_dir, "summary.csv"), index=False)
+    score_table.to_csv(os.path.join(out_dir, "scores.csv"), index=False)
+    render(datasets, summary, score_table, baseline,
+           os.path.join(out_dir, "report.png"))
+
+    print(f"Baseline: {baseline}")
+    print(score_table[["dataset", "score", "mean_eff", "best_points",
+                       "fsw_khz", "dt_rise_ns", "dt_fall_ns"]]
+          .to_string(index=False, float_format="%.3f"))
+    print(f"Report written to {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
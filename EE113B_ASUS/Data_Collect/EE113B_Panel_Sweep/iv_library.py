@@ -0,0 +1,289 @@
+# Library of measured IV curves, indexed by irradiance and temperature.
+#
+# Measured curves (panel_ivsweep.py / run_sweep.py csvs) are stored keyed by
+# (g, temperature), with g the irradiance normalized to the panel's rating
+# like the levels in mppt_profile.csv. If not given, g is taken from the
+# curve's short-circuit current: ivsweep_full.csv -> 1.0,
+# ivsweep_half.csv -> 0.5.
+#
+# A curve at any other level is built from the measured ones:
+#   - between two measured levels, by interpolating corresponding points of
+#     the two curves (IEC 60891 procedure 3): both curves are resampled at
+#     the same fractions of their arc length in (V/VOC, I/ISC), so knee
+#     meets knee, and each point moves linearly with g
+#   - outside the measured levels, from the nearest measured curve, with
+#     its current scaled and its voltage shifted by what the single-diode
+#     model (pv_model.pv_panel) fitted to it predicts for the change in g,
+#     so curves stay continuous across the measured edges
+#   - between two measured temperatures the same way along the temperature;
+#     temperatures outside the measured ones use the nearest
+#
+# Each level is turned into a dense lookup table (current on a uniform
+# voltage grid) once, and the last CACHE_SIZE tables are kept in an LRU
+# cache. Levels are rounded to G_RESOLUTION, so a smoothly varying
+# irradiance reuses tables. current(v, g) and mpp(g) work like pv_panel's,
+# so the library can stand in for the model in mppt_sim.py (--iv-library).
+#
+# Usage:
+#   python iv_library.py build iv_library.npz ivsweep_full.csv ivsweep_half.csv
+#   python iv_library.py show iv_library.npz --levels 0.5 0.625 0.75 1
+#   python iv_library.py table iv_library.npz 0.625 --out iv_0625.csv
+
+import argparse
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+##################################################
+from pv_model import pv_panel, PV_ISC
+##################################################
+
+TEMP_REF = 25           # [degC] temperature of curves added without one
+G_RESOLUTION = 0.001    # levels are rounded to this before the table lookup
+TEMP_RESOLUTION = 0.1   # [degC]
+RESAMPLE_POINTS = 256   # points per curve for the interpolation
+TABLE_POINTS = 2048     # voltage grid points per lookup table
+CACHE_SIZE = 256        # lookup tables kept
+MIN_CURRENT = 0.05      # [A] curves need a short-circuit current above this
+VOC_MARGIN = 1.3        # model curves are searched for VOC up to this x voc
+
+
+##################################################
+# Helpers:
+def _resample(v, i, num=RESAMPLE_POINTS):
+    # Curve (V increasing) -> num points at equal fractions of its arc
+    # length in normalized (V/VOC, I/ISC) coordinates
+    voc = max(v[-1], 1e-9)
+    isc = max(i.max(), 1e-9)
+    step = np.hypot(np.diff(v) / voc, np.diff(i) / isc)
+    s = np.concatenate([[0], np.cumsum(step)])
+    keep = np.concatenate([[True], step > 0])
+    s = s[keep] / max(s[-1], 1e-12)
+    u = np.linspace(0, 1, num)
+    return np.interp(u, s, v[keep]), np.interp(u, s, i[keep])
+
+
+def _model_curve(panel, g, num=RESAMPLE_POINTS):
+    # Resampled curve of a pv_panel at level g, up to its VOC
+    v = np.linspace(0, panel.voc * VOC_MARGIN, TABLE_POINTS)
+    i = panel.current(v, g)
+    end = np.argmax(i <= 0) if (i <= 0).any() else len(v) - 1
+    return _resample(v[:end + 1], np.maximum(i[:end + 1], 0), num)
+
+
+def _blend(curve1, curve2, alpha):
+    # Point-wise linear interpolation between two resampled curves
+    return (curve1[0] + alpha * (curve2[0] - curve1[0]),
+            curve1[1] + alpha * (curve2[1] - curve1[1]))
+
+
+def _bracket(values, x):
+    # Neighbors of x in sorted values and the interpolation weight
+    k = np.searchsorted(values, x)
+    if k == 0:
+        return values[0], values[0], 0.0
+    if k == len(values):
+        return values[-1], values[-1], 0.0
+    lo, hi = values[k - 1], values[k]
+    return lo, hi, (x - lo) / (hi - lo)
+
+
+##################################################
+class iv_library():
+
+    def __init__(self, cache_size=CACHE_SIZE, table_points=TABLE_POINTS):
+        self.curves = {}    # (g, temp) -> (v, i), V increasing
+        self.models = {}    # (g, temp) -> pv_panel fitted to that curve
+        self.table_points = table_points
+        self.table = lru_cache(maxsize=cache_size)(self._table)
+
+    ##############################################
+    # Measured curves:
+    def add(self, v, i, g=None, temp=TEMP_REF):
+        v = np.asarray(v, dtype=float)
+        i = np.asarray(i, dtype=float)
+        order = np.argsort(v)
+        v, i = v[order], i[order]
+        if i.max() < MIN_CURRENT:
+            raise ValueError("IV curve has no short-circuit current")
+        if g is None:
+            g = i.max() / PV_ISC
+        key = (round(float(g), 3), round(float(temp), 1))
+        self.curves[key] = (v, i)
+        self.models.pop(key, None)
+        self.table.cache_clear()
+        return key
+
+    def addCsv(self, filename, g=None, temp=TEMP_REF):
+        # csv with Vout, Iout columns, as saved by panel_ivsweep.py
+        data = pd.read_csv(filename)
+        return self.add(data["Vout"], data["Iout"], g, temp)
+
+    def levels(self):
+        return sorted(self.curves)
+
+    def save(self, filename):
+        arrays = {}
+        for n, ((g, temp), (v, i)) in enumerate(sorted(self.curves.items())):
+            arrays[f"key_{n}"] = np.array([g, temp])
+            arrays[f"v_{n}"] = v
+            arrays[f"i_{n}"] = i
+        np.savez_compressed(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename, **kwargs):
+        library = cls(**kwargs)
+        with np.load(filename) as data:
+            n = 0
+            while f"key_{n}" in data:
+                g, temp = data[f"key_{n}"]
+                library.add(data[f"v_{n}"], data[f"i_{n}"], g, temp)
+                n += 1
+        return library
+
+    ##############################################
+    # Curves at any level:
+    def _model(self, key):
+        if key not in self.models:
+            self.models[key] = pv_panel.fit(*self.curves[key])
+        return self.models[key]
+
+    def _at_temp(self, g, temp):
+        # Resampled curve at level g from the curves measured at temp
+        gs = np.array(sorted(k[0] for k in self.curves if k[1] == temp))
+        if gs[0] <= g <= gs[-1]:
+            lo, hi, alpha = _bracket(gs, g)
+            curve = _resample(*self.curves[(lo, temp)])
+            if alpha > 0:
+                curve = _blend(curve, _resample(*self.curves[(hi, temp)]),
+                               alpha)
+            return curve
+        # Outside the measured levels: the nearest measured curve, moved by
+        # what the model fitted to it predicts between the two levels
+        # (IEC 60891 style), so the library stays continuous at the edge
+        # even though the fit is off by a few 0.1 A. Corresponding points:
+        # current scaled by the ISC ratio, voltage shifted by the model's
+        # voltage change.
+        near = gs[0] if g < gs[0] else gs[-1]
+        panel = self._model((near, temp))
+        v, i = _resample(*self.curves[(near, temp)])
+        model_near = _model_curve(panel, 1.0)
+        model_g = _model_curve(panel, g / near)
+        v = np.maximum(v + model_g[0] - model_near[0], 0)
+        i = i * model_g[1][0] / model_near[1][0]
+        return v, i
+
+    def curve(self, g=1.0, temp=TEMP_REF):
+        # (v, i) of the curve at level g and temperature temp
+        if not self.curves:
+            raise ValueError("IV library is empty")
+        temps = np.array(sorted({k[1] for k in self.curves}))
+        lo, hi, beta = _bracket(temps, temp)
+        curve = self._at_temp(g, lo)
+        if beta > 0:
+            curve = _blend(curve, self._at_temp(g, hi), beta)
+        return curve
+
+    def _table(self, g, temp):
+        # Dense table: current on a uniform voltage grid up to VOC, as
+        # read-only arrays shared through the cache
+        if g <= 0:
+            v = np.linspace(0, self.voc, self.table_points)
+            i = np.zeros_like(v)
+        else:
+            cv, ci = self.curve(g, temp)
+            cv = np.maximum.accumulate(cv)
+            v = np.linspace(0, cv[-1], self.table_points)
+            i = np.interp(v, cv, ci)
+        v.flags.writeable = False
+        i.flags.writeable = False
+        return v, i
+
+    def lookup(self, g=1.0, temp=TEMP_REF):
+        # Cached table of the level g is rounded to
+        g = round(round(float(g) / G_RESOLUTION) * G_RESOLUTION, 6)
+        temp = round(round(float(temp) / TEMP_RESOLUTION) * TEMP_RESOLUTION,
+                     6)
+        return self.table(g, temp)
+
+    ##############################################
+    # Same interface as pv_model.pv_panel:
+    @property
+    def voc(self):
+        # VOC of the curve at g = 1
+        return self.curve(1.0, TEMP_REF)[0][-1]
+
+    def current(self, v, g=1.0, temp=TEMP_REF):
+        v = np.asarray(v, dtype=float)
+        g = np.asarray(g, dtype=float)
+        if g.ndim == 0:
+            return np.interp(v, *self.lookup(g, temp))
+        v, g = np.broadcast_arrays(v, g)
+        i = np.empty(v.shape)
+        levels = np.round(g / G_RESOLUTION) * G_RESOLUTION
+        for level in np.unique(levels):
+            mask = levels == level
+            i[mask] = np.interp(v[mask], *self.lookup(level, temp))
+        return i
+
+    def power(self, v, g=1.0, temp=TEMP_REF):
+        return np.asarray(v, dtype=float) * self.current(v, g, temp)
+
+    def mpp(self, g=1.0, temp=TEMP_REF):
+        # Maximum power point (vmpp, pmpp) for each irradiance in g
+        g = np.atleast_1d(np.asarray(g, dtype=float))
+        vmpp = np.empty(len(g))
+        pmpp = np.empty(len(g))
+        for n, level in enumerate(g):
+            v, i = self.lookup(level, temp)
+            k = np.argmax(v * i)
+            vmpp[n], pmpp[n] = v[k], v[k] * i[k]
+        return vmpp, pmpp
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(description="IV curve library")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build a library from ivsweep csvs")
+    build.add_argument("library", help="output .npz")
+    build.add_argument("csvs", nargs="+")
+    build.add_argument("--levels", type=float, nargs="+",
+                       help="irradiance of each csv (default: from ISC)")
+    build.add_argument("--temp", type=float, default=TEMP_REF,
+                       help="temperature of the csvs [degC]")
+    show = sub.add_parser("show", help="list the curves and MPPs")
+    show.add_argument("library")
+    show.add_argument("--levels", type=float, nargs="+",
+                      default=[0.5, 0.625, 0.75, 0.875, 1])
+    show.add_argument("--temp", type=float, default=TEMP_REF)
+    table = sub.add_parser("table", help="save the table of one level")
+    table.add_argument("library")
+    table.add_argument("level", type=float)
+    table.add_argument("--temp", type=float, default=TEMP_REF)
+    table.add_argument("--out", required=True, help="csv with Vout, Iout")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.levels is not None and len(args.levels) != len(args.csvs):
+            parser.error("--levels needs one level per csv")
+        levels = args.levels or [None] * len(args.csvs)
+        library = iv_library()
+        for filename, g in zip(args.csvs, levels):
+            g, temp = library.addCsv(filename, g, args.temp)
+            print(f"{filename}: g = {g:.3f}, {temp:.1f} degC")
+        library.save(args.library)
+    elif args.command == "show":
+        library = iv_library.load(args.library)
+        print("Measured curves (g, degC):", library.levels())
+        vmpp, pmpp = library.mpp(args.levels, args.temp)
+        for g, v, p in zip(args.levels, vmpp, pmpp):
+            print(f"  g = {g:.3f}: MPP {p:.1f} W at {v:.2f} V")
+    else:
+        library = iv_library.load(args.library)
+        v, i = library.lookup(args.level, args.temp)
+        pd.DataFrame({"Vout": v, "Iout": i,
+                      "Pout": v * i}).to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
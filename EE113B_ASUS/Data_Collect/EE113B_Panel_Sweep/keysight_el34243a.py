@@ -17,12 +17,35 @@
 
 # TODO: Add debug prints, add commands
 
+import numpy as np
+
+# Array readbacks (FETC:ARR) are transferred as IEEE-488.2 binary blocks
+# of big-endian 32-bit floats (FORM REAL, FORM:BORD NORM) instead of ASCII.
+# The format stays set on the instrument across sessions, so it is always
+# written before the first array transfer, also when binary=False (FORM ASC).
+BINARY_DTYPE = ">f4"
+
+
 class keysight_el34243a_usb():
-    def __init__(self, usb_pyvisa):
+    def __init__(self, usb_pyvisa, binary=True):
         self.usb = usb_pyvisa
         self.num_channels = 2
         self.mode = [None for _ in range(self.num_channels)]
         self.allowedModes = ["CURR", "VOLT", "RES", "POW"]
+        self.binary = binary
+        self.formatSet = False
+
+        # Command strings are built once per channel (and per mode in
+        # setMode) instead of formatting them on every call
+        chans = range(1, self.num_channels + 1)
+        self.measVoltCmd = [f"MEAS:VOLT? (@{c})" for c in chans]
+        self.measCurrCmd = [f"MEAS:CURR? (@{c})" for c in chans]
+        self.measPowCmd = [f"MEAS:POW? (@{c})" for c in chans]
+        self.fetchVoltCmd = [f"FETC:ARR:VOLT? (@{c})" for c in chans]
+        self.fetchCurrCmd = [f"FETC:ARR:CURR? (@{c})" for c in chans]
+        self.inputOnCmd = [f"INP ON, (@{c})" for c in chans]
+        self.inputOffCmd = [f"INP OFF, (@{c})" for c in chans]
+        self.valueFmt = [None for _ in chans]
 
     def setPosSlew(self, value, chan=1):
         self.usb.write(f"{self.mode[chan-1]}:SLEW:POS {value}, (@{chan})")
@@ -31,7 +54,7 @@ class keysight_el34243a_usb():
         self.usb.write(f"{self.mode[chan-1]}:SLEW:NEG {value}, (@{chan})")
 
     def setSlew(self, value, chan=1):
-        # Slew in A/s
+        # Slew in A/s (CURR mode) or V/s (VOLT mode)
         self.setPosSlew(value, chan)
         self.setNegSlew(value, chan)
 
@@ -39,31 +62,72 @@ class keysight_el34243a_usb():
         # Mode can be CURR, VOLT, RES, POW
         if mode in self.allowedModes:
             self.mode[chan-1] = mode
+            self.valueFmt[chan-1] = f"{mode} {{}}, (@{chan})"
             self.usb.write(f"FUNC {mode}, (@{chan})")
-            if remote_sense:
-                self.usb.write(f"VOLT:SENS:SOUR EXT, (@{chan})")
-            else:
-                self.usb.write(f"VOLT:SENS:SOUR INT, (@{chan})")
+            self.setSenseSource(remote_sense, chan)
         else:
             raise ValueError(f"Unsupported mode {mode}")
 
+    def setSenseSource(self, remote_sense, chan=1):
+        # EXT: sense leads (4-wire), INT: input terminals (2-wire)
+        source = "EXT" if remote_sense else "INT"
+        self.usb.write(f"VOLT:SENS:SOUR {source}, (@{chan})")
+
     def setValue(self, value, chan=1):
-        self.usb.write(f"{self.mode[chan-1]} {value}, (@{chan})")
+        self.usb.write(self.valueFmt[chan-1].format(value))
 
     def readVoltage(self, chan=1):
-        return float(self.usb.read(f"MEAS:VOLT? (@{chan})"))
+        return float(self.usb.read(self.measVoltCmd[chan-1]))
 
     def readCurrent(self, chan=1):
-        return float(self.usb.read(f"MEAS:CURR? (@{chan})"))
+        return float(self.usb.read(self.measCurrCmd[chan-1]))
 
     def readPower(self, chan=1):
-        return float(self.usb.read(f"MEAS:POW? (@{chan})"))
+        return float(self.usb.read(self.measPowCmd[chan-1]))
+
+    # Digitizer: captures voltage and current on every `interval` seconds
+    # for `points` samples, starting when startDigitizer is called.
+    def setupDigitizer(self, points, interval, chan=1):
+        self.usb.write(f"SENS:SWE:POIN {int(points)}, (@{chan})")
+        self.usb.write(f"SENS:SWE:TINT {interval}, (@{chan})")
+        self.usb.write(f"TRIG:ACQ:SOUR BUS, (@{chan})")
+        self.setFormat()
+
+    def setFormat(self):
+        # Array format, once per object
+        if self.formatSet:
+            return
+        if self.binary:
+            self.usb.write("FORM REAL")
+            self.usb.write("FORM:BORD NORM")
+        else:
+            self.usb.write("FORM ASC")
+        self.formatSet = True
+
+    def startDigitizer(self, chan=1):
+        self.usb.write(f"INIT:ACQ (@{chan})")
+        self.usb.write("*TRG")
+
+    def fetchVoltageArray(self, chan=1):
+        # Blocks until the acquisition is complete
+        return self.fetchArray(self.fetchVoltCmd[chan-1])
+
+    def fetchCurrentArray(self, chan=1):
+        return self.fetchArray(self.fetchCurrCmd[chan-1])
+
+    def fetchArray(self, query):
+        # NumPy array of the readback
+        self.setFormat()
+        if self.binary:
+            return self.usb.readBinary(query, BINARY_DTYPE).astype(float)
+        data = self.usb.read(query)
+        return np.array(data.split(","), dtype=float)
 
     def activate(self, chan=1):
-        self.usb.write(f"INP ON, (@{chan})")
+        self.usb.write(self.inputOnCmd[chan-1])
 
     def deactivate(self, chan=1):
-        self.usb.write(f"INP OFF, (@{chan})")
+        self.usb.write(self.inputOffCmd[chan-1])
 
     def activateAll(self):
         # TODO: Can use list of channels for one command
@@ -25,13 +25,14 @@ class keysight_n5769a_usb():
         self.num_channels = 1
 
     def setVoltage(self, value):
-        self.usb.write(f":VOLT {value}")
+        self.usb.write(":VOLT " + str(value))
 
     def readVoltage(self):
         return float(self.usb.read(":MEAS:VOLT?"))
 
     def setCurrent(self, value):
-        self.usb.write(f":CURR {value}")
+        # Called at the profile rate by mppt_step.py
+        self.usb.write(":CURR " + str(value))
 
     def readCurrent(self):
         return float(self.usb.read(":MEAS:CURR?"))
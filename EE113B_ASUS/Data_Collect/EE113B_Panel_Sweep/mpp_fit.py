@@ -0,0 +1,152 @@
+# Incremental maximum power point estimate during an IV sweep.
+#
+# The single-diode model (pv_model.py) is fitted to the points measured so
+# far, updated after every point. Instead of refitting from scratch, every
+# candidate (a, Rs, VOC) of a fixed grid is kept, along with its running
+# sum of squared current residuals: a new point costs one model evaluation
+# per candidate. The candidates whose residual is within the 95% confidence
+# region of the best one (chi-square with 3 parameters, the noise estimated
+# from the best fit's residual, but never below CURRENT_NOISE), and their
+# grid neighbors, give an interval for Vmpp and Pmpp. While the best
+# candidate is on the edge of the grid the interval may be cut off, and the
+# estimate is never reported as converged.
+#
+# The PSU's emulated curve has a sharper knee just below VOC than the
+# single-diode model, which biases a fit over the whole curve (ivsweep_full
+# fits to 0.2 A rms). Points above FIT_VMAX of the set VOC are therefore
+# left out, and VOC is fitted as an effective parameter instead of taken
+# from the PSU setting. On ivsweep_full.csv / ivsweep_half.csv this gives
+# the measured MPP within 0.2 W and 0.1 V, 15-20 points before the end.
+#
+# Once both intervals are narrower than the tolerances and some points were
+# measured below the MPP, the rest of the curve cannot move the estimate:
+# sweeps.run_plan then skips the remaining points in the flat current
+# region (plan key mpp_early_stop, see sweep_plan.py). Example:
+#
+#   estimator = mpp_estimator(isc=5.21, voc=24.3)
+#   for v in volts:
+#       ... measure vout, iout ...
+#       estimator.add(vout, iout)
+#       if estimator.converged():
+#           break
+#   print(estimator.estimate())
+
+import numpy as np
+##################################################
+from pv_model import pv_panel
+##################################################
+
+# Same a grid as pv_panel.fit, VOC as offsets from the set VOC. Rs and VOC
+# reach well past the best fits of ivsweep_full / ivsweep_half (Rs ~0.65,
+# VOC ~ set VOC + 2.5 V), so the confidence region is not clipped.
+A_GRID = np.linspace(0.4, 3.0, 53)
+RS_GRID = np.linspace(0, 1.0, 51)
+VOC_OFFSETS = np.arange(-0.3, 3.05, 0.15)
+FIT_VMAX = 0.95         # points above this fraction of VOC are not fitted
+
+MPP_GRID_POINTS = 256   # voltage grid for each candidate's MPP
+CURRENT_NOISE = 0.01    # [A] smallest current residual assumed
+DELTA_CHI2 = 7.81       # 95% confidence region, 3 fitted parameters
+
+MIN_POINTS = 6          # never converged with fewer points
+VMPP_TOLERANCE = 0.5    # [V] Vmpp confidence interval width to stop at
+PMPP_TOLERANCE = 0.02   # Pmpp confidence interval width / Pmpp to stop at
+
+
+class mpp_estimator():
+
+    def __init__(self, isc, voc, noise=CURRENT_NOISE):
+        a, rs, vo = np.meshgrid(A_GRID, RS_GRID, voc + VOC_OFFSETS,
+                                indexing="ij")
+        self.shape = a.shape
+        self.a = a.ravel()
+        self.rs = rs.ravel()
+        self.voc = vo.ravel()
+        # All candidates as one vectorized panel, parameters along axis 0
+        self.panel = pv_panel(isc, self.voc[:, None], self.a[:, None],
+                              self.rs[:, None])
+        self.vmax = FIT_VMAX * voc
+        self.noise = noise
+
+        # MPP of every candidate, fixed for the whole sweep. It is in the
+        # upper half of the curve for any of the candidates.
+        v = np.linspace(voc / 2, voc, MPP_GRID_POINTS)
+        p = v[None, :] * self.panel.current(v[None, :])
+        k = np.argmax(p, axis=1)
+        self.vmpp = v[k]
+        self.pmpp = p[np.arange(len(k)), k]
+
+        self.sse = np.zeros(len(self.a))
+        self.v = []
+        self.i = []
+
+    def add(self, v, i):
+        # Measured point (v, i): update every candidate's residual
+        if v > self.vmax:
+            return
+        model = self.panel.current(np.array([float(v)]))[:, 0]
+        self.sse += (model - i) ** 2
+        self.v.append(float(v))
+        self.i.append(float(i))
+
+    def estimate(self):
+        # Best fit and confidence intervals, or None before any point
+        n = len(self.v)
+        if n == 0:
+            return None
+        best = np.argmin(self.sse)
+        sigma2 = self.noise ** 2
+        if n > 3:
+            sigma2 = max(sigma2, self.sse[best] / (n - 3))
+        region = (self.sse - self.sse[best]) / sigma2 <= DELTA_CHI2
+        region = self._dilate(region)
+        return {"Vmpp": self.vmpp[best],
+                "Pmpp": self.pmpp[best],
+                "Vmpp_lo": self.vmpp[region].min(),
+                "Vmpp_hi": self.vmpp[region].max(),
+                "Pmpp_lo": self.pmpp[region].min(),
+                "Pmpp_hi": self.pmpp[region].max(),
+                "a": self.a[best],
+                "rs": self.rs[best],
+                "voc": self.voc[best],
+                "points": n,
+                "on_edge": self._onEdge(best)}
+
+    def _onEdge(self, best):
+        # True if the best candidate is on the boundary of the grid, where
+        # the confidence region is cut off. Rs = 0 is a physical bound, not
+        # a cut.
+        index = np.unravel_index(best, self.shape)
+        for axis, (k, n) in enumerate(zip(index, self.shape)):
+            if k == n - 1 or (k == 0 and axis != 1):
+                return True
+        return False
+
+    def _dilate(self, region):
+        # Add the grid neighbors of the region, so the intervals are never
+        # narrower than the grid resolution
+        region = region.reshape(self.shape)
+        grown = region.copy()
+        for axis in range(region.ndim):
+            n = region.shape[axis]
+            lo = [slice(None)] * region.ndim
+            hi = [slice(None)] * region.ndim
+            lo[axis] = slice(0, n - 1)
+            hi[axis] = slice(1, n)
+            grown[tuple(lo)] |= region[tuple(hi)]
+            grown[tuple(hi)] |= region[tuple(lo)]
+        return grown.ravel()
+
+    def converged(self, v_tol=VMPP_TOLERANCE, p_tol=PMPP_TOLERANCE):
+        est = self.estimate()
+        if est is None or est["points"] < MIN_POINTS:
+            return False
+        if est["on_edge"]:
+            # The true interval may extend past the grid
+            return False
+        if min(self.v) >= est["Vmpp_lo"]:
+            # Nothing measured past the MPP yet, the estimate is an
+            # extrapolation
+            return False
+        return (est["Vmpp_hi"] - est["Vmpp_lo"] <= v_tol
+                and est["Pmpp_hi"] - est["Pmpp_lo"] <= p_tol * est["Pmpp"])
@@ -0,0 +1,309 @@
+# Vectorized batch simulation of many P&O controller instances at once.
+#
+# Same controller and plant as mppt_sim.py, but instead of one instance per
+# Python loop, N instances (each with its own parameters, irradiance
+# profile and noise) are stepped in lock-step as NumPy arrays. The firmware
+# main loop is flattened into four stages, and every batch step runs the
+# current stage of every instance:
+#
+#   STAGE_TOP   clamp duty, delay wait_time, read ADC
+#   STAGE_PRE   delay wait_time, then initial sweep / first MPP guess
+#   STAGE_MPP   duty = MPP_Duty, delay wait_po, re-measure MPP_power, perturb
+#   STAGE_PERT  delay wait_po, read ADC, keep the perturbation if better
+#
+# Instances have their own clocks (their delays differ) and drop out of the
+# batch once their clock reaches the profile end.
+#
+# Usage:
+#   python mppt_batch.py                    (10,000-configuration grid)
+#   python mppt_batch.py --duration 30 --out pno_grid.csv
+#   python mppt_sim.py --batch --profiles 1000   (variant study, one batch)
+
+import argparse
+from time import perf_counter
+import numpy as np
+import pandas as pd
+##################################################
+from pv_model import pv_panel
+from mppt_sim import (VARIANT_DEFAULTS, DUTY_MIN, DUTY_MAX, DUTY_START,
+                      VOUT, CONVERTER_EFF, PLANT_TAU, VOUT_NOISE, IOUT_NOISE,
+                      VOUT_GAIN, VOUT_OFFSET, IOUT_GAIN, IOUT_OFFSET,
+                      VARIANTS, random_profile, profile_seeds, mpp_table)
+##################################################
+
+STAGE_TOP, STAGE_PRE, STAGE_MPP, STAGE_PERT = range(4)
+
+# Newton iterations per plant evaluation. The previous current of each
+# instance is a close starting point, so few are needed.
+WARM_ITERATIONS = 4
+
+# Default parameter grid: 25 x 20 x 20 = 10,000 configurations. The wait
+# times start at half the firmware's 10 ms: the number of batch steps is
+# set by the shortest delay.
+GRID_DUTY_STEPS = np.linspace(0.001, 0.025, 25)
+GRID_WAIT_TIMES = np.linspace(0.005, 0.100, 20)
+GRID_AVGS = np.arange(1, 21)
+
+
+##################################################
+# Helpers:
+def pad_profiles(profiles):
+    # List of (t, g) arrays -> (N, K) arrays, padded by repeating the end
+    k = max(len(t) for t, _ in profiles)
+    T = np.empty((len(profiles), k))
+    G = np.empty((len(profiles), k))
+    for n, (t, g) in enumerate(profiles):
+        T[n, :len(t)] = t
+        T[n, len(t):] = t[-1] + np.arange(1, k - len(t) + 1)
+        G[n, :len(g)] = g
+        G[n, len(g):] = g[-1]
+    return T, G
+
+
+def batch_interp(t, T, G):
+    # Row-wise np.interp: G[n] at t[n] on the time axis T[n]
+    k = np.clip((T <= t[:, None]).sum(axis=1), 1, T.shape[1] - 1)
+    rows = np.arange(len(t))
+    t0, t1 = T[rows, k - 1], T[rows, k]
+    g0, g1 = G[rows, k - 1], G[rows, k]
+    w = np.where(t1 > t0, (t - t0) / np.where(t1 > t0, t1 - t0, 1), 0)
+    return g0 + np.clip(w, 0, 1) * (g1 - g0)
+
+
+def expand_params(params, n):
+    # Dict of scalars or length-n arrays -> dict of length-n arrays
+    p = {**VARIANT_DEFAULTS, **params}
+    out = {}
+    for key, value in p.items():
+        if key == "fine_step" and value is None:
+            value = np.nan
+        out[key] = np.broadcast_to(np.asarray(value, dtype=float), n).copy()
+    return out
+
+
+##################################################
+# Batch simulation:
+class batch_plant():
+    def __init__(self, panel, T, G, rng, noise=1.0):
+        n = len(T)
+        self.panel = panel
+        self.T = T
+        self.G = G
+        self.rng = rng
+        self.noise = noise
+        self.table = mpp_table(panel)
+        self.t = np.zeros(n)
+        self.vpv = np.full(n, panel.voc)
+        g = G[:, 0]
+        self.ipv = self._current(self.vpv, g, panel.iph * g)
+        self.pout = self.vpv * np.maximum(self.ipv, 0) * CONVERTER_EFF
+        self.pmpp = np.interp(g, *self.table) * CONVERTER_EFF
+        self.energy = np.zeros(n)
+        self.available = np.zeros(n)   # energy at the MPP, same intervals
+
+    def _current(self, v, g, i_start):
+        # Newton iterations of pv_panel.current from a warm start
+        pnl = self.panel
+        iph = pnl.iph * g
+        i = i_start
+        for _ in range(WARM_ITERATIONS):
+            vd = v + i * pnl.rs
+            e = np.exp(np.minimum(vd / pnl.a, 60))
+            f = iph - pnl.i0 * (e - 1) - vd / pnl.rsh - i
+            df = -pnl.i0 * pnl.rs / pnl.a * e - pnl.rs / pnl.rsh - 1
+            i = i - f / df
+        return i
+
+    def run(self, idx, duty, dt):
+        # Apply duty for dt seconds to the instances in idx
+        vpv = self.vpv[idx]
+        t = self.t[idx]
+        target = np.minimum(VOUT / duty, self.panel.voc)
+        v_mid = target + (vpv - target) * np.exp(-dt / 2 / PLANT_TAU)
+        v_end = target + (vpv - target) * np.exp(-dt / PLANT_TAU)
+
+        T, G = self.T[idx], self.G[idx]
+        g_mid = batch_interp(t + dt / 2, T, G)
+        g_end = batch_interp(t + dt, T, G)
+        i_mid = self._current(v_mid, g_mid, self.ipv[idx])
+        i_end = self._current(v_end, g_end, i_mid)
+        p_mid = v_mid * np.maximum(i_mid, 0) * CONVERTER_EFF
+        p_end = v_end * np.maximum(i_end, 0) * CONVERTER_EFF
+        mpp_mid = np.interp(g_mid, *self.table) * CONVERTER_EFF
+        mpp_end = np.interp(g_end, *self.table) * CONVERTER_EFF
+
+        # Simpson's rule, the start powers are the previous end powers
+        self.energy[idx] += dt / 6 * (self.pout[idx] + 4 * p_mid + p_end)
+        self.available[idx] += dt / 6 * (self.pmpp[idx] + 4 * mpp_mid
+                                         + mpp_end)
+        self.t[idx] = t + dt
+        self.vpv[idx] = v_end
+        self.ipv[idx] = i_end
+        self.pout[idx] = p_end
+        self.pmpp[idx] = mpp_end
+        return p_end
+
+    def measure(self, pout, avg):
+        # Firmware adc_iout * adc_vout, averaging avg samples per instance.
+        # float32 noise halves the cost of the draws, it is far below the
+        # ADC resolution.
+        n = len(pout)
+        m = int(avg.max())
+        noise = self.noise * self.rng.standard_normal((2, n, m),
+                                                      dtype=np.float32)
+        v = VOUT + VOUT_NOISE * noise[0]
+        i = (pout / VOUT)[:, None] + IOUT_NOISE * noise[1]
+        v = np.round((v - VOUT_OFFSET) / VOUT_GAIN) * VOUT_GAIN + VOUT_OFFSET
+        i = np.round((i - IOUT_OFFSET) / IOUT_GAIN) * IOUT_GAIN + IOUT_OFFSET
+        if m > 1:
+            mask = np.arange(m)[None, :] < avg[:, None]
+            v = (v * mask).sum(axis=1) / avg
+            i = (i * mask).sum(axis=1) / avg
+        else:
+            v, i = v[:, 0], i[:, 0]
+        return v * i
+
+
+def simulate_batch(params, profiles, duration, panel=None, seed=0, noise=1.0):
+    # params: dict of scalars or length-N arrays (see mppt_sim.VARIANTS)
+    # profiles: list of N (t, g) arrays
+    # duration: simulated seconds, scalar or one per instance
+    # Returns the tracking efficiency of every instance.
+    if panel is None:
+        panel = pv_panel()
+    n = len(profiles)
+    p = expand_params(params, n)
+    duration = np.broadcast_to(np.asarray(duration, dtype=float), n)
+    T, G = pad_profiles(profiles)
+    plant = batch_plant(panel, T, G, np.random.default_rng(seed), noise)
+
+    stage = np.full(n, STAGE_TOP)
+    duty = np.full(n, DUTY_START)
+    mpp_duty = duty.copy()
+    mpp_power = np.zeros(n)
+    pout_top = np.zeros(n)
+    tracking = np.zeros(n, dtype=bool)
+    phase = np.zeros(n, dtype=int)
+    last_dp = np.full(n, np.inf)
+
+    active = np.arange(n)
+    while len(active):
+        s = stage[active]
+
+        # STAGE_TOP
+        idx = active[s == STAGE_TOP]
+        if len(idx):
+            duty[idx] = np.clip(duty[idx], DUTY_MIN, DUTY_MAX)
+            pout_top[idx] = plant.measure(
+                plant.run(idx, duty[idx], p["wait_time"][idx]), p["avg"][idx])
+            stage[idx] = np.where(tracking[idx], STAGE_MPP, STAGE_PRE)
+
+        # STAGE_PRE: initial sweep or first MPP guess
+        idx = active[s == STAGE_PRE]
+        if len(idx):
+            plant.run(idx, duty[idx], p["wait_time"][idx])
+            sweep = p["sweep"][idx] > 0
+            better = sweep & (pout_top[idx] > mpp_power[idx])
+            guess = ~sweep | better
+            mpp_duty[idx] = np.where(guess, duty[idx], mpp_duty[idx])
+            mpp_power[idx] = np.where(guess, pout_top[idx], mpp_power[idx])
+            done = ~sweep | (duty[idx] >= DUTY_MAX)
+            duty[idx] = np.where(done, mpp_duty[idx],
+                                 duty[idx] + p["duty_step"][idx])
+            tracking[idx] = done
+            stage[idx] = STAGE_TOP
+
+        # STAGE_MPP: re-measure at the MPP, then perturb
+        idx = active[s == STAGE_MPP]
+        if len(idx):
+            duty[idx] = mpp_duty[idx]
+            mpp_power[idx] = plant.measure(
+                plant.run(idx, duty[idx], p["wait_po"][idx]), p["avg"][idx])
+            step = np.where(last_dp[idx] < p["fine_threshold"][idx],
+                            p["fine_step"][idx], np.nan)
+            step = np.where(np.isnan(step), p["duty_step"][idx], step)
+            ph = phase[idx]
+            duty[idx] = np.select([ph == 0, ph == 1],
+                                  [mpp_duty[idx] - step,
+                                   mpp_duty[idx] + step], mpp_duty[idx])
+            phase[idx] = (ph + 1) % 3
+            stage[idx] = STAGE_PERT
+
+        # STAGE_PERT: observe
+        idx = active[s == STAGE_PERT]
+        if len(idx):
+            pout = plant.measure(plant.run(idx, duty[idx], p["wait_po"][idx]),
+                                 p["avg"][idx])
+            last_dp[idx] = np.abs(pout - mpp_power[idx])
+            better = pout > mpp_power[idx]
+            mpp_power[idx] = np.where(better, pout, mpp_power[idx])
+            mpp_duty[idx] = np.where(better, duty[idx], mpp_duty[idx])
+            stage[idx] = STAGE_TOP
+
+        # An instance stops at the end of the loop iteration that crosses
+        # the end of the profile, like the while condition in mppt_sim.py
+        finished = ((plant.t[active] >= duration[active])
+                    & (stage[active] == STAGE_TOP))
+        active = active[~finished]
+
+    return plant.energy / plant.available
+
+
+def run_study(variants, num_profiles, profile=None, seed=0):
+    # Same study and result table as mppt_sim.run_study, as one batch.
+    # Profiles match mppt_sim.py seed for seed; the noise comes from one
+    # generator for the whole batch instead of one seed per run.
+    names = [name for k in range(num_profiles) for name in variants]
+    index = [k for k in range(num_profiles) for name in variants]
+    if profile is None:
+        seeds = profile_seeds(seed, num_profiles)
+        profiles = [random_profile(np.random.default_rng(seeds[k][0]))
+                    for k in index]
+    else:
+        profiles = [profile] * len(index)
+    params = {}
+    for key in VARIANT_DEFAULTS:
+        values = [{**VARIANT_DEFAULTS, **VARIANTS[name]}[key]
+                  for name in names]
+        params[key] = [np.nan if v is None else v for v in values]
+    duration = np.array([t[-1] for t, _ in profiles])
+    eff = simulate_batch(params, profiles, duration, seed=seed)
+    return pd.DataFrame({"variant": names, "profile": index,
+                         "tracking_eff": eff})
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(
+        description="Batch P&O parameter sweep (duty_step x wait x avg)")
+    parser.add_argument("--duration", type=float, default=20,
+                        help="simulated seconds per instance")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="mppt_batch.csv")
+    args = parser.parse_args()
+
+    step, wait, avg = np.meshgrid(GRID_DUTY_STEPS, GRID_WAIT_TIMES,
+                                  GRID_AVGS, indexing="ij")
+    params = {"duty_step": step.ravel(), "wait_time": wait.ravel(),
+              "wait_po": wait.ravel(), "avg": avg.ravel()}
+    n = step.size
+
+    # Same random profile family as mppt_sim.py, one per instance
+    rng = np.random.default_rng(args.seed)
+    profiles = [random_profile(rng, args.duration) for _ in range(n)]
+
+    t0 = perf_counter()
+    eff = simulate_batch(params, profiles, args.duration, seed=args.seed)
+    elapsed = perf_counter() - t0
+    print(f"{n} instances x {args.duration:.0f} s simulated "
+          f"in {elapsed:.1f} s")
+
+    results = pd.DataFrame({**params, "tracking_eff": eff})
+    results.to_csv(args.out, index=False)
+    print("Best configurations:")
+    print(results.sort_values("tracking_eff", ascending=False).head(10)
+          .to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
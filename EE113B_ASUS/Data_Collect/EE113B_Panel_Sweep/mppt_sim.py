@@ -0,0 +1,327 @@
+# Monte-Carlo robustness study of the P&O controller variants.
+#
+# Each firmware variant in PV_Buck_Code/MPPT is reduced to a few parameters
+# (VARIANTS below), plus the ideas from MPPT_Software_Improve.txt that were
+# never quantified (finer duty step near the MPP, longer sensing delay,
+# averaging Pout). Every variant is run against the same randomized
+# irradiance profiles and sensor-noise seeds, in parallel across cores,
+# and the distribution of tracking efficiency
+#
+#   energy delivered / energy available at the MPP
+#
+# is reported per variant.
+#
+# Plant: the eload holds the output at 12 V (CV mode, like mppt_step.py),
+# so an ideal buck puts the panel at Vpv = Vout / D. The panel voltage
+# follows a duty change with a first-order lag PLANT_TAU. The ADC readings
+# get Gaussian noise and are quantized with the firmware's conversion
+# constants.
+#
+# Usage:
+#   python mppt_sim.py --profiles 1000 --processes 8
+#   python mppt_sim.py --profile-file mppt_profile.csv --variants final_v2
+#   python mppt_sim.py --batch --profiles 1000   (see mppt_batch.py)
+#   python mppt_sim.py --iv-library iv_library.npz   (see iv_library.py)
+
+import os
+import argparse
+import multiprocessing
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+##################################################
+from pv_model import pv_panel
+from iv_library import iv_library
+##################################################
+
+# Firmware variants. Times in seconds.
+#   duty_step   P&O (and initial sweep) duty step
+#   wait_time   delay after the top-of-loop duty update
+#   wait_po     delay after each P&O duty update
+#   sweep       sweep the whole duty range once before P&O
+#   avg         ADC samples averaged per power measurement
+#   fine_step   smaller duty step used when the last power change was below
+#               fine_threshold [W] (None = fixed step)
+VARIANT_DEFAULTS = {"duty_step": 0.005, "wait_time": 0.010,
+                    "wait_po": 0.010, "sweep": False, "avg": 1,
+                    "fine_step": None, "fine_threshold": 0.5}
+VARIANTS = {
+    # MPPT_final_v2.c: P&O from the starting duty
+    "final_v2": {},
+    # MPPT_2modes_v1.c: initial sweep, long P&O delays (wait_time_long)
+    "2modes_v1": {"sweep": True, "wait_po": 0.100},
+    # MPPT_sweep_final_v2.c: initial sweep, 100 ms loop and P&O delays
+    "sweep_final_v2": {"sweep": True, "wait_time": 0.100, "wait_po": 0.100},
+    # MPPT_test_pout_avg.c: 2modes with 5-sample averaging of Pout
+    "test_pout_avg": {"sweep": True, "wait_po": 0.100, "avg": 5},
+    # MPPT_Software_Improve.txt ideas on top of final_v2
+    "improve_fine_step": {"fine_step": 0.001},
+    "improve_long_wait": {"wait_po": 0.050},
+    "improve_avg": {"avg": 8},
+}
+
+DUTY_MIN = 0.5
+DUTY_MAX = 0.75
+DUTY_START = 0.5
+
+VOUT = 12           # eload CV setpoint
+CONVERTER_EFF = 0.96
+PLANT_TAU = 0.003   # panel voltage time constant after a duty change [s]
+
+VOUT_NOISE = 0.03   # ADC noise, std [V]
+IOUT_NOISE = 0.04   # ADC noise, std [A]
+
+# Firmware ADC conversions (adc = raw * gain + offset)
+VOUT_GAIN, VOUT_OFFSET = 3.0 * 11 / 4095, 0.0
+IOUT_GAIN, IOUT_OFFSET = 0.0059, -10.0928
+
+# Random profiles: a new level every PROFILE_STEP seconds, reached by a
+# step or a ramp, like mppt_profile.csv
+PROFILE_DURATION = 60
+PROFILE_STEP = 5
+PROFILE_MIN_LEVEL = 0.25
+
+# Irradiance grid for the MPP power lookup table
+MPP_TABLE_POINTS = 201
+
+
+##################################################
+# Irradiance profiles:
+def random_profile(rng, duration=PROFILE_DURATION, step=PROFILE_STEP):
+    times = [0.0]
+    levels = [rng.uniform(PROFILE_MIN_LEVEL, 1)]
+    t = 0.0
+    while t < duration:
+        t = min(t + step, duration)
+        level = rng.uniform(PROFILE_MIN_LEVEL, 1)
+        if rng.random() < 0.5:
+            # Step change: hold, then jump at t
+            times.append(t)
+            levels.append(levels[-1])
+        times.append(t)
+        levels.append(level)
+    return np.array(times), np.array(levels)
+
+
+def load_profile(filename):
+    profile = pd.read_csv(filename)  # t, isc
+    return profile.t.to_numpy(float), profile.isc.to_numpy(float)
+
+
+def mpp_table(panel):
+    g = np.linspace(0, 1, MPP_TABLE_POINTS)
+    return g, panel.mpp(g)[1]
+
+
+##################################################
+# Plant:
+class buck_plant():
+    def __init__(self, panel, profile_t, profile_g, rng):
+        self.panel = panel
+        self.profile_t = profile_t
+        self.profile_g = profile_g
+        self.rng = rng
+        self.t = 0.0
+        self.vpv = panel.voc
+        self.energy = 0.0
+
+    def _pout(self, vpv, t):
+        g = np.interp(t, self.profile_t, self.profile_g)
+        ipv = max(float(self.panel.current(vpv, g)), 0.0)
+        return vpv * ipv * CONVERTER_EFF
+
+    def run(self, duty, dt):
+        # Apply duty for dt seconds. Returns the output power at the end.
+        target = min(VOUT / duty, self.panel.voc)
+        v0 = self.vpv
+        v_mid = target + (v0 - target) * np.exp(-dt / 2 / PLANT_TAU)
+        v_end = target + (v0 - target) * np.exp(-dt / PLANT_TAU)
+        p0 = self._pout(v0, self.t)
+        p_mid = self._pout(v_mid, self.t + dt / 2)
+        p_end = self._pout(v_end, self.t + dt)
+        # Simpson's rule over the interval
+        self.energy += dt / 6 * (p0 + 4 * p_mid + p_end)
+        self.t += dt
+        self.vpv = v_end
+        return p_end
+
+    def measure(self, pout, avg=1):
+        # What the firmware computes as adc_iout * adc_vout
+        iout = pout / VOUT
+        v = VOUT + self.rng.normal(0, VOUT_NOISE, avg)
+        i = iout + self.rng.normal(0, IOUT_NOISE, avg)
+        # Quantize through the ADC codes
+        v = np.round((v - VOUT_OFFSET) / VOUT_GAIN) * VOUT_GAIN + VOUT_OFFSET
+        i = np.round((i - IOUT_OFFSET) / IOUT_GAIN) * IOUT_GAIN + IOUT_OFFSET
+        return float(np.mean(v) * np.mean(i))
+
+
+##################################################
+# Controller, following the main loop of the firmware:
+def simulate(params, plant, duration):
+    p = {**VARIANT_DEFAULTS, **params}
+    duty = DUTY_START
+    mpp_duty = duty
+    mpp_power = 0.0
+    sweeping = p["sweep"]
+    tracking = False
+    phase = 0       # perturb sequence: 0 down, 1 up, 2 none
+    last_dp = np.inf
+
+    while plant.t < duration:
+        # Top of loop: clamp, update duty, read ADC, delay
+        duty = min(max(duty, DUTY_MIN), DUTY_MAX)
+        pout = plant.measure(plant.run(duty, p["wait_time"]), p["avg"])
+
+        if not tracking:
+            plant.run(duty, p["wait_time"])
+            if sweeping:
+                if pout > mpp_power:
+                    mpp_duty = duty
+                    mpp_power = pout
+                if duty >= DUTY_MAX:
+                    duty = mpp_duty
+                    tracking = True
+                else:
+                    duty += p["duty_step"]
+            else:
+                mpp_duty = duty
+                mpp_power = pout
+                tracking = True
+            continue
+
+        # Perturb and observe: re-measure at the MPP, then perturb
+        duty = mpp_duty
+        mpp_power = plant.measure(plant.run(duty, p["wait_po"]), p["avg"])
+
+        step = p["duty_step"]
+        if p["fine_step"] is not None and last_dp < p["fine_threshold"]:
+            step = p["fine_step"]
+        if phase == 0:
+            duty = mpp_duty - step
+        elif phase == 1:
+            duty = mpp_duty + step
+        phase = (phase + 1) % 3
+
+        pout = plant.measure(plant.run(duty, p["wait_po"]), p["avg"])
+        last_dp = abs(pout - mpp_power)
+        if pout > mpp_power:
+            mpp_power = pout
+            mpp_duty = duty
+
+    return plant.energy
+
+
+def tracking_efficiency(params, profile_t, profile_g, seed, panel, table):
+    rng = np.random.default_rng(seed)
+    duration = profile_t[-1]
+    plant = buck_plant(panel, profile_t, profile_g, rng)
+    energy = simulate(params, plant, duration)
+
+    # Energy available at the MPP over the same time
+    t = np.linspace(0, plant.t, int(plant.t / 0.001) + 1)
+    g = np.interp(t, profile_t, profile_g)
+    available = np.trapezoid(np.interp(g, *table), t) * CONVERTER_EFF
+    return energy / available if available > 0 else np.nan
+
+
+##################################################
+# Monte-Carlo:
+@lru_cache(maxsize=None)
+def _panel(library_file):
+    # Once per worker process: the panel model, or the measured curves
+    # (the library keeps the tables of the levels already visited)
+    if library_file is None:
+        panel = pv_panel()
+    else:
+        panel = iv_library.load(library_file)
+    return panel, mpp_table(panel)
+
+
+def profile_seeds(seed, num_profiles):
+    # One (profile, noise) pair of independent seed sequences per profile,
+    # all spawned from seed, so no two runs share a random stream
+    return [tuple(child.spawn(2))
+            for child in np.random.SeedSequence(seed).spawn(num_profiles)]
+
+
+def _run_task(task):
+    name, k, (profile_seed, noise_seed), profile, library_file = task
+    panel, table = _panel(library_file)
+    if profile is None:
+        # Same seed -> same profile for every variant (paired comparison)
+        profile = random_profile(np.random.default_rng(profile_seed))
+    eff = tracking_efficiency(VARIANTS[name], *profile, noise_seed, panel,
+                              table)
+    return {"variant": name, "profile": k, "tracking_eff": eff}
+
+
+def run_study(variants, num_profiles, processes=None, profile=None, seed=0,
+              library_file=None):
+    seeds = profile_seeds(seed, num_profiles)
+    tasks = [(name, k, seeds[k], profile, library_file)
+             for k in range(num_profiles) for name in variants]
+    with multiprocessing.Pool(processes) as pool:
+        rows = pool.map(_run_task, tasks, chunksize=max(1, len(tasks) // 64))
+    return pd.DataFrame(rows)
+
+
+def summarize(results):
+    eff = results.groupby("variant")["tracking_eff"]
+    # In percent, best variant first
+    summary = pd.DataFrame({"mean": eff.mean() * 100,
+                            "std": eff.std() * 100,
+                            "p5": eff.quantile(0.05) * 100,
+                            "p50": eff.median() * 100,
+                            "p95": eff.quantile(0.95) * 100,
+                            "runs": eff.count()})
+    return summary.sort_values("mean", ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte-Carlo P&O study")
+    parser.add_argument("--profiles", type=int, default=200,
+                        help="random irradiance profiles per variant")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS),
+                        choices=list(VARIANTS))
+    parser.add_argument("--profile-file", default=None,
+                        help="use this profile (t, isc csv) for every run, "
+                             "only the sensor noise is randomized")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--batch", action="store_true",
+                        help="run all simulations as one vectorized batch "
+                             "(mppt_batch.py) instead of a process pool")
+    parser.add_argument("--iv-library", default=None,
+                        help="simulate the panel from measured IV curves "
+                             "(iv_library.py .npz) instead of the model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="mppt_mc.csv",
+                        help="csv with one row per run")
+    args = parser.parse_args()
+
+    profile = None
+    if args.profile_file is not None:
+        profile = load_profile(args.profile_file)
+
+    library_file = None
+    if args.iv_library is not None:
+        library_file = os.path.abspath(args.iv_library)
+    if args.batch and library_file is not None:
+        parser.error("--batch uses the panel model, not --iv-library")
+
+    if args.batch:
+        import mppt_batch
+        results = mppt_batch.run_study(args.variants, args.profiles, profile,
+                                       args.seed)
+    else:
+        results = run_study(args.variants, args.profiles, args.processes,
+                            profile, args.seed, library_file)
+    results.to_csv(os.path.abspath(args.out), index=False)
+
+    print("Tracking efficiency [%]:")
+    print(summarize(results).to_string(float_format="%.2f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,60 @@
 import sys
 import os
 import signal
-from time import sleep, time
+from contextlib import nullcontext
 import pandas as pd
-from matplotlib import pyplot as plt
 ##################################################
-from usb_pyvisa_wrapper import usb_pyvisa
-from keysight_n5769a import keysight_n5769a_usb as usb_n5769a
-from keysight_el34243a import keysight_el34243a_usb as usb_el34243a
+from watchdog import safe_state_watchdog
+from dashboard import live_dashboard
+from sweeps import open_instruments, profile_replay
+import telemetry
 ##################################################
+# MPPT profile replay. The replay itself is sweeps.profile_replay, this
+# script only holds the test parameters and saves the results.
 
 # Test parameters:
 script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
 
 ELOAD_CH = 2  # Eload channel to connect to
 
-# Define the eload's mode of sweep. The options are:
-#   "CURR"  :   constant current
-#   "RES"   :   constant resistance
-#   "POW"   :   constant power
-#   "VOLT"   :  constant voltage
-OUTPUT_TYPE = "VOLT"  # "CURR", "RES", "POW" or "VOLT"
+# PV panel emulated by the PSU, and the converter output held by the
+# eload (constant voltage, remote sense)
+PV_ISC = 5.21
+PV_OCV = 24.3
+VOUT = 12
+
+# At the end of each profile step, take a burst of fast samples and check
+# for PSU/eload oscillation (see stability.py). The metrics of every step
+# are saved to STABILITY_FILENAME.
+CHECK_STABILITY = True
 
-# Define how long to let the load run before taking a measurement:
-RUNTIME = 1  # measurement taken after this many seconds
+# The PSU and eload are turned off if the replay loop stops for longer than
+# this (e.g. the script hangs in a VISA call), see watchdog.py
+WATCHDOG_TIMEOUT = 10
 
-SETTLE_TIME = 1  # wait time after changing equipment settings
+# Plot the eload power live during the replay, in a separate window
+# (see dashboard.py)
+LIVE_VIEW = True
 
-# Define the names for the output files:
-#   log file contains all the data in a csv file
-#   img file is the generated png plots
-TEST_NAME = "effsweep"  # name for log files
-LOG_FILENAME = f"{TEST_NAME}.csv"
-IMG_FILENAME = f"{TEST_NAME}.png"
+# Define the names for the output files
 MPPT_FILENAME = "mppt_profile.csv"
+STABILITY_FILENAME = "mppt_step_stability.csv"
+
+# Every eload power reading is saved with its timestamp to POWER_FILENAME.
+# If TELEMETRY_PORT is set (e.g. "COM5"), the controller telemetry frames
+# (see telemetry.py) are received during the replay, aligned with the eload
+# readings on the host clock and saved to TELEMETRY_FILENAME.
+POWER_FILENAME = "mppt_step_power.csv"
+TELEMETRY_FILENAME = "mppt_step_telemetry.csv"
+TELEMETRY_PORT = None
+
+# For long replays, write the power readings and telemetry frames to
+# capture files as they come in (see capture_log.py) instead of keeping
+# them in memory and saving the csvs above at the end. replay_stats.py
+# analyzes the power capture.
+CAPTURE = False
+POWER_CAPTURE_FILENAME = "mppt_step_power.cap"
+TELEMETRY_CAPTURE_FILENAME = "mppt_step_telemetry.cap"
 
 # Save directory for the above files
 #   Files are saved under SAVE_DIRECTORY
@@ -41,20 +62,23 @@ SAVE_DIRECTORY = script_directory
 
 ##################################################
 # Setup:
+stabilityfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                             f"{STABILITY_FILENAME}"))
+
+powerfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                         f"{POWER_FILENAME}"))
+
+telemetryfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                             f"{TELEMETRY_FILENAME}"))
 
-# Saves: Vout, Iout, Pout
-#   in a csv file
-logfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
-                                       f"{LOG_FILENAME}"))
+powercapture = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                            f"{POWER_CAPTURE_FILENAME}"))
 
-# Saves the generated plots of Iout vs Vout and Pout vs Vout
-imgfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
-                                       f"{IMG_FILENAME}"))
+telemetrycapture = os.path.abspath(os.path.join(
+    SAVE_DIRECTORY, f"{TELEMETRY_CAPTURE_FILENAME}"))
 
 mppt_profile_file = os.path.abspath(os.path.join(script_directory,
                                                  f"{MPPT_FILENAME}"))
-# Indicates whether devices are initialized:
-initialized = False
 
 # Objects for USB-connected PSU and Eload:
 usb_psu = None
@@ -64,7 +88,7 @@ usb_eload = None
 ##################################################
 # Signal handler and exit routine:
 def timeToExit(sig, frame):
-    if initialized:
+    if usb_psu is not None and usb_eload is not None:
         # Did not catch a signal, so turn off and return
         # to program execution
         usb_eload.deactivate(chan=ELOAD_CH)
@@ -77,111 +101,55 @@ def timeToExit(sig, frame):
         sys.exit()
 
 
-# If Ctrl-C is pressed while the program is running,
-# the PSU and eload are turned off before exiting.
-signal.signal(signal.SIGINT, timeToExit)
 ##################################################
-
-# Read in MPPT profile
-PV_ISC = 5.21
-PV_OCV = 24.3
-profile = pd.read_csv(mppt_profile_file)  # t, i
-profile_t = profile.t.to_list()
-profile_isc_norm = profile.isc.to_list()
-
-# Find connected devices and print them
-devices = usb_pyvisa.query()
-print(devices)
-
-# We know that 1x N5769A PSU and 1x EL34243A eload are connected.
-# Find the address of the connected devices based on the
-# part numbers appearing in the IDN string.
-psu_addr = usb_pyvisa.getAddrFromIdn("N5769A")
-eload_addr = usb_pyvisa.getAddrFromIdn("EL34243A")
-
-# Based on the addresses found, initialize the objects:
-usb_psu = usb_n5769a(usb_pyvisa(psu_addr))
-usb_eload = usb_el34243a(usb_pyvisa(eload_addr))
-
-# Done with initializing:
-initialized = True
-
-# Make sure power supply and eload outputs are off
-usb_psu.deactivate()
-usb_eload.deactivate(chan=ELOAD_CH)
-
-##################################################
-
-usb_eload.deactivate(chan=ELOAD_CH)
-
-# Set the power supply voltage and current, and turn it on:
-usb_psu.setVoltage(PV_OCV)
-# usb_psu.setCurrent(PV_ISC)
-usb_psu.activate()
-usb_eload.setMode(OUTPUT_TYPE, remote_sense=True, chan=ELOAD_CH)
-usb_eload.setValue(12, chan=ELOAD_CH)
-usb_eload.activate(chan=ELOAD_CH)
-
-print("==========================")
-print("  Starting test...")
-print("==========================")
-
-# First *slowly* ramp up from 0 to the first defined current in the profile.
-# This helps prevent the power supply from oscillating.
-t0 = time()
-tprev = 0
-iprev = 0
-power_sum = 0
-counter = 0
-
-# Ramp up current:
-ref_i = profile_isc_norm[0] * PV_ISC
-ref_t = 1
-print(f"Ramping up current to {ref_i:.2f} A in {ref_t:.1f} s")
-set_i = 1
-iprev = 1
-i_slope = (ref_i - set_i) / ref_t
-while set_i < ref_i:
-    current_time = time() - t0
-    set_i = iprev + i_slope * current_time
-    usb_psu.setCurrent(set_i)
-    sleep(0.1)
-
-tprev = 0
-iprev = ref_i
-t0 = time()
-
-# Now go through the defined currents in the profile:
-for t, isc_norm in zip(profile_t, profile_isc_norm):
-
-    # Currents in the profile file are normalized to the panel's rating.
-    isc = isc_norm * PV_ISC
-    print(f"Step: {t} , {isc_norm} -> {isc:.2f}A")
-    current_time = time() - t0
-    if current_time >= t:
-        usb_psu.setCurrent(isc)
-        power_sum += usb_eload.readPower(chan=ELOAD_CH)
-        counter += 1
-    else:
-        # Ramp up the current linearly:
-        i_slope = (isc - iprev) / (t - tprev) if t > tprev else 0
-        while current_time < t:
-            # Ramp up until next defined time point:
-            current_time = time() - t0
-            iset = iprev + i_slope * (current_time - tprev)
-            usb_psu.setCurrent(iset)
-            power_sum += usb_eload.readPower(chan=ELOAD_CH)
-            counter += 1
-    iprev = isc
-    tprev = t
-
-    if counter == 0:
-        counter = 1
-    avg_power = power_sum/counter
-    print(f"Avg power = {avg_power:.2f} W")
-
-##################################################
-# Close PSU and eload.
-# Passing None, None indicates this is not a signal (SIGINT).
-timeToExit(None, None)
-##################################################
\ No newline at end of file
+def main():
+    global usb_psu, usb_eload
+
+    # Read in MPPT profile
+    profile = pd.read_csv(mppt_profile_file)  # t, isc
+
+    # If Ctrl-C is pressed while the program is running,
+    # the PSU and eload are turned off before exiting.
+    signal.signal(signal.SIGINT, timeToExit)
+    usb_psu, usb_eload = open_instruments()
+
+    # Controller telemetry, see telemetry.py
+    receiver = None
+    if TELEMETRY_PORT is not None:
+        receiver = telemetry.telemetry_receiver(
+            TELEMETRY_PORT,
+            capture_file=telemetrycapture if CAPTURE else None)
+
+    print("==========================")
+    print("  Starting test...")
+    print("==========================")
+    dashboard = live_dashboard("replay", "mppt_step") if LIVE_VIEW else None
+
+    # Turns both instruments off if the script stalls or crashes, see
+    # watchdog.py
+    with (dashboard if dashboard is not None else nullcontext()), \
+            safe_state_watchdog(usb_psu.usb.addr, usb_eload.usb.addr,
+                                WATCHDOG_TIMEOUT) as watchdog:
+        usb_psu.deactivate()
+        result = profile_replay(usb_psu, usb_eload, profile.t.to_list(),
+                                profile.isc.to_list(), isc=PV_ISC,
+                                voc=PV_OCV, chan=ELOAD_CH, vout=VOUT,
+                                check_stability=CHECK_STABILITY,
+                                receiver=receiver, watchdog=watchdog,
+                                dashboard=dashboard,
+                                capture_file=powercapture if CAPTURE else None)
+
+    # Close PSU and eload.
+    # Passing None, None indicates this is not a signal (SIGINT).
+    timeToExit(None, None)
+
+    if result["stability"] is not None:
+        result["stability"].to_csv(stabilityfile, index=False)
+    if result["power"] is not None:
+        result["power"].to_csv(powerfile, index=False)
+    if result["telemetry"] is not None:
+        result["telemetry"].to_csv(telemetryfile, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 import sys
 import os
 import signal
+from contextlib import nullcontext
 import numpy as np
-from time import sleep
-import pandas as pd
 from matplotlib import pyplot as plt
 ##################################################
-from usb_pyvisa_wrapper import usb_pyvisa
-from keysight_n5769a import keysight_n5769a_usb as usb_n5769a
-from keysight_el34243a import keysight_el34243a_usb as usb_el34243a
+from watchdog import safe_state_watchdog
+from dashboard import live_dashboard
+from sweeps import open_instruments, iv_sweep, plot_iv
 ##################################################
+# PV panel IV sweep. The sweep itself is sweeps.iv_sweep, this script only
+# holds the test parameters and saves the results.
+
 # Test parameters:
 script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
 
@@ -30,24 +32,43 @@ SWEEP_INPUT_VOLTS = np.flip(np.hstack([np.linspace(0.5, 11, 4, endpoint=True),
                                        PV_VOC
                                        ]))
 
-# Define the eload's mode of sweep. The options are:
-#   "CURR"  :   constant current
-#   "RES"   :   constant resistance
-#   "POW"   :   constant power
-#   "VOLT"   :  constant voltage
-OUTPUT_TYPE = "VOLT"  # "CURR", "RES", "POW" or "VOLT"
-
 # Define how long to let the load run before taking a measurement:
 RUNTIME = 1  # measurement taken after this many seconds
 
 SETTLE_TIME = 1  # wait time after changing equipment settings
 
+# Measure each point with a burst of fast samples and check it for
+# oscillation (see stability.py). Unstable points are re-settled and
+# measured again, and the stability metrics are logged with each row.
+CHECK_STABILITY = True
+
+# Fit the panel model after every point and skip the rest of the flat
+# current region once the MPP is pinned down (see mpp_fit.py):
+#   None        :   measure every voltage
+#   "stop"      :   skip the rest of the region
+#   "skip_flat" :   skip it, but still measure the last (lowest) voltage
+MPP_EARLY_STOP = None
+
+# The PSU and eload are turned off if a point takes longer than this
+# (e.g. the script hangs in a VISA call), see watchdog.py
+WATCHDOG_TIMEOUT = 30
+
+# Plot the measurements live while the sweep runs, in a separate window
+# (see dashboard.py). The final plots are still made at the end.
+LIVE_VIEW = True
+
 # Define the names for the output files:
 #   log file contains all the data in a csv file
 #   img file is the generated png plots
 TEST_NAME = "ivsweep"  # name for log files
 LOG_FILENAME = f"{TEST_NAME}.csv"
 IMG_FILENAME = f"{TEST_NAME}.png"
+JOURNAL_FILENAME = f"{TEST_NAME}.journal"
+
+# Completed points are checkpointed to the journal file as they are measured.
+# If the sweep is interrupted, rerunning with the same parameters resumes
+# from the last completed point. Set to False to always start from scratch.
+RESUME = True
 
 # Save directory for the above files
 #   Files are saved under SAVE_DIRECTORY
@@ -65,8 +86,9 @@ logfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
 imgfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
                                        f"{IMG_FILENAME}"))
 
-# Indicates whether devices are initialized:
-initialized = False
+# Checkpoints each completed point, see sweep_journal.py
+journalfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                           f"{JOURNAL_FILENAME}"))
 
 # Objects for USB-connected PSU and Eload:
 usb_psu = None
@@ -76,7 +98,7 @@ usb_eload = None
 ##################################################
 # Signal handler and exit routine:
 def timeToExit(sig, frame):
-    if initialized:
+    if usb_psu is not None and usb_eload is not None:
         # Did not catch a signal, so turn off and return
         # to program execution
         usb_eload.deactivate(chan=ELOAD_CH)
@@ -89,121 +111,42 @@ def timeToExit(sig, frame):
         sys.exit()
 
 
-# If Ctrl-C is pressed while the program is running,
-# the PSU and eload are turned off before exiting.
-signal.signal(signal.SIGINT, timeToExit)
-##################################################
-
-# Find connected devices and print them
-devices = usb_pyvisa.query()
-print(devices)
-
-# We know that 1x N5769A PSU and 1x EL34243A eload are connected.
-# Find the address of the connected devices based on the
-# part numbers appearing in the IDN string.
-psu_addr = usb_pyvisa.getAddrFromIdn("N5769A")
-eload_addr = usb_pyvisa.getAddrFromIdn("EL34243A")
-
-# Based on the addresses found, initialize the objects:
-usb_psu = usb_n5769a(usb_pyvisa(psu_addr))
-usb_eload = usb_el34243a(usb_pyvisa(eload_addr))
-
-# Done with initializing:
-initialized = True
-
-# Make sure power supply and eload outputs are off
-usb_psu.deactivate()
-usb_eload.deactivate(chan=ELOAD_CH)
-
-# Initialize DataFrame.
-# New data will be added to this DataFrame.
-data_log = pd.DataFrame({"Vout":    [],
-                         "Iout":    [],
-                         "Pout":    []
-                         })
-
-##################################################
-# Run sweeps:
-sweep_count = 0
-
-usb_eload.deactivate(chan=ELOAD_CH)
-
-# Set the power supply voltage and current, and turn it on:
-usb_psu.setCurrent(SWEEP_INPUT_CURR_LIMIT)
-usb_psu.setVoltage(PV_VOC)
-usb_psu.activate()
-
-usb_eload.setMode(OUTPUT_TYPE, remote_sense=False, chan=ELOAD_CH)
-usb_eload.setValue(PV_VOC, chan=ELOAD_CH)
-# usb_eload.setSlew(200, chan=ELOAD_CH)
-
-for input_volts in SWEEP_INPUT_VOLTS:
-    sweep_count += 1  # Keep track of test number
-    print(f"Sweep {sweep_count}/{len(SWEEP_INPUT_VOLTS)}: {input_volts:.2f} V")
-
-    usb_psu.setCurrent(1)
-    sleep(SETTLE_TIME)
-    usb_eload.setValue(input_volts, chan=ELOAD_CH)
-    usb_eload.activate(chan=ELOAD_CH)
-    sleep(SETTLE_TIME)
-    usb_psu.setCurrent(SWEEP_INPUT_CURR_LIMIT)
-
-    # Let load run for this long:
-    sleep(RUNTIME)
-
-    # Read data from eload:
-    vout = usb_eload.readVoltage(chan=ELOAD_CH)
-    iout = usb_eload.readCurrent(chan=ELOAD_CH)
-    pout = vout * iout
-
-    usb_eload.deactivate(chan=ELOAD_CH)
-
-    # Append results to DataFrame:
-    new_data = pd.DataFrame({"Vout":    [vout],
-                             "Iout":    [iout],
-                             "Pout":    [pout]
-                             })
-
-    data_log = pd.concat([data_log, new_data], ignore_index=True)
-
-##################################################
-# Close PSU and eload.
-# Passing None, None indicates this is not a signal (SIGINT).
-timeToExit(None, None)
-
-##################################################
-# Save data:
-data_log.to_csv(logfile, index=False)
-##################################################
-# Plot Vout and Efficiency curves:
-
-sweep_v = data_log["Vout"].tolist()
-sweep_i = data_log["Iout"].tolist()
-sweep_p = data_log["Pout"].tolist()
-
-max_p = max(sweep_p)
-max_v = sweep_v[np.argmax(sweep_p)]
-print(f"Max power point = {max_p:.1f} W at {max_v:.1f} V")
-
-fig, axV = plt.subplots(figsize=(10, 6))
-color = 'tab:blue'
-axV.set_xlabel('Voltage [V]')
-axV.set_ylabel('Current [A]', color=color)
-axV.plot(sweep_v, sweep_i, color=color)
-axV.tick_params(axis='y', labelcolor=color)
-
-axP = axV.twinx()
-
-color = 'tab:red'
-axP.set_ylabel('Power [W]', color=color)
-axP.plot(sweep_v, sweep_p, color=color)
-axP.tick_params(axis='y', labelcolor=color)
-
-fig.suptitle('PV sweep', fontweight="bold")
-
-plt.tight_layout()
-plt.savefig(imgfile, dpi=200)   # Save plots
-
 ##################################################
-# Show plot:
-plt.show()
+def main():
+    global usb_psu, usb_eload
+
+    # If Ctrl-C is pressed while the program is running,
+    # the PSU and eload are turned off before exiting.
+    signal.signal(signal.SIGINT, timeToExit)
+    usb_psu, usb_eload = open_instruments()
+
+    dashboard = live_dashboard("iv", TEST_NAME) if LIVE_VIEW else None
+
+    # Turns both instruments off if the script stalls or crashes, see
+    # watchdog.py
+    with (dashboard if dashboard is not None else nullcontext()), \
+            safe_state_watchdog(usb_psu.usb.addr, usb_eload.usb.addr,
+                                WATCHDOG_TIMEOUT) as watchdog:
+        data_log = iv_sweep(
+            usb_psu, usb_eload, SWEEP_INPUT_VOLTS,
+            isc=SWEEP_INPUT_CURR_LIMIT, voc=PV_VOC,
+            journal_file=journalfile, resume=RESUME, watchdog=watchdog,
+            dashboard=dashboard,
+            eload_channel=ELOAD_CH, runtime=RUNTIME, settle_time=SETTLE_TIME,
+            check_stability=CHECK_STABILITY, mpp_early_stop=MPP_EARLY_STOP,
+            watchdog_timeout=WATCHDOG_TIMEOUT)
+
+    # Close PSU and eload.
+    # Passing None, None indicates this is not a signal (SIGINT).
+    timeToExit(None, None)
+
+    data_log.to_csv(logfile, index=False)
+    # All points are saved, so the next run starts a fresh sweep
+    os.remove(journalfile)
+
+    plot_iv(data_log, imgfile)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import sys
+import os
+import signal
+import numpy as np
+from time import sleep
+import pandas as pd
+from matplotlib import pyplot as plt
+##################################################
+from watchdog import safe_state_watchdog
+from sweeps import open_instruments
+##################################################
+# Fast IV trace:
+# Instead of stepping the eload through discrete voltages like
+# panel_ivsweep.py, the eload's CV setpoint is slewed from VOC down to
+# ~0 V at a controlled rate while its digitizer captures V and I
+# continuously. This gives a dense IV curve in a few seconds. The trace is
+# then repeated from ~0 V back up to VOC: if the two directions disagree,
+# the slew is too fast for the PSU to follow and should be reduced.
+
+# Test parameters:
+script_directory = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+ELOAD_CH = 2  # Eload channel to connect to
+
+# Set the current limit, corresponding to PV panel's ISC.
+# 5.21 -> 100% irradance
+SWEEP_INPUT_CURR_LIMIT = 5.21
+
+PV_VOC = 24.3
+TRACE_END_VOLTS = 0.5   # trace from PV_VOC down to this voltage
+
+# CV slew rate of the eload in V/s. The trace takes
+# (PV_VOC - TRACE_END_VOLTS) / SLEW_RATE seconds in each direction.
+SLEW_RATE = 10
+
+# Digitizer sample interval in seconds
+SAMPLE_INTERVAL = 0.001
+
+# Extra capture time after the ramp ends, as a fraction of the ramp time
+CAPTURE_MARGIN = 0.1
+
+SETTLE_TIME = 1  # wait time after changing equipment settings
+
+# The PSU and eload are turned off if the script stalls for longer than
+# this, or a trace takes this much longer than its capture time (e.g. the
+# script hangs in a VISA call), see watchdog.py
+WATCHDOG_TIMEOUT = 10
+
+# The down and up traces are compared on a common voltage grid. If the
+# current differs by more than this fraction of ISC anywhere, or the max
+# power differs by more than this fraction, a warning is printed.
+HYSTERESIS_CURR_TOL = 0.02
+HYSTERESIS_POWER_TOL = 0.01
+
+# Define the names for the output files:
+#   log file contains all the data in a csv file
+#   img file is the generated png plots
+TEST_NAME = "ivtrace"  # name for log files
+LOG_FILENAME = f"{TEST_NAME}.csv"
+IMG_FILENAME = f"{TEST_NAME}.png"
+
+# Save directory for the above files
+#   Files are saved under SAVE_DIRECTORY
+SAVE_DIRECTORY = script_directory
+
+##################################################
+# Setup:
+
+# Saves: Vout, Iout, Pout, Direction
+#   in a csv file
+logfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                       f"{LOG_FILENAME}"))
+
+# Saves the generated plots of Iout vs Vout and Pout vs Vout
+imgfile = os.path.abspath(os.path.join(SAVE_DIRECTORY,
+                                       f"{IMG_FILENAME}"))
+
+ramp_time = (PV_VOC - TRACE_END_VOLTS) / SLEW_RATE
+capture_time = ramp_time * (1 + CAPTURE_MARGIN)
+capture_points = int(np.ceil(capture_time / SAMPLE_INTERVAL))
+
+# Objects for USB-connected PSU and Eload:
+usb_psu = None
+usb_eload = None
+
+
+##################################################
+# Signal handler and exit routine:
+def timeToExit(sig, frame):
+    if usb_psu is not None and usb_eload is not None:
+        # Did not catch a signal, so turn off and return
+        # to program execution
+        usb_eload.deactivate(chan=ELOAD_CH)
+        usb_eload.setSlew("MAX", chan=ELOAD_CH)
+        usb_psu.setVoltage(0)
+        usb_psu.setCurrent(0.1)
+        usb_psu.deactivate()
+    if sig is not None or frame is not None:
+        # Caught a signal, so exit now
+        print(sig, frame)
+        sys.exit()
+
+
+def captureRamp(watchdog, target_volts):
+    # Start the digitizer, then slew the CV setpoint to target_volts.
+    # Returns the captured voltages and currents.
+    with watchdog.deadline(capture_time + WATCHDOG_TIMEOUT, "trace"):
+        usb_eload.startDigitizer(chan=ELOAD_CH)
+        usb_eload.setValue(target_volts, chan=ELOAD_CH)
+        sleep(capture_time)
+        v = np.array(usb_eload.fetchVoltageArray(chan=ELOAD_CH))
+        i = np.array(usb_eload.fetchCurrentArray(chan=ELOAD_CH))
+    return v, i
+
+
+def hysteresis(v_down, i_down, v_up, i_up, num=200):
+    # Compare the two traces on a common voltage grid.
+    # Returns the max current difference and the two max powers.
+    lo = max(v_down.min(), v_up.min())
+    hi = min(v_down.max(), v_up.max())
+    grid = np.linspace(lo, hi, num)
+    # np.interp needs increasing x
+    idx_d = np.argsort(v_down)
+    idx_u = np.argsort(v_up)
+    i_d = np.interp(grid, v_down[idx_d], i_down[idx_d])
+    i_u = np.interp(grid, v_up[idx_u], i_up[idx_u])
+    return (np.max(np.abs(i_d - i_u)),
+            np.max(v_down * i_down), np.max(v_up * i_up))
+
+
+def plot_trace(v_down, i_down, v_up, i_up, imgfile):
+    # Iout and Pout vs Vout, both directions
+    fig, axV = plt.subplots(figsize=(10, 6))
+    axP = axV.twinx()
+    axV.set_xlabel('Voltage [V]')
+    axV.set_ylabel('Current [A]', color='tab:blue')
+    axP.set_ylabel('Power [W]', color='tab:red')
+    axV.tick_params(axis='y', labelcolor='tab:blue')
+    axP.tick_params(axis='y', labelcolor='tab:red')
+
+    for v, i, style, direction in [(v_down, i_down, '-', "down"),
+                                   (v_up, i_up, '--', "up")]:
+        axV.plot(v, i, style, color='tab:blue', label=f"I ({direction})")
+        axP.plot(v, v * i, style, color='tab:red',
+                 label=f"P ({direction})")
+
+    fig.legend(loc="lower left")
+    fig.suptitle(f'PV trace at {SLEW_RATE} V/s', fontweight="bold")
+
+    plt.tight_layout()
+    plt.savefig(imgfile, dpi=200)   # Save plots
+
+
+##################################################
+def main():
+    global usb_psu, usb_eload
+
+    # If Ctrl-C is pressed while the program is running,
+    # the PSU and eload are turned off before exiting.
+    signal.signal(signal.SIGINT, timeToExit)
+    usb_psu, usb_eload = open_instruments()
+
+    # Turns both instruments off if the script stalls or crashes, see
+    # watchdog.py
+    with safe_state_watchdog(usb_psu.usb.addr, usb_eload.usb.addr,
+                             WATCHDOG_TIMEOUT) as watchdog:
+        # Make sure power supply and eload outputs are off
+        usb_psu.deactivate()
+        usb_eload.deactivate(chan=ELOAD_CH)
+
+        # Set the power supply voltage and current, and turn it on:
+        usb_psu.setCurrent(SWEEP_INPUT_CURR_LIMIT)
+        usb_psu.setVoltage(PV_VOC)
+        usb_psu.activate()
+
+        # Start the eload at VOC (no current), then limit its slew rate
+        usb_eload.setMode("VOLT", remote_sense=False, chan=ELOAD_CH)
+        usb_eload.setValue(PV_VOC, chan=ELOAD_CH)
+        usb_eload.activate(chan=ELOAD_CH)
+        sleep(SETTLE_TIME)
+        usb_eload.setSlew(SLEW_RATE, chan=ELOAD_CH)
+        usb_eload.setupDigitizer(capture_points, SAMPLE_INTERVAL,
+                                 chan=ELOAD_CH)
+
+        print(f"Tracing {PV_VOC:.1f} V -> {TRACE_END_VOLTS:.1f} V "
+              f"at {SLEW_RATE} V/s ({capture_points} samples)")
+        v_down, i_down = captureRamp(watchdog, TRACE_END_VOLTS)
+        watchdog.beat()
+        sleep(SETTLE_TIME)
+
+        print(f"Tracing {TRACE_END_VOLTS:.1f} V -> {PV_VOC:.1f} V "
+              f"at {SLEW_RATE} V/s ({capture_points} samples)")
+        v_up, i_up = captureRamp(watchdog, PV_VOC)
+
+    # Close PSU and eload.
+    # Passing None, None indicates this is not a signal (SIGINT).
+    timeToExit(None, None)
+
+    # Hysteresis check:
+    di_max, p_down, p_up = hysteresis(v_down, i_down, v_up, i_up)
+    print(f"Max power point: {p_down:.1f} W (down), {p_up:.1f} W (up)")
+    print(f"Max current difference between directions: {di_max:.3f} A")
+    if (di_max > HYSTERESIS_CURR_TOL * SWEEP_INPUT_CURR_LIMIT
+            or abs(p_down - p_up) > HYSTERESIS_POWER_TOL
+            * max(p_down, p_up)):
+        print("WARNING: the traces disagree, reduce SLEW_RATE")
+
+    # Save data:
+    data_log = pd.DataFrame({"Vout":        np.hstack([v_down, v_up]),
+                             "Iout":        np.hstack([i_down, i_up]),
+                             "Pout":        np.hstack([v_down * i_down,
+                                                       v_up * i_up]),
+                             "Direction":   (["down"] * len(v_down)
+                                             + ["up"] * len(v_up))
+                             })
+    data_log.to_csv(logfile, index=False)
+
+    plot_trace(v_down, i_down, v_up, i_up, imgfile)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
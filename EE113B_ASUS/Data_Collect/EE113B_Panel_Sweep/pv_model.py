@@ -0,0 +1,80 @@
+# Single-diode PV panel model.
+#
+#   I = Iph - I0 * (exp((V + I*Rs) / a) - 1) - (V + I*Rs) / Rsh
+#
+# with a = n * Ns * Vt (modified ideality factor). Irradiance g (1 = the
+# panel's rating, like the normalized levels in mppt_profile.csv) scales
+# Iph. I0 is derived so that the open-circuit voltage at g = 1 is VOC.
+# The defaults match the emulated panel used on the bench
+# (SWEEP_INPUT_CURR_LIMIT = 5.21, PV_VOC = 24.3 in panel_ivsweep.py), and
+# pv_panel.fit refits a and Rs to a measured ivsweep csv.
+#
+# All methods are vectorized: v and g can be arrays of the same shape.
+
+import numpy as np
+
+
+PV_ISC = 5.21
+PV_VOC = 24.3
+
+NEWTON_ITERATIONS = 12
+MAX_EXPONENT = 60  # keeps exp() finite far beyond VOC
+
+
+class pv_panel():
+
+    def __init__(self, isc=PV_ISC, voc=PV_VOC, a=1.0, rs=0.02, rsh=300):
+        self.isc = isc
+        self.voc = voc
+        self.a = a
+        self.rs = rs
+        self.rsh = rsh
+        # Short circuit: I = isc at V = 0 (diode current negligible)
+        self.iph = isc * (1 + rs / rsh)
+        # Open circuit: I = 0 at V = voc
+        self.i0 = (self.iph - voc / rsh) / np.expm1(voc / a)
+
+    def current(self, v, g=1.0):
+        # Panel current at voltage v and irradiance g, by Newton's method
+        # starting from the photo current
+        v = np.asarray(v, dtype=float)
+        iph = self.iph * np.asarray(g, dtype=float)
+        i = np.broadcast_to(iph, np.broadcast(v, iph).shape).copy()
+        for _ in range(NEWTON_ITERATIONS):
+            vd = v + i * self.rs
+            e = np.exp(np.minimum(vd / self.a, MAX_EXPONENT))
+            f = iph - self.i0 * (e - 1) - vd / self.rsh - i
+            df = -self.i0 * self.rs / self.a * e - self.rs / self.rsh - 1
+            i = i - f / df
+        return i
+
+    def power(self, v, g=1.0):
+        return v * self.current(v, g)
+
+    def mpp(self, g=1.0, num=512):
+        # Maximum power point (vmpp, pmpp) for each irradiance in g,
+        # evaluated on a voltage grid up to VOC
+        g = np.atleast_1d(np.asarray(g, dtype=float))
+        v = np.linspace(0, self.voc, num)
+        p = v[None, :] * self.current(v[None, :], g[:, None])
+        k = np.argmax(p, axis=1)
+        return v[k], p[np.arange(len(g)), k]
+
+    @classmethod
+    def fit(cls, v, i, isc=None, voc=None):
+        # Fit a and Rs to a measured IV curve by grid search, keeping the
+        # measured short-circuit current and open-circuit voltage
+        v = np.asarray(v, dtype=float)
+        i = np.asarray(i, dtype=float)
+        if isc is None:
+            isc = i.max()
+        if voc is None:
+            voc = v[np.argmin(np.abs(i))]
+        best = None
+        for a in np.linspace(0.4, 3.0, 53):
+            for rs in np.linspace(0, 0.5, 26):
+                panel = cls(isc, voc, a, rs)
+                err = np.sum((panel.current(v) - i) ** 2)
+                if best is None or err < best[0]:
+                    best = (err, panel)
+        return best[1]
@@ -0,0 +1,270 @@
+# Streaming analysis of profile replay captures.
+#
+# Reads a capture written by sweeps.profile_replay (mppt_step.py with
+# CAPTURE = True, see capture_log.py) block by block and computes, in a
+# single pass and without holding the capture in memory:
+#
+#   rolling mean    eload power averaged over the last ROLLING_WINDOW
+#                   seconds, at every reading
+#   per step        for every profile step (the rows between two profile
+#                   points, column "step"): delivered and available energy
+#                   and the tracking efficiency
+#
+#                       energy delivered / energy available at the MPP
+#
+#                   (available = panel MPP power at the emulated ISC, times
+#                   CONVERTER_EFF, as in mppt_sim.py), the settling time
+#                   (until the power averaged over SETTLE_BIN stays within
+#                   SETTLE_BAND of the rolling mean at the end of the step)
+#                   and the ripple (power minus its SETTLE_BIN mean, RMS
+#                   and peak-to-peak) after settling
+#
+# The stages are generators passing blocks of rows along, so they can be
+# chained with other per-block code:
+#
+#   cap = capture_reader("mppt_step_power.cap")
+#   stream = rolling_mean(cap.chunks(columns=REPLAY_COLUMNS))
+#   steps = pd.DataFrame(step_stats(stream, mpp_table(pv_panel()),
+#                                   cap.meta["isc"]))
+#
+# Within a step only per-bin (SETTLE_BIN) aggregates are kept, so memory
+# depends on the step length, not on the sample rate.
+#
+# Usage:
+#   python replay_stats.py mppt_step_power.cap
+#   python replay_stats.py mppt_step_power.cap --iv-library iv_library.npz
+#   python replay_stats.py mppt_step_power.cap --rolling-out rolling.csv
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+##################################################
+from capture_log import capture_reader, CHUNK_ROWS
+from pv_model import pv_panel
+from iv_library import iv_library
+from mppt_sim import mpp_table, CONVERTER_EFF
+##################################################
+
+REPLAY_COLUMNS = ["t", "step", "isc", "Pout"]
+ROLLING_WINDOW = 1.0    # [s] rolling mean window
+SETTLE_BIN = 0.05       # [s] time resolution of the settling time
+SETTLE_BAND = 0.02      # settled within this fraction of the final power
+SETTLE_MIN_BAND = 0.5   # [W] but never a band narrower than this
+ROLLING_OUT_INTERVAL = 0.1  # [s] rolling mean rows saved by --rolling-out
+
+STEP_COLUMNS = ["step", "t_start", "t_end", "isc_start", "isc_end",
+                "samples", "energy", "available", "tracking_eff",
+                "avg_power", "settling_time", "ripple_rms", "ripple_pp"]
+
+
+##################################################
+# Stages:
+def rolling_mean(blocks, window=ROLLING_WINDOW):
+    # Add column "Pavg": mean of Pout over the readings of the last window
+    # seconds. The readings still inside the window are carried over to
+    # the next block.
+    carry_t = np.empty(0)
+    carry_p = np.empty(0)
+    for block in blocks:
+        t = np.concatenate([carry_t, block["t"]])
+        p = np.concatenate([carry_p, block["Pout"]])
+        csum = np.concatenate([[0], np.cumsum(p)])
+        new = np.arange(len(carry_t), len(t))
+        first = np.searchsorted(t, t[new] - window, side="right")
+        block["Pavg"] = (csum[new + 1] - csum[first]) / (new + 1 - first)
+        keep = np.searchsorted(t, t[-1] - window, side="right")
+        carry_t, carry_p = t[keep:], p[keep:]
+        yield block
+
+
+def save_rolling(blocks, filename, interval=ROLLING_OUT_INTERVAL):
+    # Pass the blocks through, writing t, Pavg every interval seconds
+    with open(filename, "w", newline="") as f:
+        f.write("t,Pavg\n")
+        next_t = None
+        for block in blocks:
+            t = block["t"]
+            if len(t):
+                if next_t is None:
+                    next_t = t[0]
+                marks = np.arange(next_t, t[-1] + interval / 2, interval)
+                rows = np.searchsorted(t, marks)
+                rows = rows[rows < len(t)]
+                if len(rows):
+                    pd.DataFrame({"t": t[rows],
+                                  "Pavg": block["Pavg"][rows]}).to_csv(
+                        f, index=False, header=False)
+                    next_t = marks[len(rows) - 1] + interval
+            yield block
+
+
+class _step_accumulator():
+    # Running sums of one profile step, fed in runs of rows
+
+    def __init__(self, step, t, isc):
+        self.step = step
+        self.t_start = t
+        self.isc_start = isc
+        self.samples = 0
+        self.span = 0.0     # time covered by the energy intervals
+        self.energy = 0.0
+        self.available = 0.0
+        # Per SETTLE_BIN: power sums and range. Settling and ripple are
+        # judged on the bins, which lag by at most one bin, not on the
+        # rolling mean, which lags by up to a whole window.
+        self.bins = {"id": [], "n": [], "p_sum": [], "p_sum2": [],
+                     "p_min": [], "p_max": []}
+
+    def add(self, t, isc, pout, pavg, span, energy, available):
+        self.samples += len(t)
+        self.span += span
+        self.energy += energy
+        self.available += available
+        self.t_end = t[-1]
+        self.isc_end = isc[-1]
+
+        ids = np.floor((t - self.t_start) / SETTLE_BIN).astype(np.int64)
+        starts = np.flatnonzero(np.diff(ids, prepend=ids[0] - 1))
+        stats = {"id": ids[starts],
+                 "n": np.diff(np.append(starts, len(t))),
+                 "p_sum": np.add.reduceat(pout, starts),
+                 "p_sum2": np.add.reduceat(pout * pout, starts),
+                 "p_min": np.minimum.reduceat(pout, starts),
+                 "p_max": np.maximum.reduceat(pout, starts)}
+        bins = self.bins
+        if bins["id"] and bins["id"][-1] == stats["id"][0]:
+            # The first bin continues the last one of the previous run
+            for name, combine in [("n", sum), ("p_sum", sum),
+                                  ("p_sum2", sum), ("p_min", min),
+                                  ("p_max", max)]:
+                bins[name][-1] = combine([bins[name][-1], stats[name][0]])
+            stats = {name: values[1:] for name, values in stats.items()}
+        for name, values in stats.items():
+            bins[name].extend(values.tolist())
+        self.final = pavg[-1]
+
+    def result(self):
+        row = {"step": self.step, "t_start": self.t_start,
+               "t_end": self.t_end, "isc_start": self.isc_start,
+               "isc_end": self.isc_end, "samples": self.samples,
+               "energy": self.energy, "available": self.available,
+               "tracking_eff": (self.energy / self.available
+                                if self.available > 0 else np.nan)}
+        row["avg_power"] = (self.energy / self.span if self.span > 0
+                            else np.nan)
+        duration = self.t_end - self.t_start
+
+        bins = {name: np.array(values) for name, values in self.bins.items()}
+        band = max(SETTLE_BAND * abs(self.final), SETTLE_MIN_BAND)
+        bin_mean = bins["p_sum"] / bins["n"]
+        outside = np.flatnonzero(np.abs(bin_mean - self.final) > band)
+        settled = outside[-1] + 1 if len(outside) else 0
+        settle_bins = bins["id"][outside[-1]] + 1 if len(outside) else 0
+        row["settling_time"] = min(settle_bins * SETTLE_BIN, duration)
+        n = bins["n"][settled:].sum()
+        if n > 1:
+            # Spread around each bin's own mean
+            p_sum = bins["p_sum"][settled:]
+            var = (bins["p_sum2"][settled:] - p_sum ** 2
+                   / bins["n"][settled:]).sum() / n
+            row["ripple_rms"] = np.sqrt(max(var, 0.0))
+            row["ripple_pp"] = (bins["p_max"][settled:]
+                                - bins["p_min"][settled:]).max()
+        else:
+            row["ripple_rms"] = row["ripple_pp"] = np.nan
+        return row
+
+
+def step_stats(blocks, table, isc_ref, converter_eff=CONVERTER_EFF):
+    # One dict (STEP_COLUMNS) per profile step, yielded when the step ends.
+    # table is mpp_table(panel): irradiance -> MPP power, the irradiance of
+    # each reading is its isc / isc_ref.
+    acc = None
+    prev = None     # last (t, Pout, available power) of the previous run
+    for block in blocks:
+        t, step, isc = block["t"], block["step"], block["isc"]
+        pout, pavg = block["Pout"], block["Pavg"]
+        pmpp = np.interp(isc / isc_ref, *table) * converter_eff
+        # Trapezoid energy of the interval ending at each reading
+        t0 = np.concatenate([[prev[0] if prev else t[0]], t[:-1]])
+        p0 = np.concatenate([[prev[1] if prev else pout[0]], pout[:-1]])
+        a0 = np.concatenate([[prev[2] if prev else pmpp[0]], pmpp[:-1]])
+        dt = t - t0
+        energy = (pout + p0) / 2 * dt
+        available = (pmpp + a0) / 2 * dt
+
+        starts = np.flatnonzero(np.diff(step, prepend=-1 if acc is None
+                                        else acc.step) != 0)
+        bounds = np.append(np.insert(starts, 0, 0), len(t))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if a == b:
+                continue
+            if acc is None or step[a] != acc.step:
+                if acc is not None:
+                    yield acc.result()
+                acc = _step_accumulator(int(step[a]), t[a], isc[a])
+            acc.add(t[a:b], isc[a:b], pout[a:b], pavg[a:b], dt[a:b].sum(),
+                    energy[a:b].sum(), available[a:b].sum())
+        if len(t):
+            prev = (t[-1], pout[-1], pmpp[-1])
+    if acc is not None:
+        yield acc.result()
+
+
+##################################################
+def analyze_replay(filename, panel=None, window=ROLLING_WINDOW,
+                   rows=CHUNK_ROWS, rolling_file=None):
+    # Per-step table and overall summary of a replay capture
+    cap = capture_reader(filename)
+    panel = pv_panel() if panel is None else panel
+    stream = rolling_mean(cap.chunks(rows, columns=REPLAY_COLUMNS), window)
+    if rolling_file is not None:
+        stream = save_rolling(stream, rolling_file)
+    steps = pd.DataFrame(step_stats(stream, mpp_table(panel),
+                                    cap.meta["isc"]), columns=STEP_COLUMNS)
+    if len(cap):
+        # Host times -> seconds since the first reading
+        steps[["t_start", "t_end"]] -= float(cap["t"][0])
+    duration = steps["t_end"].max() - steps["t_start"].min()
+    summary = {"samples": len(cap),
+               "duration": duration,
+               "energy": steps["energy"].sum(),
+               "available": steps["available"].sum(),
+               "avg_power": steps["energy"].sum() / duration
+               if duration > 0 else np.nan}
+    summary["tracking_eff"] = summary["energy"] / summary["available"]
+    return steps, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay capture analysis")
+    parser.add_argument("capture", help="capture file from profile_replay")
+    parser.add_argument("--window", type=float, default=ROLLING_WINDOW,
+                        help="rolling mean window [s]")
+    parser.add_argument("--iv-library", default=None,
+                        help="available power from measured IV curves "
+                             "(iv_library.py .npz) instead of the model")
+    parser.add_argument("--rolling-out", default=None,
+                        help="csv of the rolling mean power")
+    parser.add_argument("--out", default=None,
+                        help="csv with one row per profile step "
+                             "(default: <capture>_steps.csv)")
+    args = parser.parse_args()
+
+    panel = None
+    if args.iv_library is not None:
+        panel = iv_library.load(args.iv_library)
+    steps, summary = analyze_replay(args.capture, panel, args.window,
+                                    rolling_file=args.rolling_out)
+    out = args.out or os.path.splitext(args.capture)[0] + "_steps.csv"
+    steps.to_csv(out, index=False)
+
+    print(steps.to_string(index=False, float_format="%.3f"))
+    print(f"{summary['samples']} readings over {summary['duration']:.1f} s")
+    print(f"Avg power = {summary['avg_power']:.2f} W, tracking efficiency "
+          f"= {summary['tracking_eff'] * 100:.2f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Runs a sweep plan (see sweep_plan.py and plans/*.toml).
+#
+# Usage:
+#   python run_sweep.py plans/ivsweep.toml
+#   python run_sweep.py plans/effsweep.toml --save-dir results --no-resume
+#   python run_sweep.py plans/ivsweep.toml --live
+#
+# Results are saved as <name>.csv and <name>.png in the save directory, in
+# the same format as panel_ivsweep.py / eff_sweep.py. Completed points are
+# checkpointed to <name>.journal so an interrupted plan can be resumed.
+# When the plan sets `settle_tolerance`, the measured settle time of every
+# transition is appended to settle_traces.csv, which the scheduler
+# (order = "scheduled", see sweep_scheduler.py) learns its cost model from.
+
+import sys
+import os
+import signal
+import argparse
+from contextlib import nullcontext
+from matplotlib import pyplot as plt
+##################################################
+from watchdog import safe_state_watchdog
+from dashboard import live_dashboard
+from sweep_journal import sweep_journal
+from sweep_plan import load_plan, compile_plan, plan_params
+from sweep_scheduler import transition_cost_model, read_traces, estimate_time
+from sweeps import open_instruments, run_plan, plot_iv, plot_efficiency
+##################################################
+
+TRACES_FILENAME = "settle_traces.csv"
+
+# Objects for USB-connected PSU and Eload:
+usb_psu = None
+usb_eload = None
+eload_ch = None
+
+
+##################################################
+# Signal handler and exit routine:
+def timeToExit(sig, frame):
+    if usb_psu is not None and usb_eload is not None:
+        # Did not catch a signal, so turn off and return
+        # to program execution
+        usb_eload.deactivate(chan=eload_ch)
+        usb_psu.setVoltage(0)
+        usb_psu.setCurrent(0.1)
+        usb_psu.deactivate()
+    if sig is not None or frame is not None:
+        # Caught a signal, so exit now
+        print(sig, frame)
+        sys.exit()
+
+
+##################################################
+def main():
+    global usb_psu, usb_eload, eload_ch
+
+    parser = argparse.ArgumentParser(description="Run a sweep plan")
+    parser.add_argument("plan", help="sweep plan file (.toml/.yaml)")
+    parser.add_argument("--save-dir", default=None,
+                        help="directory for results (default: plan's dir)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="ignore any journal from an interrupted run")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the compiled setpoints and exit")
+    parser.add_argument("--live", action="store_true",
+                        help="plot the points live in a separate window")
+    parser.add_argument("--no-show", action="store_true",
+                        help="save the plot without showing it")
+    args = parser.parse_args()
+
+    plan = load_plan(args.plan)
+    save_dir = args.save_dir or os.path.dirname(os.path.abspath(args.plan))
+    tracefile = os.path.join(save_dir, TRACES_FILENAME)
+
+    # Learn the transition cost model from past sweeps, if any
+    model = transition_cost_model(plan["settle_time"])
+    model.fit(read_traces(tracefile))
+    points = compile_plan(plan, model)
+    # With settle detection the measurement wait is part of the learned
+    # transition time, otherwise every point waits the full runtime
+    runtime = plan["runtime"] if plan["settle_tolerance"] is None else 0
+    estimate = estimate_time(points, model, runtime,
+                             plan["eload_off_between_points"])
+    print(f"Plan {plan['name']}: {len(points)} points, estimated "
+          f"{estimate / 60:.1f} min ({model.num_traces} settle traces)")
+
+    if args.dry_run:
+        for p in points:
+            print(f"  sweep {p['sweep']}: psu {p['psu_volts']:.2f} V "
+                  f"{p['psu_curr']:.2f} A, eload {p['eload']:.3f}"
+                  f"{' (reset)' if p.get('reset') else ''}")
+        return
+
+    os.makedirs(save_dir, exist_ok=True)
+    logfile = os.path.join(save_dir, f"{plan['name']}.csv")
+    imgfile = os.path.join(save_dir, f"{plan['name']}.png")
+    journalfile = os.path.join(save_dir, f"{plan['name']}.journal")
+
+    journal = sweep_journal(journalfile, plan_params(plan),
+                            resume=not args.no_resume)
+
+    # If Ctrl-C is pressed while the program is running,
+    # the PSU and eload are turned off before exiting.
+    eload_ch = plan["eload_channel"]
+    signal.signal(signal.SIGINT, timeToExit)
+    usb_psu, usb_eload = open_instruments()
+
+    print("==========================")
+    print("  Starting test...")
+    print("==========================")
+    dashboard = live_dashboard(plan["kind"], plan["name"]) if args.live \
+        else None
+    # Turns both instruments off if the plan stalls or crashes
+    with (dashboard if dashboard is not None else nullcontext()), \
+            safe_state_watchdog(usb_psu.usb.addr, usb_eload.usb.addr,
+                                plan["watchdog_timeout"]) as watchdog:
+        data_log = run_plan(plan, points, usb_psu, usb_eload, journal,
+                            tracefile, watchdog, dashboard)
+
+    # Close PSU and eload.
+    timeToExit(None, None)
+
+    data_log.to_csv(logfile, index=False)
+    journal.remove()
+
+    if plan["kind"] == "iv":
+        plot_iv(data_log, imgfile)
+    else:
+        plot_efficiency(data_log, imgfile)
+    if not args.no_show:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Paired 2-wire / 4-wire voltage sense.
+#
+# Instead of running a full sweep with the eload on internal sense and
+# another on external sense (2_wire_effsweep.csv / 4_wire_effsweep.csv),
+# measure_pair reads both at the same operating point, in the settle window
+# of the normal measurement: the sense source is toggled between readings
+# in an INT, EXT, EXT, INT pattern so a linear drift of the point cancels
+# out of the difference, and the original source is restored afterwards.
+#
+# Only valid in CURR mode: there the sense source changes what the eload
+# reads, not the current it draws. In VOLT/RES/POW mode the eload
+# regulates on the sensed voltage, so toggling it moves the point.
+#
+# The difference is the drop in the cables and contacts between the
+# converter output (sense leads) and the eload terminals:
+#
+#   Vout_ext - Vout_int = R_cable * Iout (+ offset)
+#
+# analyze() fits R_cable and the offset over a sweep and reports the
+# efficiency error a 2-wire measurement would have.
+#
+# Usage:
+#   python sense_pair.py effsweep.csv
+#   python sense_pair.py --two-wire 2_wire_effsweep.csv \
+#       --four-wire 4_wire_effsweep.csv
+
+import argparse
+import numpy as np
+import pandas as pd
+
+
+PAIRS = 2   # INT, EXT, EXT, INT cycles per point
+
+SENSE_COLUMNS = ["Vout_int", "Vout_ext", "Rsense"]
+
+# Outputs of the two separate sweeps are matched on this current [A]
+CURRENT_RESOLUTION = 0.01
+
+
+##################################################
+# Measurement:
+def measure_pair(eload, chan, remote_sense, pairs=PAIRS):
+    # Returns {"Vout_int", "Vout_ext", "Rsense"} at the present point and
+    # leaves the eload on the sense source given by remote_sense
+    v_int = []
+    v_ext = []
+    i = []
+    try:
+        for _ in range(pairs):
+            for remote in [False, True, True, False]:
+                eload.setSenseSource(remote, chan=chan)
+                v = eload.readVoltage(chan=chan)
+                (v_ext if remote else v_int).append(v)
+            i.append(eload.readCurrent(chan=chan))
+    finally:
+        eload.setSenseSource(remote_sense, chan=chan)
+
+    v_int = float(np.mean(v_int))
+    v_ext = float(np.mean(v_ext))
+    iout = float(np.mean(i))
+    r = (v_ext - v_int) / iout if iout > 0 else np.nan
+    return {"Vout_int": v_int, "Vout_ext": v_ext, "Rsense": r}
+
+
+##################################################
+# Analysis:
+def pair_sweeps(two_wire, four_wire):
+    # Paired rows from two separate sweeps of the same grid, in the
+    # format of a paired sweep
+    keys = []
+    for df in [two_wire, four_wire]:
+        keys.append(df.assign(
+            Vset=df.Vin.round(),
+            Iset=(df.Iout / CURRENT_RESOLUTION).round()))
+    paired = keys[0].merge(keys[1], on=["Vset", "Iset"],
+                           suffixes=("_2w", "_4w"))
+    return pd.DataFrame({"Vin": paired.Vin_4w,
+                         "Iin": paired.Iin_4w,
+                         "Pin": paired.Pin_4w,
+                         "Iout": paired.Iout_4w,
+                         "Vout_int": paired.Vout_2w,
+                         "Vout_ext": paired.Vout_4w})
+
+
+def analyze(data):
+    # Fit of the sense drop vs. output current, and the efficiency error
+    # of the internal sense at every point
+    data = data.copy()
+    drop = data.Vout_ext - data.Vout_int
+    r, offset = np.polyfit(data.Iout, drop, 1)
+    residual = drop - (r * data.Iout + offset)
+
+    data["Drop"] = drop
+    data["Eff_int"] = data.Vout_int * data.Iout / data.Pin * 100
+    data["Eff_ext"] = data.Vout_ext * data.Iout / data.Pin * 100
+    data["Eff_error"] = data.Eff_ext - data.Eff_int
+    fit = {"R_cable": r, "offset": offset,
+           "residual_rms": float(np.sqrt(np.mean(residual ** 2)))}
+    # The cable drop does not depend on the input voltage, a spread here
+    # means the two sense readings were not taken at the same point
+    fit["R_by_vin"] = {
+        vin: np.polyfit(group.Iout, group.Drop, 1)[0]
+        for vin, group in data.groupby(data.Vin.round())
+        if len(group) > 1}
+    return fit, data
+
+
+##################################################
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cable/contact resistance from 2-wire vs 4-wire sense")
+    parser.add_argument("file", nargs="?",
+                        help="effsweep csv measured with paired sense")
+    parser.add_argument("--two-wire", help="separate 2-wire sweep csv")
+    parser.add_argument("--four-wire", help="separate 4-wire sweep csv")
+    args = parser.parse_args()
+
+    if args.file is not None:
+        data = pd.read_csv(args.file)
+        missing = [c for c in SENSE_COLUMNS if c not in data]
+        if missing:
+            parser.error(f"{args.file} has no paired sense columns "
+                         f"{missing}")
+    elif args.two_wire is not None and args.four_wire is not None:
+        data = pair_sweeps(pd.read_csv(args.two_wire),
+                           pd.read_csv(args.four_wire))
+    else:
+        parser.error("give a paired csv or both --two-wire and --four-wire")
+
+    fit, data = analyze(data)
+    print(data[["Vin", "Iout", "Vout_int", "Vout_ext", "Drop", "Eff_int",
+                "Eff_ext", "Eff_error"]].to_string(index=False,
+                                                   float_format="%.4f"))
+    print(f"Cable/contact resistance: {fit['R_cable'] * 1e3:.1f} mOhm, "
+          f"offset {fit['offset'] * 1e3:.1f} mV, "
+          f"residual {fit['residual_rms'] * 1e3:.2f} mV rms")
+    print("Per input voltage: " + ", ".join(
+        f"{vin:.0f} V: {r * 1e3:.1f} mOhm"
+        for vin, r in fit["R_by_vin"].items()))
+    print(f"2-wire efficiency error: {data.Eff_error.mean():.2f} "
+          f"%-points mean, {data.Eff_error.max():.2f} max")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Oscillation / instability detection.
+#
+# Instead of logging a single readVoltage() snapshot, measure_point takes a
+# short burst of fast samples with the eload's digitizer and computes:
+#
+#   Vstd, Istd      standard deviation of the burst
+#   Vpp, Ipp        peak-to-peak spread of the burst
+#   OscFreq         frequency of the strongest spectral peak (Hz)
+#   OscFraction     fraction of the AC energy in that peak; close to 1 for
+#                   a clean oscillation, small for broadband noise
+#
+# A point whose spread exceeds the tolerances is flagged as unstable, the
+# caller's resettle() is run (e.g. the eload off/PSU current drop dance of
+# panel_ivsweep.py) and the point is measured again, up to MAX_RETRIES
+# times. The metrics are returned so they can be logged with each row.
+
+import numpy as np
+
+
+BURST_POINTS = 256         # samples per burst
+BURST_INTERVAL = 0.0005    # digitizer sample interval in seconds
+
+VPP_TOL = 0.1   # [V] a stable point's voltage spread is below this
+IPP_TOL = 0.05  # [A] a stable point's current spread is below this
+
+MAX_RETRIES = 2
+
+STABILITY_COLUMNS = ["Vstd", "Istd", "Vpp", "Ipp",
+                     "OscFreq", "OscFraction", "Stable", "Retries"]
+
+
+def burst_metrics(v, i, interval=BURST_INTERVAL):
+    v = np.asarray(v, dtype=float)
+    i = np.asarray(i, dtype=float)
+    metrics = {"Vstd": float(v.std()), "Istd": float(i.std()),
+               "Vpp": float(np.ptp(v)), "Ipp": float(np.ptp(i))}
+
+    # Spectrum of the voltage with the mean removed
+    ac = np.abs(np.fft.rfft(v - v.mean())) ** 2
+    ac[0] = 0
+    total = ac.sum()
+    if total > 0:
+        k = np.argmax(ac)
+        # Count the neighboring bins too, the peak leaks into them
+        peak = ac[max(k - 1, 0):k + 2].sum()
+        metrics["OscFreq"] = float(np.fft.rfftfreq(len(v), interval)[k])
+        metrics["OscFraction"] = float(peak / total)
+    else:
+        metrics["OscFreq"] = 0.0
+        metrics["OscFraction"] = 0.0
+
+    metrics["Stable"] = bool(metrics["Vpp"] < VPP_TOL
+                             and metrics["Ipp"] < IPP_TOL)
+    return metrics
+
+
+def capture_burst(eload, chan, points=BURST_POINTS, interval=BURST_INTERVAL):
+    eload.setupDigitizer(points, interval, chan=chan)
+    eload.startDigitizer(chan=chan)
+    v = np.array(eload.fetchVoltageArray(chan=chan))
+    i = np.array(eload.fetchCurrentArray(chan=chan))
+    return v, i
+
+
+def measure_point(eload, chan, resettle=None, retries=MAX_RETRIES):
+    # Returns (mean voltage, mean current, metrics) of the last burst
+    for attempt in range(retries + 1):
+        v, i = capture_burst(eload, chan)
+        metrics = burst_metrics(v, i)
+        metrics["Retries"] = attempt
+        if metrics["Stable"]:
+            break
+        print(f"  unstable: Vpp = {metrics['Vpp']:.3f} V, "
+              f"Ipp = {metrics['Ipp']:.3f} A, "
+              f"{metrics['OscFraction'] * 100:.0f}% at "
+              f"{metrics['OscFreq']:.0f} Hz")
+        if attempt < retries and resettle is not None:
+            resettle()
+    return v.mean(), i.mean(), metrics
@@ -0,0 +1,132 @@
+# Append-only journal of completed sweep points.
+#
+# Every completed point is written as one JSON line and flushed to disk
+# immediately, so if the script dies or is Ctrl-C'd the points measured so
+# far survive. The first line of the journal records the sweep parameters;
+# a later run with the same parameters resumes by skipping the points that
+# are already in the journal. Example:
+#
+#   journal = sweep_journal("ivsweep.journal", {"volts": [...], ...})
+#   for v in volts:
+#       if journal.isDone(v):
+#           continue
+#       ... measure ...
+#       journal.append(v, {"Vout": vout, "Iout": iout, "Pout": pout})
+#   data_log = pd.DataFrame(journal.rows())
+#   data_log.to_csv(...)
+#   journal.remove()  # sweep finished, next run starts from scratch
+#
+# With filename None the journal only keeps the rows in memory.
+
+import os
+import json
+from time import time
+
+
+def _normalize(value):
+    # Convert numpy scalars/arrays and tuples into plain JSON types so the
+    # parameters (and point keys) compare equal across runs.
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float):
+        # Avoid 20.000000000000004 vs 20.0 mismatches from np.arange
+        return round(value, 9)
+    return value
+
+
+class sweep_journal():
+
+    HEADER_KEY = "params"
+
+    def __init__(self, filename, params, resume=True):
+        self.filename = filename
+        self.params = _normalize(params)
+        self.entries = {}  # point key -> row, in completion order
+
+        if filename is None:
+            self.file = None
+            return
+        if resume and os.path.exists(filename):
+            if self._load():
+                print(f"Resuming from {filename}: "
+                      f"{len(self.entries)} points already done")
+                # Cut off a partially written last line, so the next entry
+                # starts on a line of its own
+                with open(filename, "r+b") as f:
+                    f.truncate(self.valid_end)
+                self.file = open(filename, "a")
+                return
+            # Parameters changed, keep the old journal around but start over
+            stale = f"{filename}.stale"
+            os.replace(filename, stale)
+            print(f"Sweep parameters changed, moved old journal to {stale}")
+
+        self.file = open(filename, "w")
+        self._write({self.HEADER_KEY: self.params})
+
+    def _load(self):
+        with open(self.filename, "rb") as f:
+            lines = f.readlines()
+        if not lines or not lines[0].endswith(b"\n"):
+            return False
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return False
+        if header.get(self.HEADER_KEY) != self.params:
+            return False
+
+        # Byte offset just past the last complete line
+        self.valid_end = len(lines[0])
+        offset = len(lines[0])
+        for line in lines[1:]:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                # Partially written last line from a crash, drop it
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self.entries[self._key(entry["key"])] = entry["row"]
+            self.valid_end = offset
+        return True
+
+    def _key(self, key):
+        return json.dumps(_normalize(key))
+
+    def _write(self, obj):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(obj) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def isDone(self, key):
+        return self._key(key) in self.entries
+
+    def append(self, key, row):
+        row = _normalize(row)
+        self.entries[self._key(key)] = row
+        self._write({"key": _normalize(key), "t": time(), "row": row})
+
+    def row(self, key):
+        # Row of a completed point, None if not done
+        return self.entries.get(self._key(key))
+
+    def rows(self):
+        return list(self.entries.values())
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+    def remove(self):
+        # Call once the final results are saved
+        self.close()
+        if self.filename is not None and os.path.exists(self.filename):
+            os.remove(self.filename)
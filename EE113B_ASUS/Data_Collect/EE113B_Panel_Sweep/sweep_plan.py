@@ -0,0 +1,222 @@
+# Declarative sweep plans.
+#
+# A plan is a TOML (or YAML, if PyYAML is installed) file describing one
+# experiment, replacing the module-level constants of panel_ivsweep.py and
+# eff_sweep.py. See plans/*.toml for examples. A plan is compiled into an
+# ordered list of setpoints, each a dict:
+#
+#   {"sweep": 1, "psu_volts": 24.3, "psu_curr": 5.21, "eload": 20.1}
+#
+# Axes (psu.volts, psu.current_limit, eload.values) can be written as:
+#   20                                  a single value
+#   [16, 18, 20]                        a list of values
+#   {start = 20, stop = 22.5, step = 0.1}           like np.arange
+#   {start = 0.5, stop = 11, num = 4}               like np.linspace
+#   [{start = 12, stop = 20, step = 1}, 24.3, ...]  segments, concatenated
+#
+# Unless the plan says `order = "as_written"`, the setpoints are reordered
+# to minimize slow transitions: all points sharing a PSU voltage are run
+# back-to-back (the PSU only steps once per group), groups are visited
+# monotonically, and the eload values alternate direction between groups
+# (serpentine) so consecutive points are always neighbors.
+#
+# With `order = "scheduled"` the order comes from sweep_scheduler.py
+# instead, which minimizes the predicted settle time using a cost model
+# learned from past sweeps, and only resets the eload/PSU between points
+# whose eload values differ by more than `reset_threshold`.
+#
+# IV plans can set `mpp_early_stop` to fit the panel model after every point
+# (mpp_fit.py) and skip the rest of the flat current region once the MPP is
+# pinned down: "stop" skips all of it, "skip_flat" still measures the lowest
+# voltage point of each sweep, which anchors ISC.
+
+import os
+import tomllib
+import numpy as np
+from sweep_scheduler import schedule, transition_cost_model
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+PLAN_KINDS = ["iv", "efficiency"]
+ELOAD_MODES = ["CURR", "VOLT", "RES", "POW"]
+PLAN_ORDERS = ["optimized", "as_written", "scheduled"]
+MPP_EARLY_STOPS = [None, "stop", "skip_flat"]
+PLAN_KEYS = ["name", "kind", "psu", "eload"]
+
+# Defaults, matching the constants of the original scripts
+PLAN_DEFAULTS = {
+    "eload_channel": 2,
+    "runtime": 1,
+    "settle_time": 1,
+    "remote_sense": False,
+    "order": "optimized",
+    # Turn the eload off between points (and drop the PSU to a low current
+    # limit first for iv sweeps) to prevent the PSU from oscillating
+    "eload_off_between_points": True,
+    # Wait for the operator (e.g. to change the duty ratio) whenever the
+    # PSU voltage changes
+    "pause_between_psu_steps": False,
+    # If set, wait until the eload voltage readings settle within this many
+    # volts (up to `runtime` seconds) instead of always waiting `runtime`.
+    # The measured settle times are what the scheduler learns from.
+    "settle_tolerance": None,
+    # For order = "scheduled": eload jumps above this (in eload units) get
+    # a reset, smaller ones keep the eload on
+    "reset_threshold": None,
+    # Measure each point with a burst of fast samples, re-settle and retry
+    # it if it oscillates, and log the stability metrics (stability.py)
+    "check_stability": True,
+    # Read the eload voltage on both internal and external sense at every
+    # point and log both (sense_pair.py). CURR mode only.
+    "paired_sense": False,
+    # Turn the PSU and eload off if a point takes longer than this many
+    # seconds, e.g. the script hangs in a VISA call (watchdog.py)
+    "watchdog_timeout": 30,
+    # IV plans: skip the flat region once the MPP estimate converges (see
+    # top of file). VOLT mode only.
+    "mpp_early_stop": None,
+}
+
+
+def expand_axis(spec):
+    # Turn an axis spec (see top of file) into a 1-D array of values
+    if isinstance(spec, (int, float)):
+        return np.array([float(spec)])
+    if isinstance(spec, dict):
+        start = float(spec["start"])
+        stop = float(spec["stop"])
+        if "num" in spec:
+            endpoint = spec.get("endpoint", True)
+            return np.linspace(start, stop, int(spec["num"]),
+                               endpoint=endpoint)
+        if "step" in spec:
+            return np.arange(start, stop, float(spec["step"]))
+        raise ValueError(f"Axis range needs `num` or `step`: {spec}")
+    if isinstance(spec, list):
+        if len(spec) == 0:
+            raise ValueError("Empty axis")
+        return np.hstack([expand_axis(s) for s in spec])
+    raise ValueError(f"Unsupported axis spec {spec!r}")
+
+
+def load_plan(filename):
+    return make_plan(read_plan_file(filename),
+                     os.path.splitext(os.path.basename(filename))[0])
+
+
+def read_plan_file(filename):
+    # Plan (or campaign, see campaign.py) file -> dict, without defaults
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in [".yaml", ".yml"]:
+        if yaml is None:
+            raise ImportError("PyYAML is required for YAML plans "
+                              "(python3 -m pip install pyyaml)")
+        with open(filename, "r") as f:
+            plan = yaml.safe_load(f)
+    else:
+        with open(filename, "rb") as f:
+            plan = tomllib.load(f)
+    return plan
+
+
+def make_plan(plan, name=None):
+    # Plan dict (as read from a file, or built in code, see sweeps.py) with
+    # the defaults filled in and validated
+    unknown = set(plan) - set(PLAN_DEFAULTS) - set(PLAN_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown plan keys {sorted(unknown)}")
+    plan = {**PLAN_DEFAULTS, **plan}
+    if name is not None:
+        plan.setdefault("name", name)
+
+    if plan.get("kind") not in PLAN_KINDS:
+        raise ValueError(f"Plan kind must be one of {PLAN_KINDS}")
+    if plan["order"] not in PLAN_ORDERS:
+        raise ValueError(f"Plan order must be one of {PLAN_ORDERS}")
+    if "psu" not in plan or "eload" not in plan:
+        raise ValueError("Plan needs [psu] and [eload] sections")
+    if plan["eload"].get("mode") not in ELOAD_MODES:
+        raise ValueError(f"Eload mode must be one of {ELOAD_MODES}")
+    for key in ["volts", "current_limit"]:
+        if key not in plan["psu"]:
+            raise ValueError(f"Plan needs psu.{key}")
+    if "values" not in plan["eload"]:
+        raise ValueError("Plan needs eload.values")
+    if plan["mpp_early_stop"] not in MPP_EARLY_STOPS:
+        raise ValueError(f"mpp_early_stop must be one of {MPP_EARLY_STOPS}")
+    if plan["mpp_early_stop"] is not None and (
+            plan["kind"] != "iv" or plan["eload"]["mode"] != "VOLT"):
+        raise ValueError("mpp_early_stop needs an iv plan in eload mode VOLT")
+    if plan["paired_sense"] and plan["eload"]["mode"] != "CURR":
+        raise ValueError("paired_sense needs eload mode CURR, in other "
+                         "modes the sense source moves the point")
+
+    return plan
+
+
+def compile_plan(plan, model=None):
+    psu_volts = expand_axis(plan["psu"]["volts"])
+    psu_currs = expand_axis(plan["psu"]["current_limit"])
+    eload_values = expand_axis(plan["eload"]["values"])
+    if plan["eload"].get("scale_by_volts"):
+        # e.g. CURR mode loads written as output powers at a fixed Vout:
+        #   values = [50, 75, 100], scale_by_volts = 12  ->  P/12 amps
+        eload_values = eload_values / float(plan["eload"]["scale_by_volts"])
+
+    # Each (PSU voltage, PSU current limit) pair is one sweep of the eload
+    points = []
+    sweep = 0
+    for v in psu_volts:
+        for c in psu_currs:
+            sweep += 1
+            for e in eload_values:
+                points.append({"sweep": sweep,
+                               "psu_volts": float(v),
+                               "psu_curr": float(c),
+                               "eload": float(e)})
+
+    if plan["order"] == "optimized":
+        points = order_setpoints(points)
+    elif plan["order"] == "scheduled":
+        if model is None:
+            model = transition_cost_model(plan["settle_time"])
+        points = schedule(points, model, plan["reset_threshold"])
+    return points
+
+
+def order_setpoints(points):
+    # Group by PSU setting, keeping the written order of the eload values
+    groups = {}
+    for p in points:
+        groups.setdefault((p["psu_volts"], p["psu_curr"]), []).append(p)
+
+    # Visit PSU settings monotonically, in the direction they were written
+    keys = list(groups.keys())
+    descending = len(keys) > 1 and keys[0] > keys[-1]
+    keys = sorted(keys, reverse=descending)
+
+    ordered = []
+    for i, key in enumerate(keys):
+        group = groups[key]
+        # Serpentine: every other group runs the eload values backwards, so
+        # the first point of a group is next to the last point of the one
+        # before it
+        ordered.extend(group if i % 2 == 0 else group[::-1])
+    return ordered
+
+
+def plan_params(plan):
+    # The parts of a plan that define the measured points and the columns
+    # of their rows. Used to key the sweep journal, so a resumed run only
+    # reuses points of the same plan.
+    return {"kind": plan["kind"],
+            "psu": plan["psu"],
+            "eload": plan["eload"],
+            "eload_channel": plan["eload_channel"],
+            "remote_sense": plan["remote_sense"],
+            "runtime": plan["runtime"],
+            "check_stability": plan["check_stability"],
+            "paired_sense": plan["paired_sense"]}
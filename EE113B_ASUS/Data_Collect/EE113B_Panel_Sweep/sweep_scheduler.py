@@ -0,0 +1,191 @@
+# Sweep-order scheduler.
+#
+# Picks the order in which sweep setpoints (see sweep_plan.py) are visited so
+# the total settle time is minimized, and decides which transitions need a
+# reset (eload off + PSU dropped to a low current, which panel_ivsweep.py
+# used to do at every point to avoid oscillation).
+#
+# The time a transition takes is predicted by a linear cost model:
+#
+#   settle = c0 + c1*|dVpsu| + c2*|dIpsu| + c3*|dEload| + c4*psu_step
+#            + c5*reset
+#
+# The coefficients start at conservative defaults and are learned from the
+# settle traces that run_sweep.py records (one row per transition, with the
+# time it actually took the readings to settle).
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+TRACE_COLUMNS = ["from_psu_volts", "from_psu_curr", "from_eload",
+                 "to_psu_volts", "to_psu_curr", "to_eload",
+                 "reset", "settle_s"]
+
+# Fewer traces than this and the defaults are kept
+MIN_TRACES_TO_FIT = 8
+
+
+class transition_cost_model():
+
+    def __init__(self, settle_time=1):
+        # Defaults: every PSU step costs one settle time and every reset
+        # two, like the fixed sleeps in panel_ivsweep.py / eff_sweep.py
+        self.coef = np.array([0.2, 0.05, 0.05, 0.1,
+                              settle_time, 2 * settle_time])
+        self.num_traces = 0
+
+    @staticmethod
+    def _features(frm, to, reset):
+        # frm, to: (N, 3) arrays of (psu_volts, psu_curr, eload)
+        frm = np.atleast_2d(frm)
+        to = np.atleast_2d(to)
+        d = np.abs(to - frm)
+        psu_step = (d[:, 0] > 0) | (d[:, 1] > 0)
+        return np.column_stack([np.ones(len(d)), d[:, 0], d[:, 1], d[:, 2],
+                                psu_step, np.broadcast_to(reset, len(d))])
+
+    def predict(self, frm, to, reset=False):
+        return self._features(frm, to, reset) @ self.coef
+
+    def costMatrix(self, points, reset_threshold=None):
+        # Pairwise transition cost between (N, 3) setpoints, vectorized.
+        # Transitions with an eload jump above reset_threshold pay for a reset.
+        p = np.asarray(points, dtype=float)
+        d = np.abs(p[:, None, :] - p[None, :, :])
+        psu_step = (d[..., 0] > 0) | (d[..., 1] > 0)
+        reset = (np.zeros_like(psu_step) if reset_threshold is None
+                 else d[..., 2] > reset_threshold)
+        c = self.coef
+        return (c[0] + c[1] * d[..., 0] + c[2] * d[..., 1]
+                + c[3] * d[..., 2] + c[4] * psu_step + c[5] * reset)
+
+    def fit(self, traces):
+        # Least-squares fit of the coefficients from a DataFrame of traces
+        if len(traces) < MIN_TRACES_TO_FIT:
+            return self
+        frm = traces[["from_psu_volts", "from_psu_curr", "from_eload"]]
+        to = traces[["to_psu_volts", "to_psu_curr", "to_eload"]]
+        X = self._features(frm.to_numpy(float), to.to_numpy(float),
+                           traces["reset"].to_numpy(float))
+        y = traces["settle_s"].to_numpy(float)
+
+        # Features that never vary in the traces (e.g. no PSU steps in an
+        # IV sweep) can't be learned, keep their defaults
+        learn = X.std(axis=0) > 0
+        learn[0] = True
+        y = y - X[:, ~learn] @ self.coef[~learn]
+        coef, *_ = np.linalg.lstsq(X[:, learn], y, rcond=None)
+        self.coef[learn] = np.maximum(coef, 0)  # no negative settle times
+        self.num_traces = len(traces)
+        return self
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump({"coef": self.coef.tolist(),
+                       "num_traces": self.num_traces}, f)
+
+    @classmethod
+    def load(cls, filename):
+        model = cls()
+        with open(filename, "r") as f:
+            saved = json.load(f)
+        model.coef = np.array(saved["coef"])
+        model.num_traces = saved["num_traces"]
+        return model
+
+
+def read_traces(filename):
+    if not os.path.exists(filename):
+        return pd.DataFrame(columns=TRACE_COLUMNS)
+    return pd.read_csv(filename)
+
+
+def append_trace(filename, frm, to, reset, settle_s):
+    # frm/to are setpoint dicts; one CSV row per transition
+    header = not os.path.exists(filename)
+    with open(filename, "a") as f:
+        if header:
+            f.write(",".join(TRACE_COLUMNS) + "\n")
+        f.write(f"{frm['psu_volts']},{frm['psu_curr']},{frm['eload']},"
+                f"{to['psu_volts']},{to['psu_curr']},{to['eload']},"
+                f"{int(reset)},{settle_s}\n")
+
+
+def _two_opt(cost, order):
+    # Improve an open path (first point fixed) by reversing segments
+    order = list(order)
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            # Gain of reversing order[i..j] for all j at once
+            js = np.arange(i + 1, n)
+            c = np.array(order)[js]
+            nxt = np.array(order + [-1])[js + 1]
+            old = cost[a, b] + np.where(nxt >= 0, cost[c, nxt], 0)
+            new = cost[a, c] + np.where(nxt >= 0, cost[b, nxt], 0)
+            gain = old - new
+            k = np.argmax(gain)
+            if gain[k] > 1e-9:
+                j = js[k]
+                order[i:j + 1] = order[i:j + 1][::-1]
+                improved = True
+    return order
+
+
+def schedule(points, model=None, reset_threshold=None):
+    # Returns the points in visiting order, each with a "reset" flag telling
+    # the runner whether to reset before it. The first point is kept first
+    # (e.g. VOC for an IV sweep) and the rest are ordered with a
+    # nearest-neighbor tour refined by 2-opt.
+    if model is None:
+        model = transition_cost_model()
+    if len(points) == 0:
+        return []
+
+    xyz = np.array([[p["psu_volts"], p["psu_curr"], p["eload"]]
+                    for p in points])
+    cost = model.costMatrix(xyz, reset_threshold)
+
+    # Nearest neighbor, ties broken by the written order (keeps monotonic
+    # sweeps monotonic)
+    order = [0]
+    left = np.ones(len(points), dtype=bool)
+    left[0] = False
+    while left.any():
+        c = np.where(left, cost[order[-1]], np.inf)
+        nxt = int(np.argmin(c))
+        order.append(nxt)
+        left[nxt] = False
+    order = _two_opt(cost, order)
+
+    scheduled = []
+    prev = None
+    for idx in order:
+        p = dict(points[idx])
+        if prev is None:
+            p["reset"] = True  # eload starts off
+        else:
+            jump = abs(p["eload"] - prev["eload"])
+            p["reset"] = (reset_threshold is not None
+                          and jump > reset_threshold)
+        scheduled.append(p)
+        prev = p
+    return scheduled
+
+
+def estimate_time(points, model, runtime=0, reset=False):
+    # Predicted total time of a sweep. Points without a "reset" flag (i.e.
+    # not scheduled) use the given default.
+    if len(points) < 2:
+        return runtime * len(points)
+    xyz = np.array([[p["psu_volts"], p["psu_curr"], p["eload"]]
+                    for p in points])
+    reset = np.array([p.get("reset", reset) for p in points[1:]])
+    return (model.predict(xyz[:-1], xyz[1:], 0) + reset * model.coef[5]
+            ).sum() + runtime * len(points)
@@ -0,0 +1,663 @@
+# Sweep library.
+#
+# The bench procedures of panel_ivsweep.py, eff_sweep.py and mppt_step.py
+# as functions that take open instrument objects and return the results,
+# so they can be composed into batch jobs and driven from other code
+# without starting a process per run:
+#
+#   psu, eload = open_instruments()
+#   iv = iv_sweep(psu, eload, IV_SWEEP_VOLTS, isc=4)
+#   eff = efficiency_sweep(psu, eload, [16, 20, 24], [50, 75, 100])
+#   replay = profile_replay(psu, eload, profile.t, profile.isc)
+#   drive_safe(psu, eload)
+#
+# iv_sweep and efficiency_sweep build a sweep plan (sweep_plan.py) from
+# their arguments and run it with run_plan, the same executor run_sweep.py
+# uses for plan files. Any plan key (runtime, settle_time, order,
+# check_stability, paired_sense, ...) can be passed as a keyword. With
+# journal_file, completed points are checkpointed and an interrupted sweep
+# resumes; the caller removes the journal once the results are saved.
+#
+# Usage:
+#   python sweeps.py iv --isc 4 --name ivsweep_77pct
+#   python sweeps.py iv --mpp-early-stop skip_flat
+#   python sweeps.py efficiency --volts 16 20 24 --powers 50 75 100
+#   python sweeps.py replay mppt_profile.csv
+#   python sweeps.py replay mppt_profile.csv --capture
+
+import sys
+import os
+import signal
+import argparse
+from contextlib import nullcontext
+from time import sleep, time
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+##################################################
+from usb_pyvisa_wrapper import usb_pyvisa, resilient_pyvisa
+from keysight_n5769a import keysight_n5769a_usb as usb_n5769a
+from keysight_el34243a import keysight_el34243a_usb as usb_el34243a
+from watchdog import safe_state_watchdog, drive_safe
+from sweep_journal import sweep_journal
+from sweep_plan import make_plan, compile_plan, plan_params, PLAN_DEFAULTS
+from sweep_scheduler import append_trace
+from stability import (measure_point, capture_burst, burst_metrics,
+                       STABILITY_COLUMNS)
+from sense_pair import measure_pair, SENSE_COLUMNS
+from mpp_fit import mpp_estimator
+from capture_log import capture_writer
+import telemetry
+##################################################
+
+ELOAD_CH = 2  # Eload channel to connect to
+
+# PV panel emulated by the PSU
+PV_ISC = 5.21   # 100% irradiance
+PV_VOC = 24.3
+
+# IV sweep voltages of panel_ivsweep.py, from the panel's VOC down to 0
+IV_SWEEP_VOLTS = np.flip(np.hstack([np.linspace(0.5, 11, 4, endpoint=True),
+                                    np.arange(12, 20),
+                                    np.arange(20, 22.5, 0.1),
+                                    np.arange(22.5, PV_VOC, 0.2),
+                                    PV_VOC]))
+
+# Efficiency grid of eff_sweep.py
+VOUT_NOMINAL = 12
+PSU_CURRENT_LIMIT = 12
+EFF_INPUT_VOLTS = [16, 18, 20, 22, 24]
+EFF_OUTPUT_POWERS = [50, 62.5, 75, 87.5, 100]
+
+# Profile replay (mppt_step.py)
+REPLAY_RAMP_TIME = 1        # slow ramp from 1 A to the first profile current
+REPLAY_RAMP_STEP = 0.1
+REPLAY_WATCHDOG_TIMEOUT = 10   # [s] as in mppt_step.py
+# Channels of a profile_replay capture file: host time, profile step index,
+# PSU current limit (the emulated ISC) and eload power
+REPLAY_CAPTURE_CHANNELS = [("t", "s"), ("step", "", "<i4"), ("isc", "A"),
+                           ("Pout", "W")]
+
+PAUSE_PROMPT = "go"
+INP_PROMPT = f"Change duty ratio and then type `{PAUSE_PROMPT}` to proceed... "
+
+IV_COLUMNS = ["Vout", "Iout", "Pout"]
+EFF_COLUMNS = ["Sweep", "Vin", "Iin", "Pin", "Vout", "Iout", "Pout", "Eff"]
+
+SETTLE_POLL_TIME = 0.05  # time between readings while waiting to settle
+SETTLE_READINGS = 3      # readings that must agree within the tolerance
+
+
+##################################################
+# Instruments:
+def open_instruments():
+    # Find connected devices and print them
+    devices = usb_pyvisa.query()
+    print(devices)
+
+    # We know that 1x N5769A PSU and 1x EL34243A eload are connected.
+    psu_addr = usb_pyvisa.getAddrFromIdn("N5769A")
+    eload_addr = usb_pyvisa.getAddrFromIdn("EL34243A")
+
+    psu = usb_n5769a(resilient_pyvisa(psu_addr))
+    eload = usb_el34243a(resilient_pyvisa(eload_addr))
+    return psu, eload
+
+
+##################################################
+# Plan execution:
+def wait_settled(eload, chan, tolerance, timeout):
+    # Poll the eload voltage until the last few readings agree within
+    # tolerance, or timeout. Returns the time waited.
+    t0 = time()
+    readings = []
+    while time() - t0 < timeout:
+        readings.append(eload.readVoltage(chan=chan))
+        recent = readings[-SETTLE_READINGS:]
+        if (len(recent) == SETTLE_READINGS
+                and max(recent) - min(recent) < tolerance):
+            break
+        sleep(SETTLE_POLL_TIME)
+    return time() - t0
+
+
+def run_plan(plan, points, psu, eload, journal, tracefile=None,
+             watchdog=None, dashboard=None):
+    chan = plan["eload_channel"]
+    runtime = plan["runtime"]
+    settle_time = plan["settle_time"]
+    eload_off = plan["eload_off_between_points"]
+    reset_curr = plan["psu"].get("reset_current")
+    unit = {"CURR": "A", "RES": "ohm", "POW": "W",
+            "VOLT": "V"}[plan["eload"]["mode"]]
+
+    # Make sure power supply and eload outputs are off
+    psu.deactivate()
+    eload.deactivate(chan=chan)
+    eload.setMode(plan["eload"]["mode"],
+                  remote_sense=plan["remote_sense"], chan=chan)
+
+    if dashboard is not None:
+        # Points measured in a previous run, see sweep_journal.py
+        for row in journal.rows():
+            dashboard.post(row)
+
+    # MPP estimate of each sweep, see mpp_fit.py. Once it converges, the
+    # points below the MPP (but the lowest one, for "skip_flat") are skipped.
+    early_stop = plan["mpp_early_stop"]
+    estimators = {}
+    lowest = {}
+    mpp = {}    # sweep -> converged estimate
+    skipped = 0
+    if early_stop is not None:
+        for p in points:
+            if p["sweep"] not in estimators:
+                estimators[p["sweep"]] = mpp_estimator(p["psu_curr"],
+                                                       p["psu_volts"])
+            lowest[p["sweep"]] = min(lowest.get(p["sweep"], p["eload"]),
+                                     p["eload"])
+
+    psu_setting = None
+    eload_on = False
+    prev_point = None
+    for count, point in enumerate(points, start=1):
+        key = (point["sweep"], point["eload"])
+        if journal.isDone(key):
+            if early_stop is not None:
+                row = journal.row(key)
+                estimators[point["sweep"]].add(row["Vout"], row["Iout"])
+            continue  # Measured in a previous run
+        known = mpp.get(point["sweep"])
+        if known is not None and point["eload"] < known["Vmpp_lo"]:
+            if not (early_stop == "skip_flat"
+                    and point["eload"] == lowest[point["sweep"]]):
+                skipped += 1
+                continue  # Flat current region, MPP already known
+        if watchdog is not None:
+            watchdog.beat()
+
+        # Scheduled plans say per point whether a reset is needed
+        reset = point.get("reset", eload_off)
+        t_transition = time()
+
+        setting = (point["psu_volts"], point["psu_curr"])
+        if setting != psu_setting:
+            # The PSU only changes between groups of points
+            if eload_on:
+                eload.deactivate(chan=chan)
+                eload_on = False
+            if plan["pause_between_psu_steps"]:
+                print(f"Input voltage to be set to {point['psu_volts']} V")
+                with (watchdog.suspended() if watchdog is not None
+                      else nullcontext()):
+                    inp = input(INP_PROMPT)
+                    while (inp != PAUSE_PROMPT):
+                        inp = input(INP_PROMPT)
+                # The operator's time is not part of the transition cost
+                # logged for the scheduler
+                t_transition = time()
+            psu.setCurrent(point["psu_curr"])
+            psu.setVoltage(point["psu_volts"])
+            psu.activate()
+            sleep(settle_time)
+            psu_setting = setting
+
+        print(f"Point {count}/{len(points)}: psu {point['psu_volts']:.2f} V, "
+              f"eload {point['eload']:.2f} {unit}")
+
+        if reset and eload_on:
+            eload.deactivate(chan=chan)
+            eload_on = False
+        if reset and reset_curr is not None:
+            # Drop the PSU current before turning on the eload, which
+            # helps prevent the power supply from oscillating
+            psu.setCurrent(reset_curr)
+            sleep(settle_time)
+        eload.setValue(point["eload"], chan=chan)
+        if not eload_on:
+            eload.activate(chan=chan)
+            eload_on = True
+        if reset and reset_curr is not None:
+            sleep(settle_time)
+            psu.setCurrent(point["psu_curr"])
+
+        if plan["settle_tolerance"] is None:
+            # Let load run for this long:
+            sleep(runtime)
+        else:
+            wait_settled(eload, chan, plan["settle_tolerance"], runtime)
+            if tracefile is not None and prev_point is not None:
+                append_trace(tracefile, prev_point, point, reset,
+                             time() - t_transition)
+
+        # Read data from eload (and psu for efficiency sweeps):
+        if plan["check_stability"]:
+            def resettle():
+                if reset_curr is not None:
+                    eload.deactivate(chan=chan)
+                    psu.setCurrent(reset_curr)
+                    sleep(settle_time)
+                    eload.activate(chan=chan)
+                    sleep(settle_time)
+                    psu.setCurrent(point["psu_curr"])
+                sleep(runtime)
+            vout, iout, stability = measure_point(eload, chan, resettle)
+        else:
+            vout = eload.readVoltage(chan=chan)
+            iout = eload.readCurrent(chan=chan)
+            stability = {}
+        if plan["paired_sense"]:
+            sense = measure_pair(eload, chan, plan["remote_sense"])
+        else:
+            sense = {}
+        pout = vout * iout
+        if plan["kind"] == "iv":
+            row = {"Vout": vout, "Iout": iout, "Pout": pout}
+        else:
+            vin = psu.readVoltage()
+            iin = psu.readCurrent()
+            pin = vin * iin
+            eff = pout / pin * 100 if pin > 0 else -1
+            row = {"Sweep": point["sweep"],
+                   "Vin": vin, "Iin": iin, "Pin": pin,
+                   "Vout": vout, "Iout": iout, "Pout": pout,
+                   "Eff": eff}
+            print(f"  pin: {pin :.2f}, pout: {pout :.2f}, {eff = :.2f} %")
+        row.update(stability)
+        row.update(sense)
+
+        if eload_off and "reset" not in point:
+            eload.deactivate(chan=chan)
+            eload_on = False
+
+        journal.append(key, row)
+        if dashboard is not None:
+            dashboard.post(row)
+        prev_point = point
+
+        if early_stop is not None and point["sweep"] not in mpp:
+            estimator = estimators[point["sweep"]]
+            estimator.add(vout, iout)
+            est = estimator.estimate()
+            if est is not None:
+                print(f"  MPP estimate {est['Pmpp']:.1f} W "
+                      f"[{est['Pmpp_lo']:.1f}, {est['Pmpp_hi']:.1f}] at "
+                      f"{est['Vmpp']:.2f} V "
+                      f"[{est['Vmpp_lo']:.2f}, {est['Vmpp_hi']:.2f}]")
+            if estimator.converged():
+                mpp[point["sweep"]] = est
+                print("  MPP converged, skipping the flat region")
+
+    if eload_on:
+        eload.deactivate(chan=chan)
+
+    columns = IV_COLUMNS if plan["kind"] == "iv" else EFF_COLUMNS
+    if plan["check_stability"]:
+        columns = columns + STABILITY_COLUMNS
+    if plan["paired_sense"]:
+        columns = columns + SENSE_COLUMNS
+    data_log = pd.DataFrame(journal.rows(), columns=columns)
+    if plan["kind"] == "iv":
+        if early_stop is not None:
+            print(f"Skipped {skipped} of {len(points)} points")
+            data_log.attrs["mpp"] = {s: e.estimate()
+                                     for s, e in estimators.items()}
+        return data_log
+    return data_log.sort_values(["Sweep"], kind="stable", ignore_index=True)
+
+
+def _run_journaled(plan, psu, eload, journal_file, resume, watchdog,
+                   dashboard):
+    journal = sweep_journal(journal_file, plan_params(plan), resume=resume)
+    try:
+        return run_plan(plan, compile_plan(plan), psu, eload, journal,
+                        watchdog=watchdog, dashboard=dashboard)
+    finally:
+        journal.close()
+
+
+##################################################
+# Sweeps:
+def iv_plan(volts, isc=PV_ISC, voc=PV_VOC, **options):
+    # Panel IV sweep: the PSU emulates the panel (current limit = ISC,
+    # voltage = VOC) and the eload steps its constant voltage through
+    # `volts`, dropping the PSU current between points
+    return make_plan({"name": "ivsweep",
+                      "kind": "iv",
+                      "order": "as_written",
+                      "psu": {"volts": float(voc),
+                              "current_limit": float(isc),
+                              "reset_current": 1},
+                      "eload": {"mode": "VOLT",
+                                "values": [float(v) for v in volts]},
+                      **options})
+
+
+def efficiency_plan(input_volts, output_powers, vout=VOUT_NOMINAL,
+                    current_limit=PSU_CURRENT_LIMIT, **options):
+    # Converter efficiency grid: the PSU sets the input voltage and the
+    # eload draws output_powers / vout in CC mode, 4-wire sense
+    return make_plan({"name": "effsweep",
+                      "kind": "efficiency",
+                      "remote_sense": True,
+                      "paired_sense": True,
+                      "psu": {"volts": [float(v) for v in input_volts],
+                              "current_limit": float(current_limit)},
+                      "eload": {"mode": "CURR",
+                                "values": [float(p) for p in output_powers],
+                                "scale_by_volts": float(vout)},
+                      **options})
+
+
+def iv_sweep(psu, eload, volts, isc=PV_ISC, voc=PV_VOC, journal_file=None,
+             resume=True, watchdog=None, dashboard=None, **options):
+    # DataFrame with IV_COLUMNS (+ stability metrics), one row per voltage
+    plan = iv_plan(volts, isc, voc, **options)
+    return _run_journaled(plan, psu, eload, journal_file, resume, watchdog,
+                          dashboard)
+
+
+def efficiency_sweep(psu, eload, input_volts, output_powers,
+                     vout=VOUT_NOMINAL, current_limit=PSU_CURRENT_LIMIT,
+                     journal_file=None, resume=True, watchdog=None,
+                     dashboard=None, **options):
+    # DataFrame with EFF_COLUMNS (+ stability and paired sense columns)
+    plan = efficiency_plan(input_volts, output_powers, vout, current_limit,
+                           **options)
+    return _run_journaled(plan, psu, eload, journal_file, resume, watchdog,
+                          dashboard)
+
+
+def profile_replay(psu, eload, profile_t, profile_isc, isc=PV_ISC,
+                   voc=PV_VOC, chan=ELOAD_CH, vout=VOUT_NOMINAL,
+                   check_stability=True, receiver=None, watchdog=None,
+                   dashboard=None, capture_file=None):
+    # Replays an irradiance profile (times [s], ISC normalized to the
+    # panel's rating) on the PSU current limit while the eload holds the
+    # converter output at vout, reading the eload power as fast as the
+    # link allows. Returns {"power": DataFrame(t, Pout), "avg_power",
+    # "stability": DataFrame or None, "telemetry": DataFrame or None}.
+    # receiver is an optional telemetry.telemetry_receiver, dashboard an
+    # optional dashboard.live_dashboard("replay").
+    # With capture_file, the power readings are written to that capture
+    # file (capture_log.py, channels REPLAY_CAPTURE_CHANNELS) instead of
+    # being kept in memory, and "power" and "telemetry" are None: the
+    # telemetry is in the receiver's own capture file.
+    def beat():
+        if watchdog is not None:
+            watchdog.beat()
+
+    def readPower(set_i):
+        nonlocal power_sum, power_count
+        p = eload.readPower(chan=chan)
+        t = time()
+        power_sum += p
+        power_count += 1
+        if capture is not None:
+            capture.append(t, step, set_i, p)
+        else:
+            power_p.append(p)
+            power_t.append(t)
+        if dashboard is not None:
+            dashboard.post({"t": t, "Pout": p})
+
+    # Open the capture before turning anything on, so a bad path fails
+    # with the instruments still off
+    capture = None
+    if capture_file is not None:
+        capture = capture_writer(capture_file, REPLAY_CAPTURE_CHANNELS,
+                                 meta={"isc": isc, "voc": voc, "vout": vout,
+                                       "profile_t": list(profile_t),
+                                       "profile_isc": list(profile_isc)})
+
+    try:
+        eload.deactivate(chan=chan)
+        psu.setVoltage(voc)
+        psu.activate()
+        eload.setMode("VOLT", remote_sense=True, chan=chan)
+        eload.setValue(vout, chan=chan)
+        eload.activate(chan=chan)
+
+        # First *slowly* ramp up to the first current in the profile. This
+        # helps prevent the power supply from oscillating.
+        ref_i = profile_isc[0] * isc
+        print(f"Ramping up current to {ref_i:.2f} A in "
+              f"{REPLAY_RAMP_TIME:.1f} s")
+        set_i = 1
+        i_slope = (ref_i - set_i) / REPLAY_RAMP_TIME
+        t0 = time()
+        while set_i < ref_i:
+            set_i = 1 + i_slope * (time() - t0)
+            psu.setCurrent(set_i)
+            beat()
+            sleep(REPLAY_RAMP_STEP)
+
+        if receiver is not None:
+            receiver.start()
+
+        power_t = []    # host time of each eload reading
+        power_p = []    # eload power readings
+        power_sum = 0.0
+        power_count = 0
+        stability_log = []
+        tprev = 0
+        iprev = ref_i
+        t0 = time()
+        for step, (t, isc_norm) in enumerate(zip(profile_t, profile_isc)):
+            # Currents in the profile are normalized to the panel's rating
+            i_step = isc_norm * isc
+            print(f"Step: {t} , {isc_norm} -> {i_step:.2f}A")
+            beat()
+            current_time = time() - t0
+            if current_time >= t:
+                psu.setCurrent(i_step)
+                readPower(i_step)
+            else:
+                # Ramp the current linearly until the next profile point
+                i_slope = (i_step - iprev) / (t - tprev) if t > tprev else 0
+                while current_time < t:
+                    current_time = time() - t0
+                    set_i = iprev + i_slope * (current_time - tprev)
+                    psu.setCurrent(set_i)
+                    readPower(set_i)
+                    beat()
+            iprev = i_step
+            tprev = t
+            if capture is not None:
+                capture.flush()
+            print(f"Avg power = {power_sum / max(power_count, 1):.2f} W")
+
+            if check_stability:
+                metrics = burst_metrics(*capture_burst(eload, chan))
+                stability_log.append({"t": t, "isc": i_step, **metrics})
+                if not metrics["Stable"]:
+                    print(f"  unstable: Vpp = {metrics['Vpp']:.3f} V, "
+                          f"Ipp = {metrics['Ipp']:.3f} A, "
+                          f"{metrics['OscFraction'] * 100:.0f}% at "
+                          f"{metrics['OscFreq']:.0f} Hz")
+    finally:
+        # Also on an exception (watchdog trip, VISA error): turn the eload
+        # off, count and trim the capture rows and stop the receiver thread
+        try:
+            eload.deactivate(chan=chan)
+        finally:
+            if capture is not None:
+                capture.close()
+            if receiver is not None:
+                receiver.stop()
+
+    result = {"power": None,
+              "avg_power": power_sum / power_count if power_count else 0.0,
+              "stability": None, "telemetry": None}
+    if capture is not None:
+        print(f"Saved {power_count} power readings to {capture_file}")
+    else:
+        result["power"] = pd.DataFrame({"t": power_t, "Pout": power_p})
+    if check_stability:
+        # Retries don't apply to a replay, the profile keeps running
+        columns = ["t", "isc"] + [c for c in STABILITY_COLUMNS
+                                  if c != "Retries"]
+        result["stability"] = pd.DataFrame(stability_log, columns=columns)
+    if receiver is not None:
+        print(f"Received {receiver.ring.count} telemetry frames, "
+              f"dropped {receiver.dropped_bytes} bytes")
+        if capture is None:
+            result["telemetry"] = telemetry.align(receiver.snapshot(),
+                                                  power_t, {"Pout": power_p})
+    return result
+
+
+##################################################
+# Plots, same as panel_ivsweep.py and eff_sweep.py:
+def plot_iv(data_log, imgfile):
+    data_log = data_log.sort_values("Vout")
+    sweep_v = data_log["Vout"].tolist()
+    sweep_i = data_log["Iout"].tolist()
+    sweep_p = data_log["Pout"].tolist()
+
+    max_p = max(sweep_p)
+    max_v = sweep_v[np.argmax(sweep_p)]
+    print(f"Max power point = {max_p:.1f} W at {max_v:.1f} V")
+
+    fig, axV = plt.subplots(figsize=(10, 6))
+    color = 'tab:blue'
+    axV.set_xlabel('Voltage [V]')
+    axV.set_ylabel('Current [A]', color=color)
+    axV.plot(sweep_v, sweep_i, color=color)
+    axV.tick_params(axis='y', labelcolor=color)
+
+    axP = axV.twinx()
+
+    color = 'tab:red'
+    axP.set_ylabel('Power [W]', color=color)
+    axP.plot(sweep_v, sweep_p, color=color)
+    axP.tick_params(axis='y', labelcolor=color)
+
+    fig.suptitle('PV sweep', fontweight="bold")
+
+    plt.tight_layout()
+    plt.savefig(imgfile, dpi=200)   # Save plots
+
+
+def plot_efficiency(data_log, imgfile):
+    fig, ax = plt.subplots(1, 2, figsize=(10, 6))
+    vax = ax[0]     # Vout vs Iout axis
+    effax = ax[1]   # Eff vs Pout axis
+
+    lgd = []
+    for sweep in sorted(data_log["Sweep"].unique()):
+        # Get data for one sweep, in increasing load:
+        res = data_log[data_log["Sweep"] == sweep].sort_values("Iout")
+        vin = res.iloc[0]["Vin"]        # Get input voltage
+
+        lgd.append(f"Vin = {vin :.1f} V")   # Add Vin info to legend
+        vax.plot(res["Iout"], res["Vout"], 'o-', linewidth=2)
+        effax.plot(res["Pout"], res["Eff"], 'o-', linewidth=2)
+
+    # Format plots:
+    vax.set_xlabel("Output Current [A]")
+    vax.set_ylabel("Output Voltage [V]")
+    vax.set_title("Voltage across load sweep")
+    vax.legend(lgd)
+    effax.set_xlabel("Output power [W]")
+    effax.set_ylabel("Efficiency [%]")
+    effax.set_title("Efficiency across load sweep")
+    effax.legend(lgd)
+
+    plt.tight_layout()
+    plt.savefig(imgfile, dpi=200)   # Save plots
+
+
+##################################################
+# Command line:
+def run_cli(args, psu, eload, watchdog):
+    save = os.path.join(args.save_dir, args.name)
+    journal_file = save + ".journal"
+    if args.command == "iv":
+        data_log = iv_sweep(psu, eload, args.volts or IV_SWEEP_VOLTS,
+                            args.isc, args.voc, journal_file=journal_file,
+                            resume=not args.no_resume, watchdog=watchdog,
+                            eload_channel=args.chan,
+                            mpp_early_stop=args.mpp_early_stop,
+                            watchdog_timeout=args.watchdog_timeout)
+        data_log.to_csv(save + ".csv", index=False)
+        os.remove(journal_file)
+        plot_iv(data_log, save + ".png")
+    elif args.command == "efficiency":
+        data_log = efficiency_sweep(
+            psu, eload, args.volts or EFF_INPUT_VOLTS,
+            args.powers or EFF_OUTPUT_POWERS, journal_file=journal_file,
+            resume=not args.no_resume, watchdog=watchdog,
+            eload_channel=args.chan, pause_between_psu_steps=args.pause,
+            watchdog_timeout=args.watchdog_timeout)
+        data_log.to_csv(save + ".csv", index=False)
+        os.remove(journal_file)
+        plot_efficiency(data_log, save + ".png")
+    else:
+        profile = pd.read_csv(args.profile)  # t, isc
+        result = profile_replay(psu, eload, profile.t.to_list(),
+                                profile.isc.to_list(), args.isc, args.voc,
+                                args.chan, watchdog=watchdog,
+                                capture_file=(save + "_power.cap"
+                                              if args.capture else None))
+        if result["power"] is not None:
+            result["power"].to_csv(save + "_power.csv", index=False)
+        if result["stability"] is not None:
+            result["stability"].to_csv(save + "_stability.csv", index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bench sweeps")
+    sub = parser.add_subparsers(dest="command", required=True)
+    iv = sub.add_parser("iv", help="PV panel IV sweep")
+    iv.add_argument("--volts", type=float, nargs="+",
+                    help="eload voltages (default: panel_ivsweep.py's)")
+    iv.add_argument("--mpp-early-stop", choices=["stop", "skip_flat"],
+                    help="skip the flat region once the MPP is known")
+    eff = sub.add_parser("efficiency", help="converter efficiency grid")
+    eff.add_argument("--volts", type=float, nargs="+",
+                     help="input voltages")
+    eff.add_argument("--powers", type=float, nargs="+",
+                     help="output powers [W]")
+    eff.add_argument("--pause", action="store_true",
+                     help="wait for the operator at each input voltage")
+    replay = sub.add_parser("replay", help="irradiance profile replay")
+    replay.add_argument("profile", help="csv with columns t, isc")
+    replay.add_argument("--capture", action="store_true",
+                        help="write the power readings to a capture file "
+                             "(capture_log.py) instead of a csv")
+    for p in [iv, replay]:
+        p.add_argument("--isc", type=float, default=PV_ISC)
+        p.add_argument("--voc", type=float, default=PV_VOC)
+    for p, name in [(iv, "ivsweep"), (eff, "effsweep"), (replay, "mppt")]:
+        p.add_argument("--name", default=name, help="output file name")
+        p.add_argument("--save-dir", default=".")
+        p.add_argument("--chan", type=int, default=ELOAD_CH)
+    for p, timeout in [(iv, PLAN_DEFAULTS["watchdog_timeout"]),
+                       (eff, PLAN_DEFAULTS["watchdog_timeout"]),
+                       (replay, REPLAY_WATCHDOG_TIMEOUT)]:
+        p.add_argument("--watchdog-timeout", type=float, default=timeout,
+                       help="turn the PSU and eload off after this many "
+                            "seconds without progress")
+    for p in [iv, eff]:
+        p.add_argument("--no-resume", action="store_true")
+    args = parser.parse_args()
+
+    psu, eload = open_instruments()
+
+    # If Ctrl-C is pressed while the program is running, the PSU and
+    # eload are turned off before exiting
+    def timeToExit(sig, frame):
+        drive_safe(psu, eload)
+        print(sig, frame)
+        sys.exit()
+    signal.signal(signal.SIGINT, timeToExit)
+
+    with safe_state_watchdog(psu.usb.addr, eload.usb.addr,
+                             args.watchdog_timeout) as watchdog:
+        run_cli(args, psu, eload, watchdog)
+    drive_safe(psu, eload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# Host-side telemetry receiver for the C2000 MPPT state.
+#
+# The board sends one fixed-size binary frame per control loop iteration
+# over the serial link (little-endian, 26 bytes):
+#
+#   sync            uint16  0xA55A
+#   seq             uint16  frame counter, wraps
+#   t_us            uint32  board timestamp in us, wraps
+#   duty_cmp        uint16  EPwm1Regs.CMPA
+#   adc_raw_vout    uint16  0->4095
+#   adc_raw_iout    uint16  0->4095
+#   flags           uint16  bit 0 flag_sweep, 1 stop_search,
+#                           2 Perturb_Observe, 3 flag_D_inc, 4 flag_D_dec
+#   mpp_power       float32 MPP_power
+#   mpp_duty        float32 MPP_Duty
+#   csum            uint16  sum of the 12 previous 16-bit words, mod 2^16
+#
+# Frames are decoded straight out of the receive buffer with a NumPy
+# structured dtype (no per-field parsing) into a ring buffer. The board
+# clock is mapped onto the host clock so telemetry can be aligned with the
+# eload samples collected by mppt_step.py. Example:
+#
+#   rx = telemetry_receiver("COM5")
+#   rx.start()
+#   ... run the profile, collecting (time(), readPower()) samples ...
+#   rx.stop()
+#   aligned = align(rx.snapshot(), sample_t, {"Pout": sample_p})
+#
+# The ring buffer keeps the last RING_CAPACITY frames. For longer runs, pass
+# capture_file and every frame is also written to a capture file (see
+# capture_log.py); read it back with capture_log.capture_reader and convert
+# blocks of it with to_dataframe.
+
+import threading
+from time import time
+import numpy as np
+import pandas as pd
+##################################################
+from capture_log import capture_writer
+##################################################
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+SYNC = 0xA55A
+FRAME_DTYPE = np.dtype([("sync", "<u2"),
+                        ("seq", "<u2"),
+                        ("t_us", "<u4"),
+                        ("duty_cmp", "<u2"),
+                        ("adc_raw_vout", "<u2"),
+                        ("adc_raw_iout", "<u2"),
+                        ("flags", "<u2"),
+                        ("mpp_power", "<f4"),
+                        ("mpp_duty", "<f4"),
+                        ("csum", "<u2")])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+FRAME_WORDS = FRAME_SIZE // 2
+
+FLAG_BITS = {"flag_sweep": 0, "stop_search": 1, "Perturb_Observe": 2,
+             "flag_D_inc": 3, "flag_D_dec": 4}
+
+# Host arrival time is stored next to each frame
+RING_DTYPE = np.dtype(FRAME_DTYPE.descr + [("host_t", "<f8")])
+RING_UNITS = {"t_us": "us", "duty_cmp": "counts", "adc_raw_vout": "counts",
+              "adc_raw_iout": "counts", "mpp_power": "W", "host_t": "s"}
+
+SERIAL_BAUD = 921600
+READ_SIZE = 4096                # bytes per serial read
+RING_CAPACITY = 1 << 20         # frames kept in memory (~34 MB)
+
+# Same conversions as the firmware (see adc_calibration.py to refit)
+VOUT_GAIN, VOUT_OFFSET = 3.0 * 11 / 4095, 0.0
+IOUT_GAIN, IOUT_OFFSET = 0.0059, -10.0928
+
+
+##################################################
+# Decoding:
+def _find_sync(data, start):
+    # Index of the next sync word (bytes 5A A5) at or after start
+    hits = np.flatnonzero((data[start:-1] == 0x5A)
+                          & (data[start + 1:] == 0xA5))
+    return start + hits[0] if len(hits) else None
+
+
+def decode(buf):
+    # Decode all complete frames in buf.
+    # Returns (frames, number of bytes consumed).
+    data = np.frombuffer(buf, dtype=np.uint8)
+    blocks = []
+    pos = 0
+    while len(data) - pos >= FRAME_SIZE:
+        count = (len(data) - pos) // FRAME_SIZE
+        block = np.frombuffer(buf, dtype=FRAME_DTYPE, count=count, offset=pos)
+        words = np.frombuffer(buf, dtype="<u2", count=count * FRAME_WORDS,
+                              offset=pos).reshape(count, FRAME_WORDS)
+        csum = words[:, :-1].sum(axis=1, dtype=np.uint32) & 0xFFFF
+        good = (block["sync"] == SYNC) & (csum == block["csum"])
+        if good.all():
+            # Fast path, the stream is in sync
+            blocks.append(block)
+            pos += count * FRAME_SIZE
+            break
+
+        bad = np.argmin(good)
+        blocks.append(block[:bad])
+        pos += bad * FRAME_SIZE
+        # Lost sync (dropped or corrupted bytes): skip to the next sync word
+        nxt = _find_sync(data, pos + 1)
+        if nxt is None:
+            pos = len(data) - 1  # the last byte may start a sync word
+            break
+        pos = nxt
+
+    if not blocks:
+        return np.empty(0, dtype=FRAME_DTYPE), pos
+    return np.concatenate(blocks), pos
+
+
+def unwrap_us(t_us):
+    # Board timestamps wrap every 2^32 us (~71 min)
+    t = np.asarray(t_us, dtype=np.int64)
+    wraps = np.concatenate([[0], np.cumsum(np.diff(t) < 0)])
+    return t + wraps * (1 << 32)
+
+
+def flag(frames, name):
+    return (frames["flags"] >> FLAG_BITS[name]) & 1
+
+
+##################################################
+# Storage:
+class ring_buffer():
+    def __init__(self, capacity, dtype):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0  # total items ever written
+        self.lock = threading.Lock()
+
+    def extend(self, items):
+        n = len(items)
+        if n == 0:
+            return
+        if n > self.capacity:
+            items = items[-self.capacity:]
+            self.count += n - self.capacity
+            n = self.capacity
+        with self.lock:
+            start = self.count % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = items[:first]
+            self.data[:n - first] = items[first:]
+            self.count += n
+
+    def snapshot(self, last=None):
+        # Copy of the stored items, oldest first
+        with self.lock:
+            size = min(self.count, self.capacity)
+            if last is not None:
+                size = min(size, last)
+            end = self.count % self.capacity
+            idx = (np.arange(end - size, end)) % self.capacity
+            return self.data[idx]
+
+
+##################################################
+# Receiver:
+class telemetry_receiver():
+    def __init__(self, port, baud=SERIAL_BAUD, capacity=RING_CAPACITY,
+                 capture_file=None):
+        if serial is None:
+            raise ImportError("pyserial is required to read the board "
+                              "(python3 -m pip install pyserial)")
+        self.ser = serial.Serial(port, baud, timeout=0.1)
+        self.ring = ring_buffer(capacity, RING_DTYPE)
+        self.capture = None
+        if capture_file is not None:
+            channels = [(name, RING_UNITS.get(name, ""), RING_DTYPE[name].str)
+                        for name in RING_DTYPE.names]
+            self.capture = capture_writer(capture_file, channels,
+                                          meta={"source": "telemetry"})
+        self.thread = None
+        self.running = False
+        self.dropped_bytes = 0
+
+    def start(self):
+        self.ser.reset_input_buffer()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.ser.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def _run(self):
+        pending = b""
+        while self.running:
+            chunk = self.ser.read(READ_SIZE)
+            if not chunk:
+                continue
+            host_t = time()
+            buf = pending + chunk
+            frames, used = decode(buf)
+            self.dropped_bytes += used - len(frames) * FRAME_SIZE
+            pending = buf[used:]
+            if len(frames):
+                rows = np.empty(len(frames), dtype=RING_DTYPE)
+                for name in FRAME_DTYPE.names:
+                    rows[name] = frames[name]
+                rows["host_t"] = host_t
+                self.ring.extend(rows)
+                if self.capture is not None:
+                    self.capture.extend(rows)
+
+    def snapshot(self, last=None):
+        return self.ring.snapshot(last)
+
+
+##################################################
+# Clock alignment:
+def host_clock(frames):
+    # Map board time to host time: host_t = a + b * t. Arrival times are
+    # board times plus a variable latency, so the fitted line is shifted
+    # down to the earliest arrivals (smallest latency).
+    t = unwrap_us(frames["t_us"]) * 1e-6
+    b, a = np.polyfit(t - t[0], frames["host_t"], 1)
+    a += np.min(frames["host_t"] - (a + b * (t - t[0])))
+    return a + b * (t - t[0])
+
+
+def to_dataframe(frames):
+    vout = frames["adc_raw_vout"] * VOUT_GAIN + VOUT_OFFSET
+    iout = frames["adc_raw_iout"] * IOUT_GAIN + IOUT_OFFSET
+    df = pd.DataFrame({"t": host_clock(frames),
+                       "seq": frames["seq"],
+                       "duty_cmp": frames["duty_cmp"],
+                       "adc_vout": vout,
+                       "adc_iout": iout,
+                       "adc_pout": vout * iout,
+                       "MPP_power": frames["mpp_power"],
+                       "MPP_Duty": frames["mpp_duty"]})
+    for name in FLAG_BITS:
+        df[name] = flag(frames, name)
+    return df
+
+
+def align(frames, sample_t, samples):
+    # Interpolate host-side samples (e.g. eload power read by mppt_step.py
+    # at host times sample_t) onto the telemetry frame times.
+    # samples is a dict of name -> array.
+    df = to_dataframe(frames)
+    order = np.argsort(sample_t)
+    sample_t = np.asarray(sample_t)[order]
+    inside = (df["t"] >= sample_t[0]) & (df["t"] <= sample_t[-1])
+    df = df[inside].reset_index(drop=True)
+    for name, values in samples.items():
+        df[name] = np.interp(df["t"], sample_t, np.asarray(values)[order])
+    return df
@@ -1,10 +1,31 @@
 # Written by Tahmid Mahbub
 
+import re
+from time import sleep
+import numpy as np
 import pyvisa
 # python3 -m pip install zeroconf psutil pyvisa
 # https://www.ni.com/en/support/downloads/drivers/download/unpackaged.ni-visa.487530.html
 
 
+def parse_block(raw, dtype):
+    # IEEE-488.2 block "#<n><length><data>" (or "#0<data>\n", indefinite
+    # length) -> NumPy array of dtype, without any ASCII conversion
+    start = raw.index(b"#")
+    n = int(raw[start + 1:start + 2])
+    if n == 0:
+        data = raw[start + 2:]
+        if data.endswith(b"\n"):
+            data = data[:-1]
+    else:
+        length = int(raw[start + 2:start + 2 + n])
+        data = raw[start + 2 + n:start + 2 + n + length]
+        if len(data) < length:
+            raise ValueError(f"Binary block truncated: {len(data)} of "
+                             f"{length} bytes")
+    return np.frombuffer(data, dtype=dtype)
+
+
 class usb_pyvisa:
 
     ADDRESS_KEY = "addr"
@@ -59,12 +80,131 @@ class usb_pyvisa:
                 break
 
         if self.initialized is False:
-            raise Exception(f"Couldn't initialize device at {dev_addr}!")
+            raise Exception(f"Couldn't initialize device at {addr}!")
 
     def write(self, command):
-        if self.initialized:
-            self.dev.write(command)
+        if not self.initialized:
+            raise ConnectionError(f"{self.addr} is not connected")
+        self.dev.write(command)
 
     def read(self, query):
+        if not self.initialized:
+            raise ConnectionError(f"{self.addr} is not connected")
+        return self.dev.query(query)
+
+    def readBinary(self, query, dtype):
+        # Array query answered as an IEEE-488.2 binary block
+        if not self.initialized:
+            raise ConnectionError(f"{self.addr} is not connected")
+        self.dev.write(query)
+        return parse_block(self.dev.read_raw(), dtype)
+
+    def close(self):
         if self.initialized:
-            return self.dev.query(query)
+            self.dev.close()
+            self.initialized = False
+
+
+# Errors that a reconnect can fix: timeouts, a dropped USB link and the
+# session going stale after it
+TRANSIENT_ERRORS = (pyvisa.errors.VisaIOError, pyvisa.errors.InvalidSession,
+                    ConnectionError, OSError)
+
+RETRIES = 2             # attempts after the first one
+BACKOFF_SEC = 0.1       # wait before the first retry, doubled every retry
+# Worst case of an operation that keeps failing: (RETRIES + 1) timeouts of
+# 3 s plus 0.1 + 0.2 s of backoff = 9.3 s. This has to stay below the
+# shortest watchdog timeout (10 s, mppt_step.py), so a glitch that the
+# retries recover from never trips the watchdog.
+
+# Writes starting with these are actions, not settings, and are not
+# re-applied after a reconnect
+UNSHADOWED = ("*", "INIT", "TRIG", "ABOR", "FETC", "MEAS")
+# Output and input enables are not re-applied either: if the watchdog has
+# driven the bench to the safe state while a retry was pending, the
+# reconnect must not turn the PSU output or the eload inputs back on
+UNSHADOWED_STATES = ("OUTP", "OUTP:STAT", "INP", "INP:STAT")
+
+
+class resilient_pyvisa(usb_pyvisa):
+    # usb_pyvisa that survives transient USB errors: a failed write/read is
+    # retried up to `retries` times with exponential backoff, reopening
+    # the session at the cached address before every retry. The last value
+    # of every setting written (e.g. FUNC, VOLT:SENS:SOUR, CURR per
+    # channel) is shadowed and written again after a reconnect, in the
+    # order the settings were last written, in case the instrument lost its
+    # state. Output/input enables are not shadowed: a reconnect never turns
+    # the bench on. The happy path is the plain write/read plus a dict
+    # update.
+    #
+    # A read that timed out is retried on the fresh session, so a query
+    # with side effects may run twice.
+
+    def __init__(self, addr=None, timeout_sec=3, retries=RETRIES,
+                 backoff_sec=BACKOFF_SEC):
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self.timeout_sec = timeout_sec
+        self.shadow = {}
+        self.reconnects = 0
+        super().__init__(addr, timeout_sec)
+
+    @staticmethod
+    def settingKey(command):
+        # "CURR 4.2, (@2)" -> ("CURR", "(@2)"), None for actions
+        header, _, args = command.strip().partition(" ")
+        header = header.upper()
+        if (not args or header.startswith(UNSHADOWED)
+                or header.lstrip(":") in UNSHADOWED_STATES):
+            return None
+        chan = re.search(r"\(@[^)]*\)", args)
+        return (header, chan.group(0) if chan else None)
+
+    def write(self, command):
+        self._retry(lambda: self.dev.write(command))
+        key = self.settingKey(command)
+        if key is not None:
+            # Move the setting to the end, so a reconnect replays the
+            # settings in the order they were last written (e.g. the mode
+            # before its setpoint)
+            self.shadow.pop(key, None)
+            self.shadow[key] = command
+
+    def read(self, query):
+        return self._retry(lambda: self.dev.query(query))
+
+    def readBinary(self, query, dtype):
+        def operation():
+            self.dev.write(query)
+            return parse_block(self.dev.read_raw(), dtype)
+        return self._retry(operation)
+
+    def _retry(self, operation):
+        for attempt in range(self.retries + 1):
+            try:
+                if not self.initialized:
+                    self.reconnect()
+                return operation()
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff_sec * 2 ** attempt
+                print(f"{self.addr}: {e}, retrying in {wait:.1f} s")
+                self.initialized = False
+                sleep(wait)
+
+    def reconnect(self):
+        # Reopen the session at the cached address (no enumeration) and
+        # re-apply the shadowed settings
+        try:
+            self.dev.close()
+        except Exception:
+            pass
+        rm = pyvisa.ResourceManager()
+        self.dev = rm.open_resource(self.addr)
+        self.dev.timeout = self.timeout_sec * 1000  # timeout in ms
+        self.dev.clear()    # drop any late reply to the failed query
+        self.initialized = True
+        for command in self.shadow.values():
+            self.dev.write(command)
+        self.reconnects += 1
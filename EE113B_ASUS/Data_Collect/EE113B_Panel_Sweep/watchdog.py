@@ -0,0 +1,188 @@
+# Safe-state watchdog.
+#
+# timeToExit only runs on Ctrl-C or at the end of a script: a script stuck
+# in a VISA timeout, or dying on any other exception, leaves the PSU on.
+# safe_state_watchdog runs a background thread with its own VISA sessions to
+# the PSU and eload (opened up front, so tripping needs no enumeration and
+# does not wait on the session the script is stuck in) and drives both to
+# the safe state
+#
+#   eload inputs off, PSU 0 V / 0.1 A, PSU output off
+#
+# when
+#   - the sweep loop has not called beat() for `timeout` seconds,
+#   - an operation wrapped in deadline() runs past its deadline, or
+#   - an exception escapes the script (or any of its threads).
+# It then interrupts the main thread, as Ctrl-C would.
+#
+# beat() only stores a timestamp, so it costs nothing in the measurement
+# loop. Waits for the operator go in suspended(). Example:
+#
+#   watchdog = safe_state_watchdog(psu_addr, eload_addr, timeout=30)
+#   watchdog.start()
+#   for point in points:
+#       watchdog.beat()
+#       with watchdog.deadline(60, "stability burst"):
+#           ...
+#   watchdog.stop()
+#   timeToExit(None, None)
+
+import sys
+import threading
+import _thread
+from time import monotonic
+from contextlib import contextmanager
+##################################################
+from usb_pyvisa_wrapper import usb_pyvisa
+from keysight_n5769a import keysight_n5769a_usb as usb_n5769a
+from keysight_el34243a import keysight_el34243a_usb as usb_el34243a
+##################################################
+
+STALL_TIMEOUT = 30      # seconds without a beat before tripping
+POLL_INTERVAL = 0.5     # how often the thread checks
+
+# Same as timeToExit in the scripts
+SAFE_VOLTS = 0
+SAFE_CURRENT = 0.1
+
+
+##################################################
+def drive_safe(psu, eload):
+    # Every step is tried even if an earlier one fails. Returns the errors.
+    steps = [eload.deactivateAll,
+             lambda: psu.setVoltage(SAFE_VOLTS),
+             lambda: psu.setCurrent(SAFE_CURRENT),
+             psu.deactivate]
+    errors = []
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+class safe_state_watchdog():
+    def __init__(self, psu_addr, eload_addr, timeout=STALL_TIMEOUT,
+                 interrupt=True):
+        # Dedicated sessions, separate from the ones the script uses
+        self.psu = usb_n5769a(usb_pyvisa(psu_addr))
+        self.eload = usb_el34243a(usb_pyvisa(eload_addr))
+        self.timeout = timeout
+        self.interrupt = interrupt
+
+        self.last_beat = monotonic()
+        self.current_deadline = None    # (time, name), see deadline()
+        self.paused = False
+        self.tripped = None             # reason, once tripped
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.prev_excepthook = None
+        self.prev_thread_excepthook = None
+
+    def start(self):
+        self.beat()
+        self.stopped.clear()
+        self.prev_excepthook = sys.excepthook
+        self.prev_thread_excepthook = threading.excepthook
+        sys.excepthook = self._excepthook
+        threading.excepthook = self._thread_excepthook
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Normal end of the script, the caller turns the instruments off
+        self.stopped.set()
+        if self.thread is not None and \
+                self.thread is not threading.current_thread():
+            self.thread.join()
+        if self.prev_excepthook is not None:
+            sys.excepthook = self.prev_excepthook
+            threading.excepthook = self.prev_thread_excepthook
+            self.prev_excepthook = None
+        self.psu.usb.close()
+        self.eload.usb.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and exc_type is not SystemExit:
+            self.trip(f"{exc_type.__name__}: {exc}", interrupt=False)
+        self.stop()
+        return False
+
+    ##############################################
+    # Called from the script:
+    def beat(self):
+        self.last_beat = monotonic()
+
+    @contextmanager
+    def deadline(self, seconds, name="operation"):
+        # The wrapped operation must finish within `seconds`, instead of
+        # the stall timeout
+        prev = self.current_deadline
+        self.current_deadline = (monotonic() + seconds, name)
+        try:
+            yield
+        finally:
+            self.current_deadline = prev
+            self.beat()
+
+    @contextmanager
+    def suspended(self):
+        # No stall checks, e.g. while waiting for the operator
+        prev = self.paused
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = prev
+            self.beat()
+
+    ##############################################
+    def trip(self, reason, interrupt=None):
+        with self.lock:
+            if self.tripped is not None:
+                return
+            self.tripped = reason
+        print(f"WATCHDOG: {reason}, turning the PSU and eload off")
+        for e in drive_safe(self.psu, self.eload):
+            print(f"WATCHDOG: safe state step failed: {e}")
+        if interrupt is None:
+            interrupt = self.interrupt
+        if interrupt:
+            _thread.interrupt_main()
+
+    def _check(self):
+        if self.paused:
+            return None
+        now = monotonic()
+        deadline = self.current_deadline
+        if deadline is not None:
+            if now > deadline[0]:
+                return f"{deadline[1]} missed its deadline"
+            return None
+        if now - self.last_beat > self.timeout:
+            return f"no heartbeat for {now - self.last_beat:.1f} s"
+        return None
+
+    def _run(self):
+        while not self.stopped.wait(POLL_INTERVAL):
+            reason = self._check()
+            if reason is not None:
+                self.trip(reason)
+                break
+
+    def _excepthook(self, exc_type, exc, tb):
+        self.trip(f"{exc_type.__name__}: {exc}", interrupt=False)
+        self.prev_excepthook(exc_type, exc, tb)
+
+    def _thread_excepthook(self, args):
+        if args.exc_type is not SystemExit:
+            self.trip(f"{args.exc_type.__name__} in thread "
+                      f"{args.thread.name}: {args.exc_value}")
+        self.prev_thread_excepthook(args)